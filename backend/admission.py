@@ -0,0 +1,220 @@
+"""Admission control for endpoints that fan out to Open-Meteo and OpenRouter.
+
+Three layers, cheapest first:
+
+- a token bucket per client (by IP), so one caller cannot take all capacity
+- an ``AdmissionGate`` per endpoint: a concurrency cap plus a bounded wait
+  queue with a timeout, so overload turns into fast rejections instead of
+  an ever-growing backlog
+- a token bucket per upstream, which LLM calls and weather fetches take a
+  token from before every attempt, retries included
+
+Endpoints answer a ``Rejected`` with a degraded response where one exists
+(the last weather alert, a price sentence without the LLM summary) and with
+429/503 plus Retry-After otherwise. Every rejection is counted in
+``shed_requests_total``.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from metrics import inc
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class Rejected(Exception):
+    """Raised when a request or upstream call is not admitted; ``retry_after`` is in seconds."""
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``. Thread-safe."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float = 0.0) -> Optional[float]:
+        """Takes a token, returning how long to wait before using it; None (nothing taken) if that exceeds ``max_wait``."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            # Tokens may go negative: later callers queue behind this reservation
+            self._tokens -= 1
+            return wait
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class ClientLimiter:
+    """A token bucket per client key, keeping the most recently seen ``max_clients``."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # client -> TokenBucket
+        self._lock = threading.Lock()
+
+    def check(self, client: str):
+        """Takes a token for ``client`` or raises Rejected("rate_limited")."""
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[client] = bucket
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+        if bucket.reserve() is None:
+            raise Rejected("rate_limited", bucket.retry_after())
+
+
+class AdmissionGate:
+    """Per-client rate limit, concurrency cap and bounded wait queue for one endpoint.
+
+    At most ``max_concurrency`` requests run; up to ``max_queue`` more wait,
+    each for at most ``queue_timeout_seconds``. Anything beyond that is
+    rejected at once, so the slowest admitted request waits a bounded time.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 32,
+        max_queue: int = 64,
+        queue_timeout_seconds: float = 2.0,
+        client_rate: float = 2.0,
+        client_burst: float = 10.0
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.clients = ClientLimiter(client_rate, client_burst)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "AdmissionGate":
+        """A gate configured by ADMISSION_<NAME>_{CONCURRENCY,QUEUE,QUEUE_TIMEOUT,CLIENT_RATE,CLIENT_BURST}."""
+        prefix = f"ADMISSION_{name.upper()}_"
+        settings = {
+            "max_concurrency": int(os.getenv(prefix + "CONCURRENCY", defaults.get("max_concurrency", 32))),
+            "max_queue": int(os.getenv(prefix + "QUEUE", defaults.get("max_queue", 64))),
+            "queue_timeout_seconds": _env_float(prefix + "QUEUE_TIMEOUT", defaults.get("queue_timeout_seconds", 2.0)),
+            "client_rate": _env_float(prefix + "CLIENT_RATE", defaults.get("client_rate", 2.0)),
+            "client_burst": _env_float(prefix + "CLIENT_BURST", defaults.get("client_burst", 10.0))
+        }
+        return cls(name, **settings)
+
+    def _reject(self, reason: str, retry_after: float) -> Rejected:
+        self.shed += 1
+        inc("shed_requests_total", endpoint=self.name, reason=reason)
+        return Rejected(reason, retry_after)
+
+    @asynccontextmanager
+    async def admit(self, client: str):
+        try:
+            self.clients.check(client)
+        except Rejected as e:
+            raise self._reject(e.reason, e.retry_after)
+
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise self._reject("queue_full", self.queue_timeout_seconds)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout_seconds)
+            except asyncio.TimeoutError:
+                raise self._reject("queue_timeout", self.queue_timeout_seconds)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.active += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed
+        }
+
+
+_upstreams: Dict[str, TokenBucket] = {}
+_upstreams_lock = threading.Lock()
+# Requests per second and burst per upstream, overridable with <NAME>_RATE_PER_SECOND and <NAME>_BURST
+UPSTREAM_DEFAULTS = {
+    "openrouter": (10.0, 20.0),
+    "open_meteo": (5.0, 10.0)
+}
+
+
+def upstream_bucket(name: str) -> TokenBucket:
+    """The process-wide token bucket for calls to an upstream."""
+    with _upstreams_lock:
+        bucket = _upstreams.get(name)
+        if bucket is None:
+            rate, burst = UPSTREAM_DEFAULTS.get(name, (10.0, 20.0))
+            prefix = name.upper()
+            bucket = TokenBucket(_env_float(f"{prefix}_RATE_PER_SECOND", rate), _env_float(f"{prefix}_BURST", burst))
+            _upstreams[name] = bucket
+        return bucket
+
+
+def _upstream_wait(name: str, max_wait: float) -> float:
+    wait = upstream_bucket(name).reserve(max_wait)
+    if wait is None:
+        inc("shed_requests_total", endpoint=f"upstream:{name}", reason="upstream_rate_limited")
+        raise Rejected("upstream_rate_limited", upstream_bucket(name).retry_after())
+    return wait
+
+
+async def acquire_upstream(name: str, max_wait: float = 2.0):
+    """Waits for an upstream token for up to ``max_wait`` seconds, or raises Rejected."""
+    wait = _upstream_wait(name, max_wait)
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+
+def acquire_upstream_blocking(name: str, max_wait: float = 5.0):
+    """``acquire_upstream`` for worker threads."""
+    wait = _upstream_wait(name, max_wait)
+    if wait > 0:
+        time.sleep(wait)
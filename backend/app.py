@@ -1,36 +1,329 @@
-from fastapi import FastAPI, HTTPException, Query, BackgroundTasks
-from openai import OpenAI
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 import os
 import logging
-import pandas as pd
 import json
 import asyncio
-from typing import Dict, List
+import contextvars
+import functools
+import hmac
+import math
+import threading
+import time
+from typing import AsyncIterator, Dict, List
 from datetime import datetime
 from dotenv import load_dotenv
-from price_predict import CropsPricePredictor 
-from weather import get_weather_forecast
+from components import ComponentRegistry
+from weather import get_weather_forecast, get_weather_service
+from regional_weather import get_regional_weather, resolve_region
 from task_manager import FarmTaskManager
-from fastapi import BackgroundTasks
+from llm_gateway import get_llm_gateway, clean_boxed, BoxedStreamCleaner
+from admission import AdmissionGate, Rejected
+from coalesce import Coalescer
+from completion_cache import round_floats
+from jobs import JobQueue, JobStore, QueueFullError
+from shared_state import shared_backend
+from sessions import SessionStore, compact_turn
+import metrics
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from typing import Optional
+from contextlib import AsyncExitStack, asynccontextmanager
+
+# Heavy components (catboost, pandas, API clients, datasets) are only built on
+# first use or by the background warmup, never at import time.
+components = ComponentRegistry()
+
+
+def load_predictor():
+    from price_predict import CropsPricePredictor
+    return CropsPricePredictor()
+
+
+def load_market_data():
+    from market_data import get_market_data
+    # Buyers and prices are loaded once here so /confirm-sell never parses the CSVs
+    return get_market_data()
+
+
+def load_price_stats():
+    from price_stats import get_price_stats
+    return get_price_stats(components.get("market_data").crop_prices_file_path)
+
+
+def load_forecast_grid():
+    from forecast_grid import ForecastGrid
+    market_data = components.get("market_data")
+    grid = ForecastGrid(components.get("predictor"), crops=market_data.crop_names, regions=market_data.region_names)
+    # Fill the grid from the current regional snapshot without blocking the caller
+    threading.Thread(target=lambda: grid.refresh(get_regional_weather().get_all()), daemon=True).start()
+    return grid
+
+
+def load_weather():
+    service = get_weather_service()
+    # Rebuild the forecast grid whenever a new regional weather snapshot lands
+    service.add_listener(on_weather_snapshot)
+    return service
+
+
+def load_llm():
+    gateway = get_llm_gateway()
+    gateway.client  # builds the pooled HTTP client and imports openai
+    return gateway
+
+
+components.register("weather", load_weather)
+components.register("regional_weather", get_regional_weather)
+components.register("predictor", load_predictor)
+components.register("market_data", load_market_data)
+components.register("forecast_grid", load_forecast_grid)
+components.register("price_stats", load_price_stats)
+components.register("llm", load_llm)
+
+WARMUP_COMPONENTS = ["weather", "regional_weather", "predictor", "market_data", "forecast_grid", "llm"]
+
+
+def reload_model(version: Optional[str] = None, promote: bool = False) -> str:
+    """Swaps the predictor to a model version and rebuilds the forecast grid with it.
+
+    With ``promote`` the version is loaded and validated before it becomes the
+    store's current one, and any later failure puts back both the previous
+    current version and the model this worker was serving.
+    """
+    predictor = components.get("predictor")
+    loaded = predictor.prepare_model(version, validate=promote)
+    previous_state = predictor.state()
+    previous_version = predictor.store.current_version()
+    forecast_grid = components.peek("forecast_grid")
+    if promote:
+        predictor.store.promote(version)
+    try:
+        served = predictor.install(loaded)
+        if forecast_grid:
+            forecast_grid.invalidate()
+            forecast_grid.refresh(get_regional_weather().get_all())
+    except Exception:
+        if promote:
+            predictor.store.restore(previous_version)
+            predictor.install(previous_state)
+            if forecast_grid:
+                forecast_grid.invalidate()
+        raise
+    return served
+
+
+def require_admin(token: Optional[str]):
+    """Rejects the request unless it carries the ADMIN_TOKEN; admin endpoints are off while it is unset."""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them.")
+    if not token or not hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
+
+
+async def watch_model(interval_seconds: float):
+    """Hot-swaps to whatever version the model store marks as current, checking every interval."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval_seconds)
+        predictor = components.peek("predictor")
+        if predictor is None or (predictor.store.current_version() or "bundled") == predictor.version:
+            continue
+        try:
+            await loop.run_in_executor(None, reload_model)
+        except Exception as e:
+            logger.error(f"Model hot swap failed: {str(e)}", exc_info=True)
+
+
+async def warm_up():
+    """Loads every component and the weather snapshots in the background after startup."""
+    await components.warmup(WARMUP_COMPONENTS)
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        loop.run_in_executor(None, get_weather_service().warm),
+        loop.run_in_executor(None, get_regional_weather().warm),
+        return_exceptions=True
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = None
+    if os.getenv("WARMUP_ON_STARTUP", "1") != "0":
+        warmup_task = asyncio.create_task(warm_up())
+    watch_task = None
+    if float(os.getenv("MODEL_WATCH_SECONDS", "0")) > 0:
+        watch_task = asyncio.create_task(watch_model(float(os.getenv("MODEL_WATCH_SECONDS"))))
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    if warmup_task:
+        warmup_task.cancel()
+    if watch_task:
+        watch_task.cancel()
+    weather = components.peek("weather")
+    if weather:
+        weather.close()
+    await get_llm_gateway().close()
 
 # Setup
 load_dotenv()
-app = FastAPI(title="Farm Assistant API")
-predictor = CropsPricePredictor()
+app = FastAPI(title="Farm Assistant API", lifespan=lifespan)
 task_manager = FarmTaskManager()
+job_queue = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    max_queue=int(os.getenv("JOB_QUEUE_SIZE", "1000")),
+    store=JobStore(backend=shared_backend(os.getenv("JOB_DB_PATH")))
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client for endpoints that use it directly
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv('OPENROUTER_API_KEY'),
-    default_headers={
-        "HTTP-Referer": "https://farm-assist.example.com",
-        "X-Title": "Farm Assistant API"
-    }
+
+def on_weather_snapshot(key, forecast):
+    forecast_grid = components.peek("forecast_grid")
+    regional_weather = get_regional_weather()
+    if forecast_grid and key == regional_weather.key:
+        forecast_grid.refresh(regional_weather.by_region(forecast))
+
+# Shared async client for endpoints that call the LLM directly
+llm = get_llm_gateway()
+
+# Identical concurrent price requests share one live prediction; results are reused for a few seconds
+price_flights = Coalescer("price", ttl_seconds=float(os.getenv("COALESCE_TTL_SECONDS", "5")))
+
+# Admission control for the endpoints that call Open-Meteo and OpenRouter (see admission.py)
+live_model_gate = AdmissionGate.from_env("live_model_test", max_concurrency=16, max_queue=32, queue_timeout_seconds=2.0)
+weather_alert_gate = AdmissionGate.from_env("weather_alert", max_concurrency=16, max_queue=32, queue_timeout_seconds=1.0)
+confirm_sell_gate = AdmissionGate.from_env(
+    "confirm_sell", max_concurrency=64, max_queue=64, queue_timeout_seconds=1.0, client_rate=1.0, client_burst=5.0
+)
+# The last weather alert that was generated, served when alerts are being shed
+last_weather_alert: Dict = {}
+
+# Chat sessions: each turn's prediction, weather and top buyers, reused by later turns (see sessions.py)
+sessions = SessionStore(
+    ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "1800")),
+    max_sessions=int(os.getenv("SESSION_MAX", "10000")),
+    max_bytes=int(os.getenv("SESSION_MAX_BYTES", str(32 * 1024 * 1024))),
+    backend=shared_backend(os.getenv("SESSION_DB_PATH"))
+)
+# Buyers kept per session turn; /confirm-sell uses the best one
+SESSION_BUYERS = 3
+
+
+def client_key(request: Request) -> str:
+    """The caller's address, taking the first hop of X-Forwarded-For behind a proxy."""
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def admit_stream(gate: AdmissionGate, request: Request) -> AsyncExitStack:
+    """Admits a streamed request; the returned stack holds its slot until the stream closes it."""
+    admission = AsyncExitStack()
+    await admission.enter_async_context(gate.admit(client_key(request)))
+    return admission
+
+
+async def release_after(events: AsyncIterator[str], admission: AsyncExitStack) -> AsyncIterator[str]:
+    """Passes ``events`` through and frees the admission slot when the stream ends or the client leaves."""
+    try:
+        async for event in events:
+            yield event
+    finally:
+        await admission.aclose()
+
+
+async def gated_stream(gate: AdmissionGate, request: Request, start) -> StreamingResponse:
+    """An NDJSON response from ``await start()``, holding a slot of ``gate`` for as long as it streams.
+
+    Raises Rejected if the request is not admitted.
+    """
+    admission = await admit_stream(gate, request)
+    try:
+        events = await start()
+    except BaseException:
+        await admission.aclose()
+        raise
+    return StreamingResponse(release_after(events, admission), media_type="application/x-ndjson")
+
+
+def degraded_stream(reply: Dict, first_event: Dict) -> StreamingResponse:
+    """A degraded reply as a stream: ``first_event``, then "done" carrying the rest of the reply."""
+    async def events():
+        yield ndjson_event(first_event)
+        yield ndjson_event(dict({key: value for key, value in reply.items() if key not in first_event}, type="done"))
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+def shed_error(e: Rejected, detail: str) -> HTTPException:
+    """429 for a client over its rate, 503 for overload; both say when to retry."""
+    return HTTPException(
+        status_code=429 if e.reason == "rate_limited" else 503,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+    )
+
+
+async def predict_price(date: str, crop: str, region: str) -> Dict:
+    """Serves a grid hit inline; a miss runs one live prediction per distinct (date, crop, region) off the event loop."""
+    forecast_grid = await components.aget("forecast_grid")
+    result = forecast_grid.lookup(date, crop, region)
+    if result is not None:
+        return result
+
+    # Copy the request context so spans recorded in the worker thread land in this request's trace
+    context = contextvars.copy_context()
+    predict = functools.partial(context.run, forecast_grid.predictor.predict_single_price, date, crop, region)
+    key = (date, crop.lower(), (resolve_region(region) or region).lower())
+    return await price_flights.run(key, lambda: asyncio.get_running_loop().run_in_executor(None, predict))
+
+
+# Send a Server-Timing breakdown on every response, not only when asked with X-Timing: 1
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "0") == "1"
+
+metrics.registry.add_gauge(
+    "job_queue",
+    lambda: {(("field", name),): value for name, value in job_queue.metrics().items()},
+    "Background job queue depth, workers and throughput counters."
+)
+metrics.registry.add_gauge(
+    "completion_cache_entries", lambda: llm.cache.stats()["size"], "LLM completions held in the cache."
+)
+metrics.registry.add_gauge(
+    "coalescer",
+    lambda: {
+        (("flight", flights.name), ("field", name)): value
+        for flights in (price_flights, llm.flights) for name, value in flights.stats().items()
+    },
+    "In-flight, cached, hit, miss and coalesced counts of the request coalescers."
+)
+metrics.registry.add_gauge(
+    "admission",
+    lambda: {
+        (("endpoint", gate.name), ("field", name)): value
+        for gate in (live_model_gate, weather_alert_gate, confirm_sell_gate) for name, value in gate.stats().items()
+    },
+    "Active, waiting, admitted and shed requests per admission-controlled endpoint."
+)
+metrics.registry.add_gauge(
+    "sessions",
+    lambda: {(("field", name),): value for name, value in sessions.stats().items() if name != "shared"},
+    "Chat sessions held in memory, their stored bytes and sessions evicted to stay within bounds."
+)
+metrics.registry.add_gauge(
+    "process_memory_bytes",
+    lambda: {(("kind", kind),): value for kind, value in metrics.process_memory().items()},
+    "Resident memory of this worker: total, anonymous, file-backed (mapped datasets) and peak."
+)
+metrics.registry.add_gauge(
+    "forecast_grid_cells",
+    lambda: components.peek("forecast_grid").stats()["cells"] if components.is_loaded("forecast_grid") else 0,
+    "Precomputed crop x region x day prices."
 )
 
 
@@ -41,8 +334,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+
+@app.middleware("http")
+async def record_request_timing(request: Request, call_next):
+    started = time.perf_counter()
+    wants_timing = TIMING_HEADERS or request.headers.get("x-timing") == "1"
+    trace = metrics.start_trace() if wants_timing else None
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    # Label by route template so /selling-initiatives/{job_id} stays one series
+    route = request.scope.get("route")
+    metrics.observe(
+        "http_request_duration_seconds",
+        elapsed,
+        method=request.method,
+        path=route.path if route is not None else "unmatched",
+        status=response.status_code
+    )
+    if trace is not None:
+        response.headers["Server-Timing"] = metrics.server_timing(trace, elapsed * 1000)
+    return response
+
+
 @app.get("/")
 async def root():
     """API root endpoint"""
@@ -52,143 +369,351 @@ async def root():
         "service": "Farm Assistant API"
     }
 
+def build_summary_messages(crop: str, region: str) -> List[Dict[str, str]]:
+    return [
+        {
+            "role": "system",
+            "content": f"""Gamit ang datos ng presyo at lagay ng panahon, magbigay ng *maikling buod* para sa mga magsasaka tungkol sa inaasahang bentahan ng {crop} sa {region} ngayong araw.
+
+            IMPORTANT RULES:
+            - TAGALOG LANG.
+            - HUWAG BANGGITIN ANG MGA NUMERO o DETALYENG TEKNIKAL.
+            - HUWAG IULIT ANG WEATHER DATA.
+            - TUON SA PRESYO at BENTA ng ANI, hindi sa weather.
+            - WEATHER ay banggitin lang kung ito ay may malinaw na epekto sa ani o presyo.
+            - ISANG pangungusap lang (dalawa kung talagang kailangan).
+            - SIMPLE, MALIWANAG, at DIREKTA ang tono.
+            """
+        },
+        {
+            "role": "user",
+            "content": ""
+        }
+    ]
+
+
+def summary_cache_inputs(date: str, price_prediction: Dict) -> Dict:
+    # The summary only changes with the day, the weather analysis and the prediction
+    return {
+        "date": date,
+        "weather_analysis": price_prediction["weather_analysis"],
+        "adjusted_price": price_prediction["prediction"]["adjusted_price"]
+    }
+
+
+def build_price_sentence(date: str, crop: str, region: str, price_prediction: Dict) -> str:
+    price = price_prediction["prediction"]["base_price"]
+    analysis = price_prediction["weather_analysis"]
+    return f"Sa {region} ngayong {date}, ang inaasahang presyo ng {crop} ay ₱{price:.2f}. {analysis}."
+
+
+def build_sell_follow_up(crop: str, region: str, session_id: Optional[str] = None) -> Dict:
+    return {
+        "follow_up": f"Gusto mo ba ibenta {crop} sa {region}? Mag type ng 'OO' upang ituloy.",
+        "session_id": session_id,
+        "next_action": {
+            "endpoint": "/confirm-sell",
+            "method": "POST",
+            "params_needed": ["response"],
+            "params": {"session_id": session_id, "crop": [crop], "region": region}
+        }
+    }
+
+
+def open_session(session_id: Optional[str]):
+    """The caller's session and its id; a new, empty one if the id is missing, unknown or expired."""
+    session = sessions.get(session_id)
+    if session is None:
+        return None, sessions.new_id()
+    return session, session_id
+
+
+async def remember_turn(session_id: str, date: str, crop: str, region: str, price_prediction: Dict, message: str):
+    """Stores the turn, with the top buyers for the crop and region, so follow-ups need not compute it again."""
+    def record():
+        from buyer_ranking import get_buyer_ranker
+        ranker = get_buyer_ranker(components.get("market_data"))
+        buyers = [list(row) for row in ranker.rank_rows([crop], region=region, top_k=SESSION_BUYERS)]
+        sessions.record_turn(session_id, compact_turn(date, crop, region, price_prediction, message, buyers, ranker.version))
+
+    try:
+        with metrics.span("session"):
+            await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, record)
+    except Exception as e:
+        # The reply does not depend on the session; a later turn just computes again
+        logger.error(f"Failed to record session turn: {str(e)}", exc_info=True)
+
+
+async def session_candidates(session: Optional[Dict], crops: List[str], region: str) -> Dict[str, List[Dict]]:
+    """Buyers the session already ranked, per crop, for crops asked about in this region against the current buyer data."""
+    if not session:
+        return {}
+    from buyer_ranking import get_buyer_ranker
+    market_data = await components.aget("market_data")
+    ranker = await asyncio.get_running_loop().run_in_executor(None, get_buyer_ranker, market_data)
+    candidates = {}
+    for crop in crops:
+        turn = sessions.find_turn(session, crop, region)
+        if turn and turn["buyers"] and turn["market"] == ranker.version:
+            candidates[crop] = [ranker.buyer(*row) for row in turn["buyers"]]
+            metrics.inc("session_reuse_total", kind="buyers")
+    return candidates
+
+
+def degraded_price_reply(crop: str, region: str, e: Rejected, session_id: Optional[str] = None) -> Dict:
+    """The price sentence alone, from the forecast grid, for a /live-model-test that was not admitted."""
+    date = datetime.now().strftime("%B %d, %Y")
+    forecast_grid = components.peek("forecast_grid")
+    price_prediction = forecast_grid.lookup(date, crop, region) if forecast_grid else None
+    if price_prediction is None:
+        raise shed_error(e, "Maraming request ngayon. Subukan ulit mamaya.")
+    metrics.inc("degraded_responses_total", endpoint="live_model_test")
+    return {
+        "status": "success",
+        "sender": "bot",
+        "message": build_price_sentence(date, crop, region, price_prediction),
+        "degraded": True,
+        **build_sell_follow_up(crop, region, session_id)
+    }
+
+
 @app.post("/live-model-test")
 async def test_model_with_live_weather(
+    request: Request,
     crop: str = Query(...), 
     region: str = Query(...),
+    session_id: Optional[str] = Query(None),
 ):
-    """Test the price prediction model with live weather data"""
+    """Test the price prediction model with live weather data; pass the returned session_id on follow-ups"""
+    try:
+        async with live_model_gate.admit(client_key(request)):
+            return await live_model_reply(crop, region, session_id)
+    except Rejected as e:
+        return degraded_price_reply(crop, region, e, session_id)
+
+
+async def live_model_reply(crop: str, region: str, session_id: Optional[str] = None) -> Dict:
     try:
-        date_obj = pd.Timestamp.now()
+        date_obj = datetime.now()
         date = date_obj.strftime("%B %d, %Y")   
-        price_prediction = predictor.predict_single_price(date, crop, region)
+        session, session_id = open_session(session_id)
+        turn = sessions.reusable_turn(session, date, crop, region)
+        if turn is not None:
+            return {
+                "status": "success",
+                "sender": "bot",
+                "message": turn["message"],
+                **build_sell_follow_up(crop, region, session_id)
+            }
+
+        with metrics.span("price"):
+            price_prediction = await predict_price(date, crop, region)
 
         if price_prediction["status"] != "success":
             raise HTTPException(status_code=400, detail=price_prediction.get("message", "Prediction failed"))
 
-        weather_json = json.dumps(price_prediction["weather_data"], indent=2)
-        weather_analysis = price_prediction["weather_analysis"]
-
-        completion = client.chat.completions.create(
-            model="deepseek/deepseek-r1-zero:free",
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"""Gamit ang datos ng presyo at lagay ng panahon, magbigay ng *maikling buod* para sa mga magsasaka tungkol sa inaasahang bentahan ng {crop} sa {region} ngayong araw.
-
-                    IMPORTANT RULES:
-                    - TAGALOG LANG.
-                    - HUWAG BANGGITIN ANG MGA NUMERO o DETALYENG TEKNIKAL.
-                    - HUWAG IULIT ANG WEATHER DATA.
-                    - TUON SA PRESYO at BENTA ng ANI, hindi sa weather.
-                    - WEATHER ay banggitin lang kung ito ay may malinaw na epekto sa ani o presyo.
-                    - ISANG pangungusap lang (dalawa kung talagang kailangan).
-                    - SIMPLE, MALIWANAG, at DIREKTA ang tono.
-                    """
-                },
-                {
-                    "role": "user",
-                    "content": ""
-                }
-            ],
-            temperature=0.7,
-            stream=False
-        )
-        
-
-        # Extract response content safely
-        choices = getattr(completion, "choices", [])
-        tagalog_summary = None
-        if choices:
-            choice = choices[0]
-            if hasattr(choice, "message"):
-                tagalog_summary = getattr(choice.message, "content", None)
-
-        if tagalog_summary:
-            tagalog_summary = tagalog_summary.strip()
-            if tagalog_summary.startswith("\\boxed{") and tagalog_summary.endswith("}"):
-                tagalog_summary = tagalog_summary[8:-1]
-            tagalog_summary = tagalog_summary.replace("\\boxed", "").replace("{", "").replace("}", "")
+        try:
+            tagalog_summary = await llm.complete_text(
+                messages=build_summary_messages(crop, region),
+                temperature=0.7,
+                cache_inputs=summary_cache_inputs(date, price_prediction)
+            )
+        except Rejected:
+            # Out of OpenRouter budget: answer with the price sentence alone
+            metrics.inc("degraded_responses_total", endpoint="live_model_test")
+            tagalog_summary = None
 
         # Clean and build a one-paragraph summary
-        price = price_prediction["prediction"]["base_price"]
-        adjusted = price_prediction["prediction"]["adjusted_price"]
-        analysis = weather_analysis
-        summary = tagalog_summary.strip() if tagalog_summary else "Walang alert ngayon."
-
-        combined_summary = (
-            f"Sa {region} ngayong {date}, ang inaasahang presyo ng {crop} ay ₱{price:.2f}."
-            f" {analysis}. {summary}"
-        )
-      
+        summary = clean_boxed(tagalog_summary) if tagalog_summary else ""
+        summary = summary or "Walang alert ngayon."
+        combined_summary = f"{build_price_sentence(date, crop, region, price_prediction)} {summary}"
+        # A reply without the summary is not reused, but its prediction and buyers still are
+        await remember_turn(session_id, date, crop, region, price_prediction, combined_summary if tagalog_summary else None)
+
         return {
             "status": "success",
             "sender": "bot",
             "message": combined_summary,
-            "follow_up": f"Gusto mo ba ibenta {crop} sa {region}? Mag type ng 'OO' upang ituloy.",
-            "next_action": {
-                "endpoint": "/confirm-sell",
-                "method": "POST",
-                "params_needed": ["user_crops", "buyers_file", "prices_file"]
-            }
+            **build_sell_follow_up(crop, region, session_id)
         }
 
-
+    except HTTPException:
+        # A bad request (e.g. a date or crop the model rejects) stays a 4xx
+        raise
     except Exception as e:
         logger.error(f"Live model test failed: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Live model test failed.")
 
+
+def ndjson_event(event: Dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+
+@app.post("/live-model-test/stream")
+async def stream_model_with_live_weather(
+    request: Request,
+    crop: str = Query(...),
+    region: str = Query(...),
+    session_id: Optional[str] = Query(None),
+):
+    """Stream the price sentence immediately, then the Tagalog summary as NDJSON events"""
+    try:
+        return await gated_stream(live_model_gate, request, lambda: live_model_events(crop, region, session_id))
+    except Rejected as e:
+        reply = degraded_price_reply(crop, region, e, session_id)
+        return degraded_stream(reply, {"type": "price", "sender": "bot", "message": reply["message"]})
+
+
+async def live_model_events(crop: str, region: str, session_id: Optional[str]) -> AsyncIterator[str]:
+    date = datetime.now().strftime("%B %d, %Y")
+    session, session_id = open_session(session_id)
+    turn = sessions.reusable_turn(session, date, crop, region)
+    if turn is not None:
+        async def replay():
+            yield ndjson_event({"type": "price", "sender": "bot", "message": turn["message"]})
+            yield ndjson_event({"type": "done", "status": "success", **build_sell_follow_up(crop, region, session_id)})
+
+        return replay()
+
+    with metrics.span("price"):
+        price_prediction = await predict_price(date, crop, region)
+    if price_prediction["status"] != "success":
+        raise HTTPException(status_code=400, detail=price_prediction.get("message", "Prediction failed"))
+
+    async def events():
+        price_sentence = build_price_sentence(date, crop, region, price_prediction)
+        yield ndjson_event({
+            "type": "price",
+            "sender": "bot",
+            "message": price_sentence
+        })
+
+        cleaner = BoxedStreamCleaner()
+        emitted = False
+        summary = []
+        try:
+            async for chunk in llm.stream_text(
+                messages=build_summary_messages(crop, region),
+                temperature=0.7,
+                cache_inputs=summary_cache_inputs(date, price_prediction)
+            ):
+                text = cleaner.feed(chunk)
+                if text:
+                    # Separate the summary from the price sentence on the first token
+                    yield ndjson_event({"type": "token", "content": text if emitted else " " + text})
+                    summary.append(text)
+                    emitted = True
+            text = cleaner.flush()
+            if text:
+                yield ndjson_event({"type": "token", "content": text if emitted else " " + text})
+                summary.append(text)
+                emitted = True
+        except Exception as e:
+            logger.error(f"Live model stream failed: {str(e)}", exc_info=True)
+
+        if not emitted:
+            yield ndjson_event({"type": "token", "content": " Walang alert ngayon."})
+        message = f"{price_sentence} {''.join(summary)}" if emitted else None
+        await remember_turn(session_id, date, crop, region, price_prediction, message)
+        yield ndjson_event({"type": "done", "status": "success", **build_sell_follow_up(crop, region, session_id)})
+
+    return events()
+
+class PredictionItem(BaseModel):
+    date: str
+    crop: str
+    region: str
+
+
+class BatchPredictionRequest(BaseModel):
+    items: List[PredictionItem] = []
+    date: Optional[str] = None
+    crops: List[str] = []
+    regions: List[str] = []
+
+
+@app.post("/predict/batch")
+async def predict_batch(request: BatchPredictionRequest):
+    """Predict prices for a list of (date, crop, region) rows or a full crop x region grid"""
+    date = request.date or datetime.now().strftime("%B %d, %Y")
+    predictor = await components.aget("predictor")
+    prediction = await asyncio.get_running_loop().run_in_executor(
+        None,
+        functools.partial(
+            predictor.predict_batch,
+            items=[(item.date, item.crop, item.region) for item in request.items],
+            date=date,
+            crops=request.crops,
+            regions=request.regions
+        )
+    )
+
+    if prediction["status"] != "success":
+        raise HTTPException(status_code=400, detail=prediction.get("message", "Prediction failed"))
+
+    return prediction
+
+def build_weather_alert_messages(weather_data: Dict) -> List[Dict[str, str]]:
+    # Rounded so the prompt (and its cache key) only changes when the weather meaningfully does
+    weather_context = json.dumps(round_floats(weather_data), indent=2)
+    return [
+        {
+            "role": "system",
+            "content": f"""Magbigay ng weather alert para sa mga magsasaka base sa weather na ito: {weather_context}
+
+           IMPORTANT RULES:
+                - TAGALOG LANG.
+                - HUWAG BANGGITIN ANG MGA NUMERO o DETALYENG TEKNIKAL.
+                - HUWAG IULIT ANG WEATHER DATA.
+                - Isang pangungusap lang (maximum 2 kung talagang kailangan).
+                - Tumuon sa epekto sa pagsasaka.
+                - Simple, malinaw, direkta.
+                - Wag magsabi ng specific na mga numero.
+                """
+        },
+        {
+            "role": "user",
+            "content": ""
+        }
+    ]
+
+
 @app.get("/weather-alert")
-async def get_weather_alert():
+async def get_weather_alert(request: Request):
     """Generate weather alerts in Tagalog for farmers"""
     try:
-        weather_data = get_weather_forecast()
-        weather_context = json.dumps(weather_data, indent=2)
+        async with weather_alert_gate.admit(client_key(request)):
+            return await weather_alert_reply()
+    except Rejected as e:
+        if not last_weather_alert:
+            raise shed_error(e, "Maraming request ngayon. Subukan ulit mamaya.")
+        metrics.inc("degraded_responses_total", endpoint="weather_alert")
+        return dict(last_weather_alert, degraded=True)
+
+
+async def weather_alert_reply() -> Dict:
+    try:
+        with metrics.span("weather"):
+            weather_data = await asyncio.get_running_loop().run_in_executor(None, get_weather_forecast)
         logger.info("Weather data retrieved successfully")
 
-        completion = client.chat.completions.create(
-            model="deepseek/deepseek-r1-zero:free",
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"""Magbigay ng weather alert para sa mga magsasaka base sa weather na ito: {weather_context}
-
-                   IMPORTANT RULES:
-                        - TAGALOG LANG.
-                        - HUWAG BANGGITIN ANG MGA NUMERO o DETALYENG TEKNIKAL.
-                        - HUWAG IULIT ANG WEATHER DATA.
-                        - Isang pangungusap lang (maximum 2 kung talagang kailangan).
-                        - Tumuon sa epekto sa pagsasaka.
-                        - Simple, malinaw, direkta.
-                        - Wag magsabi ng specific na mga numero.
-                        """
-                },
-                {
-                    "role": "user",
-                    "content": ""
-                }
-            ],
+        content = await llm.complete_text(
+            messages=build_weather_alert_messages(weather_data),
             temperature=0.7,
-            stream=False
+            use_reasoning=True
         )
 
-        choices = getattr(completion, "choices", [])
-        content = None
-        if choices:
-            choice = choices[0]
-            if isinstance(choice, dict):
-                message = choice.get("message", {})
-                content = message.get("content") or message.get("reasoning")
-            elif hasattr(choice, "message"):
-                message = getattr(choice, "message", None)
-                if message:
-                    content = getattr(message, "content", None) or getattr(message, "reasoning", None)
-
-        return {
+        reply = {
             "status": "success",
-            "explanation": content.strip() if content else "Walang available na weather alert"
+            "explanation": clean_boxed(content) if content else "Walang available na weather alert",
+            "risk": weather_data.get("risk")
         }
-        
+        if content:
+            last_weather_alert.update(reply)
+        return reply
+
+    except Rejected:
+        raise
     except Exception as e:
         logger.error(f"Error in weather alert: {str(e)}")
         return {
@@ -197,45 +722,331 @@ async def get_weather_alert():
         }
 
 
+@app.get("/weather-alert/stream")
+async def stream_weather_alert(request: Request):
+    """Stream the Tagalog weather alert as NDJSON events"""
+    try:
+        return await gated_stream(weather_alert_gate, request, weather_alert_events)
+    except Rejected as e:
+        if not last_weather_alert:
+            raise shed_error(e, "Maraming request ngayon. Subukan ulit mamaya.")
+        metrics.inc("degraded_responses_total", endpoint="weather_alert")
+        reply = dict(last_weather_alert, degraded=True)
+        return degraded_stream(reply, {"type": "token", "content": reply["explanation"]})
+
+
+async def weather_alert_events() -> AsyncIterator[str]:
+    weather_data = await asyncio.get_running_loop().run_in_executor(None, get_weather_forecast)
+
+    async def events():
+        cleaner = BoxedStreamCleaner()
+        emitted = False
+        explanation = []
+        try:
+            async for chunk in llm.stream_text(
+                messages=build_weather_alert_messages(weather_data),
+                temperature=0.7,
+                use_reasoning=True
+            ):
+                text = cleaner.feed(chunk)
+                if text:
+                    yield ndjson_event({"type": "token", "content": text})
+                    explanation.append(text)
+                    emitted = True
+            text = cleaner.flush()
+            if text:
+                yield ndjson_event({"type": "token", "content": text})
+                explanation.append(text)
+                emitted = True
+        except Exception as e:
+            logger.error(f"Error in weather alert stream: {str(e)}")
+            yield ndjson_event({"type": "done", "status": "error", "explanation": "May error sa weather alert system"})
+            return
+
+        if not emitted:
+            yield ndjson_event({"type": "token", "content": "Walang available na weather alert"})
+        else:
+            # Served in place of a new alert while alerts are being shed
+            last_weather_alert.update(status="success", explanation="".join(explanation), risk=weather_data.get("risk"))
+        yield ndjson_event({"type": "done", "status": "success"})
+
+    return events()
+
+
+@app.get("/weather-risk")
+async def get_weather_risk():
+    """Weather risk scores and indicators for every region, highest risk first"""
+    regional_weather = await components.aget("regional_weather")
+    with metrics.span("weather"):
+        forecasts = await asyncio.get_running_loop().run_in_executor(None, regional_weather.get_all)
+    if not forecasts:
+        raise HTTPException(status_code=503, detail="Weather data not available.")
+    regions = [{"region": region, **forecast["risk"]} for region, forecast in forecasts.items()]
+    regions.sort(key=lambda entry: entry["score"], reverse=True)
+    return {
+        "status": "success",
+        "count": len(regions),
+        "regions": regions
+    }
+
+
+@app.get("/ready")
+async def readiness():
+    """Report which components are loaded; 503 until the warmup set is ready"""
+    status = components.status()
+    ready = all(status[name]["loaded"] for name in WARMUP_COMPONENTS)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "starting",
+            "components": status
+        }
+    )
+
+
+@app.get("/model")
+async def get_model_info():
+    """The price model version being served and the versions available in the model store"""
+    predictor = await components.aget("predictor")
+    version = None if predictor.version == "bundled" else predictor.version
+    return {
+        "status": "success",
+        "version": predictor.version,
+        "fast_path": predictor.fast is not None,
+        "metadata": predictor.store.metadata(version),
+        "versions": [entry["version"] for entry in predictor.store.versions()]
+    }
+
+
+@app.post("/model/reload")
+async def reload_price_model(version: Optional[str] = Query(None), x_admin_token: Optional[str] = Header(None)):
+    """Hot-swap the price model (admin only); a version is validated, then promoted so every worker converges on it"""
+    require_admin(x_admin_token)
+    predictor = await components.aget("predictor")
+    if version and version not in predictor.store.list_versions():
+        raise HTTPException(status_code=404, detail=f"Model version {version} does not exist")
+    try:
+        served = await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(reload_model, version, promote=bool(version))
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Model reload failed: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Model reload failed; the served model is unchanged.")
+    return {
+        "status": "success",
+        "version": served
+    }
+
+
+@app.get("/buyers/rank")
+async def rank_buyers(
+    crop: List[str] = Query(...),
+    region: Optional[str] = Query(None),
+    quantity_kg: Optional[float] = Query(None, gt=0),
+    top_k: int = Query(10, ge=1, le=1000),
+    buyer_type: Optional[str] = Query(None)
+):
+    """Best buyers for the given crops by price, budget fit, distance from the farmer's region and purchase intent"""
+    from buyer_ranking import get_buyer_ranker
+
+    market_data = await components.aget("market_data")
+    ranker = await asyncio.get_running_loop().run_in_executor(None, get_buyer_ranker, market_data)
+    buyers = ranker.rank(crop, region=region, quantity_kg=quantity_kg, top_k=top_k, buyer_type=buyer_type)
+    return {
+        "status": "success",
+        "count": len(buyers),
+        "buyers": buyers
+    }
+
+
+@app.get("/prices/stats")
+async def get_price_stats(
+    crop: str = Query(...),
+    region: Optional[str] = Query(None),
+    granularity: str = Query("month"),
+    period: Optional[str] = Query(None)
+):
+    """Historical price count, mean, median, p10/p90 and rolling mean per month, quarter, year or calendar month"""
+    price_stats = await components.aget("price_stats")
+    # Pick up rows appended to the price file since the last request
+    await asyncio.get_running_loop().run_in_executor(None, price_stats.refresh)
+    try:
+        series = price_stats.stats(crop, (resolve_region(region) or region) if region else None, granularity, period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if series is None:
+        raise HTTPException(status_code=404, detail=f"No price history for {crop}" + (f" in {region}" if region else ""))
+    return {
+        "status": "success",
+        "crop": crop,
+        "region": region,
+        "granularity": granularity,
+        "stats": series
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Latency histograms, cache hit counters, LLM token counts and upstream errors in Prometheus text format"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/selling-initiatives/list")
-async def list_selling_initiatives():
-    """List all generated selling initiatives"""
+async def list_selling_initiatives(limit: Optional[int] = Query(None, ge=0)):
+    """List the stored selling initiatives (the newest INITIATIVES_MAX are kept)"""
     try:
-        initiatives = task_manager.initiatives
+        records = task_manager.stored_initiatives(limit)
         
         return {
             "status": "success",
-            "count": len(initiatives),
-            "initiatives": initiatives
+            "count": len(records),
+            "initiatives": [record.text for record in records],
+            "records": [
+                {"crop": record.crop, "buyer": record.buyer, "created_at": record.created_at, "initiative": record.text}
+                for record in records
+            ]
         }
     except Exception as e:
         logger.error(f"Failed to list selling initiatives: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
     
 
+@app.get("/selling-initiatives/{job_id}")
+async def get_selling_initiative_job(job_id: str):
+    """Get the status and result of one selling initiative job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return {
+        "status": "success",
+        "job": job
+    }
+
+
+@app.post("/selling-initiatives/batch")
+async def stream_selling_initiative_batch(
+    crop: List[str] = Query(...),
+    region: Optional[str] = Query(None),
+    quantity_kg: Optional[float] = Query(None, gt=0),
+    top_k: int = Query(3, ge=1, le=10),
+    pack_size: int = Query(1, ge=1, le=10)
+):
+    """Stream one selling initiative per (crop, top-k buyer) pair as NDJSON events, in completion order"""
+    await components.aget("market_data")
+
+    async def events():
+        count = 0
+        try:
+            async for result in task_manager.stream_selling_initiatives(
+                crop, region=region, quantity_kg=quantity_kg, top_k=top_k, pack_size=pack_size
+            ):
+                count += 1
+                yield ndjson_event({"type": "initiative", **result})
+        except Exception as e:
+            logger.error(f"Selling initiative batch failed: {str(e)}", exc_info=True)
+            yield ndjson_event({"type": "done", "status": "error", "count": count})
+            return
+        yield ndjson_event({"type": "done", "status": "success", "count": count})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.get("/memory")
+async def memory_report():
+    """Resident memory of this worker and the bytes held by its buyers, price rows, sessions and initiatives"""
+    from buyer_ranking import loaded_rankers
+
+    market_data = components.peek("market_data")
+    data = market_data.memory_usage() if market_data else None
+    ranker = next((r for r in loaded_rankers() if market_data and r.buyers is market_data.buyers), None)
+    if data and ranker:
+        buyers = data["buyers"]
+        ranking = ranker.memory_usage()
+        buyers["ranker_bytes"] = ranking["bytes"]
+        if buyers["rows"]:
+            buyers["bytes_per_buyer"] = round((buyers["mapped_bytes"] + buyers["index_bytes"] + ranking["bytes"]) / buyers["rows"], 1)
+    return {
+        "status": "success",
+        "pid": os.getpid(),
+        "process": metrics.process_memory(),
+        "market_data": data,
+        "sessions": sessions.stats(),
+        "completion_cache": {"entries": llm.cache.stats()["size"]},
+        "initiatives": {"stored": len(task_manager.initiatives), "max": task_manager.initiatives.max_len}
+    }
+
+
+@app.get("/jobs/metrics")
+async def get_job_metrics():
+    """Queue depth and throughput counters for background jobs"""
+    return {
+        "status": "success",
+        "metrics": job_queue.metrics()
+    }
+
+
 @app.post("/confirm-sell")
 async def confirm_selling_decision(
-    background_tasks: BackgroundTasks,
+    request: Request,
     response: str = Query(...),
-    crop: str = Query(...),
-    region: str = Query(...)
+    crop: Optional[List[str]] = Query(None),
+    region: Optional[str] = Query(None),
+    session_id: Optional[str] = Query(None)
 ):
-    """Handles user confirmation to sell crops"""
+    """Handles user confirmation to sell crops; several crops are confirmed at once as one batch job
+
+    With the session_id from /live-model-test, crop and region default to the
+    last ones asked about and the buyers ranked in that turn are reused.
+    """
+    try:
+        async with confirm_sell_gate.admit(client_key(request)):
+            return await confirm_sell_reply(response, crop, region, session_id)
+    except Rejected as e:
+        raise shed_error(e, "Maraming request ngayon. Subukan ulit mamaya.")
+
+
+async def confirm_sell_reply(response: str, crop: Optional[List[str]], region: Optional[str], session_id: Optional[str] = None) -> Dict:
     if response.strip().upper() == "OO":
+        session = sessions.get(session_id)
+        if session and session.get("last") and (not crop or not region):
+            last = session["turns"][session["last"]]
+            crop = crop or [last["crop"]]
+            region = region or last["region"]
+        if not crop or not region:
+            raise HTTPException(status_code=400, detail="Kailangan ang crop at region, o ang session_id mula sa /live-model-test.")
         try:
-            background_tasks.add_task(
-                task_manager.generate_selling_initiatives,
-                user_crops=[crop],
-                buyers_file_path="fictional_buyers_dataset.csv",
-                crop_prices_file_path="philippines_crop_prices_mock_data.csv"
-            )
+            candidates = await session_candidates(session, crop, region)
+            if len(crop) > 1:
+                job = job_queue.submit(
+                    "selling_initiative_batch",
+                    task_manager.generate_selling_initiative_batch,
+                    user_crops=crop,
+                    region=region,
+                    top_k=1,
+                    **({"candidates": candidates} if candidates else {})
+                )
+            else:
+                job = job_queue.submit(
+                    "selling_initiative",
+                    task_manager.generate_selling_initiatives,
+                    user_crops=crop,
+                    region=region,
+                    buyers_file_path="fictional_buyers_dataset.csv",
+                    crop_prices_file_path="philippines_crop_prices_mock_data.csv",
+                    **({"ranked_buyers": candidates[crop[0]]} if crop[0] in candidates else {})
+                )
             return {
                 "status": "success",
-                "message": f"Okay! Sinimulan na ang paghahanap ng buyer para sa {crop} sa {region}.",
-                "next_check": "/selling-initiatives/list"
+                "message": f"Okay! Sinimulan na ang paghahanap ng buyer para sa {', '.join(crop)} sa {region}.",
+                "job_id": job["job_id"],
+                "next_check": f"/selling-initiatives/{job['job_id']}",
+                "session_id": session_id if session else None
             }
+        except QueueFullError as e:
+            logger.warning(f"Rejected selling initiative: {str(e)}")
+            raise HTTPException(status_code=503, detail="Maraming request ngayon. Subukan ulit mamaya.")
         except Exception as e:
             logger.error(f"Failed to start selling initiative: {str(e)}")
             raise HTTPException(status_code=500, detail="Selling process failed.")
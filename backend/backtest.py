@@ -0,0 +1,307 @@
+"""Backtests the price model by replaying the price history in time order.
+
+    python backtest.py                                   # the served model, monthly windows (in-sample)
+    python backtest.py --period quarter --workers 4 --output backtest.json
+    python backtest.py --retrain --iterations 200        # refit before every window (out-of-sample)
+
+Rows are grouped into consecutive windows (rolling origin). With --retrain
+each window is predicted by a model fit only on the windows before it, so
+nothing from the future leaks in. Without it the served model predicts every
+window, and it was trained on the same history. That replay is in-sample: it
+checks the serving path and throughput, not forecast accuracy, and the report
+marks it with ``"in_sample": true``. The baseline only ever uses earlier
+windows. Every window is predicted in one batch, in parallel across a process
+pool. The model gets the same inputs and weather adjustment as
+``predict_single_price``. Three predictions are scored against the recorded
+price:
+
+- ``base``: the model's price from the row's date, crop, region, rainfall
+  and temperature, with the API's defaults for the inputs it does not observe
+- ``adjusted``: base times the weather risk multiplier from the row's rainfall
+- ``baseline``: the mean price of the crop in the region over all earlier windows
+
+The report has MAE, RMSE, bias and MAPE overall and by crop, region and
+window, plus throughput. Workers map the columnar snapshot (see columnar.py)
+and share the time order through a memory-mapped file, so nothing large is
+copied to them.
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from columnar import open_table
+from features import training_frame
+from weather_risk import RiskTable
+
+logger = logging.getLogger(__name__)
+
+DATA_FILE = "philippines_crop_prices_mock_data.csv"
+PERIODS = ["month", "quarter"]
+PREDICTIONS = ["base", "adjusted", "baseline"]
+# Per (crop, region) sums kept for every prediction: rows, |error|, error^2, error, |error| / price
+STATS = ["rows", "abs_error", "squared_error", "error", "abs_pct_error"]
+
+
+def _window_codes(dates: np.ndarray, period: str) -> np.ndarray:
+    """Sortable window number per row (months or quarters since 1970); -1 for a missing date."""
+    months = dates.astype("datetime64[M]").astype(np.int64)
+    codes = months // 3 if period == "quarter" else months
+    return np.where(np.isnat(dates), -1, codes)
+
+
+def _window_label(code: int, period: str) -> str:
+    if period == "quarter":
+        return f"{1970 + code // 4}-Q{code % 4 + 1}"
+    return f"{1970 + code // 12}-{code % 12 + 1:02d}"
+
+
+def historical_multiplier(rainfall: np.ndarray) -> np.ndarray:
+    """The weather risk multiplier for rows that only record a day's rainfall.
+
+    The day's total is spread evenly over its hours and there is no wind or
+    rain probability on record, so only the rain indicators contribute. Each
+    distinct rainfall value is scored once.
+    """
+    values, inverse = np.unique(rainfall, return_inverse=True)
+    n_values = len(values)
+    table = RiskTable(
+        np.broadcast_to((values / 24.0)[:, None], (n_values, 24)),
+        np.empty((n_values, 0)),
+        values[:, None],
+        np.empty((n_values, 0))
+    )
+    return table.multiplier[inverse]
+
+
+# Worker state, set once per process by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(data_path: str, order_path: str, baseline: np.ndarray, options: Dict[str, Any]):
+    from price_predict import CropsPricePredictor
+
+    table = open_table(data_path)
+    predictor = CropsPricePredictor()
+    if options.get("model_version"):
+        predictor.load_model(options["model_version"])
+    _worker.update(
+        table=table,
+        order=np.load(order_path, mmap_mode="r"),
+        baseline=baseline,
+        predictor=predictor,
+        options=options,
+        n_regions=len(table.categories("Region"))
+    )
+
+
+def _fit(rows: np.ndarray):
+    """A model fit on ``rows`` of the table, for --retrain."""
+    from catboost import CatBoostRegressor, Pool
+    from features import CATEGORICAL_FEATURES
+    from training import DEFAULT_PARAMS
+
+    options = _worker["options"]
+    features, target = training_frame(_worker["table"].to_frame().iloc[rows])
+    model = CatBoostRegressor(**dict(
+        DEFAULT_PARAMS, iterations=options["iterations"], random_seed=42, verbose=0, thread_count=1,
+        allow_writing_files=False
+    ))
+    model.fit(Pool(features, target, cat_features=CATEGORICAL_FEATURES))
+    return model
+
+
+def _run_window(task) -> Dict[str, Any]:
+    window, start, end = task
+    started = time.perf_counter()
+    table, predictor, options = _worker["table"], _worker["predictor"], _worker["options"]
+    # Rows in file order, so reads from the mapped columns move forward through the file
+    rows = np.sort(_worker["order"][start:end])
+
+    region_codes = table.array("Region")[rows]
+    crop_codes = table.array("Crop")[rows]
+    price = table.array("Price per kg")[rows]
+    rainfall = table.array("Rainfall (mm)")[rows].astype(np.float64)
+    temperature = table.array("Temperature (°C)")[rows].astype(np.float64)
+
+    if options["retrain"]:
+        first = max(0, start - options["max_train_rows"]) if options["max_train_rows"] else 0
+        predictor.model, predictor.fast = _fit(np.sort(_worker["order"][first:start])), None
+
+    # The inputs predict_single_price gives the model, with the recorded weather in place of the forecast
+    features = predictor.build_feature_frame(
+        table.array("Date")[rows],
+        pd.Categorical.from_codes(crop_codes, categories=table.categories("Crop"), validate=False),
+        pd.Categorical.from_codes(region_codes, categories=table.categories("Region"), validate=False),
+        None,
+        rainfall=rainfall,
+        temperature=temperature
+    )
+    base = predictor.predict_frame(features)
+    pairs = crop_codes.astype(np.int64) * _worker["n_regions"] + region_codes
+    predictions = {
+        "base": base,
+        "adjusted": base * historical_multiplier(rainfall),
+        "baseline": _worker["baseline"][window][pairs]
+    }
+
+    n_pairs = _worker["baseline"].shape[1]
+    sums = np.zeros((len(PREDICTIONS), len(STATS), n_pairs))
+    for p, name in enumerate(PREDICTIONS):
+        error = predictions[name] - price
+        known = ~np.isnan(error)
+        error, at = error[known], pairs[known]
+        for s, values in enumerate([
+            np.ones(len(error)), np.abs(error), error ** 2, error,
+            np.abs(error) / np.where(price[known] > 0, price[known], np.nan)
+        ]):
+            sums[p, s] = np.bincount(at, weights=np.nan_to_num(values), minlength=n_pairs)
+    return {"window": window, "rows": len(rows), "seconds": time.perf_counter() - started, "sums": sums}
+
+
+def _metrics(sums: np.ndarray) -> Dict[str, Dict[str, Optional[float]]]:
+    """Error metrics per prediction from (predictions x stats) sums."""
+    result = {}
+    for p, name in enumerate(PREDICTIONS):
+        rows, abs_error, squared_error, error, abs_pct_error = sums[p]
+        if rows == 0:
+            result[name] = {"rows": 0, "mae": None, "rmse": None, "bias": None, "mape": None}
+            continue
+        result[name] = {
+            "rows": int(rows),
+            "mae": round(float(abs_error / rows), 4),
+            "rmse": round(float(np.sqrt(squared_error / rows)), 4),
+            "bias": round(float(error / rows), 4),
+            "mape": round(float(abs_pct_error / rows * 100), 2)
+        }
+    return result
+
+
+def backtest(
+    data_path: str = DATA_FILE,
+    period: str = "month",
+    workers: Optional[int] = None,
+    warmup_windows: int = 1,
+    retrain: bool = False,
+    iterations: int = 200,
+    max_train_rows: Optional[int] = None,
+    model_version: Optional[str] = None
+) -> Dict[str, Any]:
+    """Replays ``data_path`` window by window and returns the error report."""
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+    started = time.perf_counter()
+    table = open_table(data_path)
+    crops, regions = table.categories("Crop"), table.categories("Region")
+    region_codes = table.array("Region").astype(np.int64)
+    crop_codes = table.array("Crop").astype(np.int64)
+    price = table.array("Price per kg")
+
+    windows = _window_codes(table.array("Date"), period)
+    usable = (windows >= 0) & (region_codes >= 0) & (crop_codes >= 0) & ~np.isnan(price)
+    order = np.flatnonzero(usable)
+    order = order[np.argsort(windows[order], kind="stable")]
+    window_codes, offsets = np.unique(windows[order], return_index=True)
+    offsets = np.append(offsets, len(order))
+    if len(window_codes) <= warmup_windows:
+        raise ValueError(f"Need more than {warmup_windows} {period}s of history, found {len(window_codes)}")
+
+    # Baseline for window w: mean price per (crop, region) over windows before w
+    n_pairs = len(crops) * len(regions)
+    window_index = np.repeat(np.arange(len(window_codes)), np.diff(offsets))
+    cells = window_index * n_pairs + (crop_codes[order] * len(regions) + region_codes[order])
+    size = len(window_codes) * n_pairs
+    totals = np.bincount(cells, weights=price[order], minlength=size).reshape(-1, n_pairs).cumsum(axis=0)
+    counts = np.bincount(cells, minlength=size).reshape(-1, n_pairs).cumsum(axis=0)
+    baseline = np.full((len(window_codes), n_pairs), np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        baseline[1:] = np.where(counts[:-1] > 0, totals[:-1] / counts[:-1], np.nan)
+
+    workers = workers or os.cpu_count() or 1
+    options = {
+        "retrain": retrain,
+        "iterations": iterations,
+        "max_train_rows": max_train_rows,
+        "model_version": model_version
+    }
+    tasks = [(w, int(offsets[w]), int(offsets[w + 1])) for w in range(warmup_windows, len(window_codes))]
+    logger.info(f"Backtesting {len(order)} rows in {len(tasks)} {period} windows on {workers} workers")
+    if not retrain:
+        logger.warning("Scoring the served model on the history it was trained on; the errors are in-sample (use --retrain)")
+
+    with tempfile.TemporaryDirectory(prefix="backtest-") as scratch:
+        order_path = os.path.join(scratch, "order.npy")
+        np.save(order_path, order)
+        setup_seconds = time.perf_counter() - started
+        replay_started = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(data_path, order_path, baseline, options)
+        ) as pool:
+            results = list(pool.map(_run_window, tasks))
+        replay_seconds = time.perf_counter() - replay_started
+
+    totals = np.sum([result["sums"] for result in results], axis=0)
+    by_pair = totals.reshape(len(PREDICTIONS), len(STATS), len(crops), len(regions))
+    predicted_rows = sum(result["rows"] for result in results)
+    return {
+        "data": data_path,
+        "period": period,
+        "mode": "retrain" if retrain else "served",
+        "in_sample": not retrain,
+        "windows": len(results),
+        "rows": predicted_rows,
+        "overall": _metrics(totals.sum(axis=2)),
+        "by_crop": {crop: _metrics(by_pair[:, :, c].sum(axis=2)) for c, crop in enumerate(crops)},
+        "by_region": {region: _metrics(by_pair[:, :, :, r].sum(axis=2)) for r, region in enumerate(regions)},
+        "by_window": {
+            _window_label(int(window_codes[result["window"]]), period): _metrics(result["sums"].sum(axis=2))
+            for result in results
+        },
+        "throughput": {
+            "workers": workers,
+            "setup_seconds": round(setup_seconds, 3),
+            "replay_seconds": round(replay_seconds, 3),
+            "rows_per_second": round(predicted_rows / replay_seconds, 1) if replay_seconds else None,
+            "window_seconds_p50": round(float(np.median([result["seconds"] for result in results])), 4)
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the price model over the price history with rolling-origin windows.")
+    parser.add_argument("--data", default=DATA_FILE)
+    parser.add_argument("--period", choices=PERIODS, default="month")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--warmup-windows", type=int, default=1, help="leading windows used only as history")
+    parser.add_argument("--model-version", default=None, help="model store version (default: the served one)")
+    parser.add_argument(
+        "--retrain", action="store_true",
+        help="fit a model on the history before every window; without it the served model is scored in-sample"
+    )
+    parser.add_argument("--iterations", type=int, default=200, help="trees per refit with --retrain")
+    parser.add_argument("--max-train-rows", type=int, default=None, help="refit on at most this many recent rows")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = backtest(
+        args.data, args.period, args.workers, args.warmup_windows,
+        args.retrain, args.iterations, args.max_train_rows, args.model_version
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Measures API cold start: import time of app.py and the cost of loading each lazy component.
+
+Run from the backend directory:
+
+    python benchmarks/bench_startup.py --runs 5 --budget-seconds 1.0
+
+Prints a JSON report and exits non-zero when the median import time is over budget.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["pandas", "numpy", "catboost", "openai", "httpx", "openmeteo_requests", "requests_cache"]
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import fastapi
+fastapi_seconds = time.perf_counter() - started
+import app
+print(json.dumps({
+    "fastapi_seconds": fastapi_seconds,
+    "import_seconds": time.perf_counter() - started,
+    "heavy_modules_loaded": [m for m in %r if m in sys.modules]
+}))
+""" % (HEAVY_MODULES,)
+
+COMPONENT_PROBE = """
+import json
+import app
+for name in app.WARMUP_COMPONENTS:
+    try:
+        app.components.get(name)
+    except Exception:
+        pass  # recorded in the component status
+print(json.dumps(app.components.status()))
+"""
+
+
+def run_probe(code):
+    env = dict(os.environ, WARMUP_ON_STARTUP="0")
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    imports = [run_probe(IMPORT_PROBE) for _ in range(args.runs)]
+    import_seconds = statistics.median(run["import_seconds"] for run in imports)
+    fastapi_seconds = statistics.median(run["fastapi_seconds"] for run in imports)
+    report = {
+        "runs": args.runs,
+        "import_seconds_median": round(import_seconds, 4),
+        "fastapi_seconds_median": round(fastapi_seconds, 4),
+        "app_overhead_seconds": round(import_seconds - fastapi_seconds, 4),
+        "heavy_modules_loaded_at_import": imports[-1]["heavy_modules_loaded"],
+        "components": run_probe(COMPONENT_PROBE),
+        "budget_seconds": args.budget_seconds,
+        "within_budget": import_seconds <= args.budget_seconds
+    }
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["within_budget"] else 1)
+
+
+if __name__ == "__main__":
+    main()
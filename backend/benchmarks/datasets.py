@@ -0,0 +1,109 @@
+"""Synthetic price and buyer CSVs with the same schema as the shipped datasets, at any size.
+
+Categorical values (regions, crops, buyer types, ...) are sampled from the
+real files so generated rows join against the model and the buyer index the
+same way production data does. Rows are written in chunks, so 10M price rows
+never need to fit in memory at once.
+
+    python benchmarks/datasets.py --prices 1000000 --buyers 100000 --output-dir /tmp/bench-data
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRICES_TEMPLATE = os.path.join(BACKEND_DIR, "philippines_crop_prices_mock_data.csv")
+BUYERS_TEMPLATE = os.path.join(BACKEND_DIR, "fictional_buyers_dataset.csv")
+
+PRICE_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+BUYER_SIZES = [150, 10_000, 100_000, 1_000_000]
+CHUNK_ROWS = 500_000
+
+
+def _categories(template_path, columns):
+    template = pd.read_csv(template_path, usecols=columns)
+    return {column: template[column].dropna().unique() for column in columns}
+
+
+def _write_chunks(path, total_rows, make_chunk, seed):
+    rng = np.random.default_rng(seed)
+    written = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        while written < total_rows:
+            rows = min(CHUNK_ROWS, total_rows - written)
+            make_chunk(rng, rows).to_csv(f, index=False, header=written == 0, float_format="%.2f")
+            written += rows
+    return path
+
+
+def generate_prices(path, rows, seed=0):
+    """Writes ``rows`` price rows shaped like philippines_crop_prices_mock_data.csv."""
+    categories = _categories(PRICES_TEMPLATE, ["Region", "Crop"])
+    start = np.datetime64("2023-05-10")
+
+    def make_chunk(rng, n):
+        return pd.DataFrame({
+            "Date": (start + rng.integers(0, 730, n).astype("timedelta64[D]")).astype(str),
+            "Region": rng.choice(categories["Region"], n),
+            "Crop": rng.choice(categories["Crop"], n),
+            "Price per kg": rng.uniform(10, 120, n),
+            "Rainfall (mm)": rng.uniform(0, 300, n).round(1),
+            "Temperature (°C)": rng.uniform(20, 38, n).round(1),
+            "Fertilizer Cost (PHP/kg)": rng.uniform(20, 60, n),
+            "Fuel Price (PHP/liter)": rng.uniform(40, 80, n),
+            "Pest Outbreak": rng.choice(["Yes", "No"], n),
+            "Market Demand (1-10)": rng.integers(1, 11, n)
+        })
+
+    return _write_chunks(path, rows, make_chunk, seed)
+
+
+def generate_buyers(path, rows, seed=0):
+    """Writes ``rows`` buyer rows shaped like fictional_buyers_dataset.csv."""
+    columns = ["Buyer Name", "Region", "Crop Interest", "Purchase Intent", "Buyer Type", "Climate Preference", "Risk Tolerance"]
+    categories = _categories(BUYERS_TEMPLATE, columns)
+
+    def make_chunk(rng, n):
+        return pd.DataFrame({
+            "Buyer Name": rng.choice(categories["Buyer Name"], n),
+            "Region": rng.choice(categories["Region"], n),
+            "Crop Interest": rng.choice(categories["Crop Interest"], n),
+            "Quantity Desired (kg)": rng.integers(100, 10_000, n),
+            "Budget (PHP)": rng.uniform(5_000, 500_000, n),
+            "Purchase Intent": rng.choice(categories["Purchase Intent"], n),
+            "Buyer Type": rng.choice(categories["Buyer Type"], n),
+            "Climate Preference": rng.choice(categories["Climate Preference"], n),
+            "Risk Tolerance": rng.choice(categories["Risk Tolerance"], n)
+        })
+
+    return _write_chunks(path, rows, make_chunk, seed)
+
+
+def ensure_datasets(output_dir, price_rows, buyer_rows, seed=0):
+    """Returns (buyers_path, prices_path), generating the files only if they do not exist yet."""
+    os.makedirs(output_dir, exist_ok=True)
+    prices_path = os.path.join(output_dir, f"prices_{price_rows}.csv")
+    buyers_path = os.path.join(output_dir, f"buyers_{buyer_rows}.csv")
+    if not os.path.exists(prices_path):
+        generate_prices(prices_path, price_rows, seed)
+    if not os.path.exists(buyers_path):
+        generate_buyers(buyers_path, buyer_rows, seed)
+    return buyers_path, prices_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prices", type=int, nargs="+", default=PRICE_SIZES[:1])
+    parser.add_argument("--buyers", type=int, nargs="+", default=BUYER_SIZES[:1])
+    parser.add_argument("--output-dir", default="bench-data")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for price_rows, buyer_rows in zip(args.prices, args.buyers):
+        print(*ensure_datasets(args.output_dir, price_rows, buyer_rows, args.seed))
+
+
+if __name__ == "__main__":
+    main()
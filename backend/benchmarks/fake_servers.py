@@ -0,0 +1,238 @@
+"""Local stand-ins for the Open-Meteo and OpenAI-compatible (OpenRouter) APIs.
+
+Both servers run in background threads so benchmarks never touch the real
+upstreams. Point the app at them with:
+
+    OPEN_METEO_URL=http://127.0.0.1:<port>/v1/forecast
+    OPENROUTER_BASE_URL=http://127.0.0.1:<port>/v1
+"""
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import flatbuffers
+
+
+def _float_vector(builder, values):
+    builder.StartVector(4, len(values), 4)
+    for value in reversed(values):
+        builder.PrependFloat32(float(value))
+    return builder.EndVector()
+
+
+def _table_vector(builder, offsets):
+    builder.StartVector(4, len(offsets), 4)
+    for offset in reversed(offsets):
+        builder.PrependUOffsetTRelative(offset)
+    return builder.EndVector()
+
+
+def _variable(builder, value=None, values=None):
+    # VariableWithValues: slot 2 = value (float32), slot 3 = values (vector of float32)
+    values_offset = _float_vector(builder, values) if values is not None else None
+    builder.StartObject(4)
+    if values_offset is not None:
+        builder.PrependUOffsetTRelativeSlot(3, values_offset, 0)
+    if value is not None:
+        builder.PrependFloat32Slot(2, value, 0.0)
+    return builder.EndObject()
+
+
+def _variables_with_time(builder, variables, start, interval):
+    # VariablesWithTime: slot 0 = time, slot 1 = time_end, slot 2 = interval, slot 3 = variables
+    vector = _table_vector(builder, variables)
+    builder.StartObject(4)
+    builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+    builder.PrependInt32Slot(2, interval, 0)
+    builder.PrependInt64Slot(0, start, 0)
+    return builder.EndObject()
+
+
+def encode_forecast(latitude, longitude, n_hourly, n_daily, n_current, rng):
+    """Encodes one size-prefixed WeatherApiResponse message with plausible random values."""
+    builder = flatbuffers.Builder(4096)
+    now = int(time.time())
+
+    current = [_variable(builder, value=rng.uniform(0, 35 if i == 0 else 10)) for i in range(n_current)]
+    current_offset = _variables_with_time(builder, current, now, 900)
+
+    hourly = [_variable(builder, values=[rng.uniform(0, 12) for _ in range(168)]) for _ in range(n_hourly)]
+    hourly_offset = _variables_with_time(builder, hourly, now, 3600)
+
+    daily = [_variable(builder, values=[rng.uniform(0, 60) for _ in range(7)]) for _ in range(n_daily)]
+    daily_offset = _variables_with_time(builder, daily, now, 86400)
+
+    # WeatherApiResponse: slot 0 = latitude, 1 = longitude, 9 = current, 10 = daily, 11 = hourly
+    builder.StartObject(14)
+    builder.PrependUOffsetTRelativeSlot(11, hourly_offset, 0)
+    builder.PrependUOffsetTRelativeSlot(10, daily_offset, 0)
+    builder.PrependUOffsetTRelativeSlot(9, current_offset, 0)
+    builder.PrependFloat32Slot(1, longitude, 0.0)
+    builder.PrependFloat32Slot(0, latitude, 0.0)
+    root = builder.EndObject()
+    builder.FinishSizePrefixed(root)
+    return bytes(builder.Output())
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (e.g. the app shutting down) are expected during benchmarks
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class _FakeServer:
+    handler_class = None
+
+    def __init__(self, latency_seconds=0.0, port=0):
+        self.latency_seconds = latency_seconds
+        self.requests = 0
+        handler = type("Handler", (self.handler_class,), {"fake": self})
+        self.httpd = _QuietHTTPServer(("127.0.0.1", port), handler)
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _OpenMeteoHandler(_QuietHandler):
+    def do_GET(self):
+        self.fake.requests += 1
+        if self.fake.latency_seconds:
+            time.sleep(self.fake.latency_seconds)
+
+        params = parse_qs(urlparse(self.path).query)
+        latitudes = params.get("latitude", ["0"])
+        longitudes = params.get("longitude", ["0"])
+        rng = random.Random(hash((tuple(latitudes), tuple(longitudes))))
+        body = b"".join(
+            encode_forecast(
+                float(latitude), float(longitude),
+                len(params.get("hourly", [])), len(params.get("daily", [])), len(params.get("current", [])),
+                rng
+            )
+            for latitude, longitude in zip(latitudes, longitudes)
+        )
+        self._send(200, body, "application/octet-stream")
+
+
+class FakeOpenMeteoServer(_FakeServer):
+    handler_class = _OpenMeteoHandler
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/v1/forecast"
+
+
+FAKE_REPLY = "\\boxed{Maganda ang presyo ngayon kaya magandang magbenta ng ani sa lalong madaling panahon.}"
+
+
+def _packed_items(messages):
+    """The "items" of a packed selling-initiative prompt, or None for any other prompt."""
+    if not messages:
+        return None
+    try:
+        body = json.loads(messages[-1].get("content") or "")
+    except (TypeError, ValueError):
+        return None
+    return body.get("items") if isinstance(body, dict) and isinstance(body.get("items"), list) else None
+
+
+class _OpenAIHandler(_QuietHandler):
+    def do_POST(self):
+        self.fake.requests += 1
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        model = payload.get("model", "fake-model")
+        if self.fake.latency_seconds:
+            time.sleep(self.fake.latency_seconds)
+
+        if payload.get("stream"):
+            self._stream(model)
+            return
+
+        content = FAKE_REPLY
+        items = _packed_items(payload.get("messages", []))
+        if items is not None:
+            text = FAKE_REPLY.replace("\\boxed{", "").rstrip("}")
+            content = json.dumps({"initiatives": [{"id": item.get("id"), "initiative": text} for item in items]})
+
+        body = json.dumps({
+            "id": f"chatcmpl-{self.fake.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 200, "completion_tokens": 20, "total_tokens": 220}
+        }).encode("utf-8")
+        self._send(200, body, "application/json")
+
+    def _stream(self, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        words = FAKE_REPLY.split(" ")
+        for i, word in enumerate(words):
+            chunk = {
+                "id": f"chatcmpl-{self.fake.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word if i == 0 else " " + word},
+                    "finish_reason": None
+                }]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.fake.token_delay_seconds)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeOpenAIServer(_FakeServer):
+    handler_class = _OpenAIHandler
+
+    def __init__(self, latency_seconds=0.0, token_delay_seconds=0.0, port=0):
+        super().__init__(latency_seconds=latency_seconds, port=port)
+        self.token_delay_seconds = token_delay_seconds
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
@@ -0,0 +1,297 @@
+"""Benchmarks prediction throughput, buyer matching and endpoint latency against local fake upstreams.
+
+Run from the backend directory:
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --price-rows 10000 1000000 --buyer-rows 150 100000 --concurrency 32
+
+Open-Meteo and OpenRouter are replaced by the servers in fake_servers.py, so
+results only reflect this code base. The report is JSON so runs from
+different releases can be diffed.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.fake_servers import FakeOpenAIServer, FakeOpenMeteoServer  # noqa: E402
+from benchmarks.datasets import ensure_datasets  # noqa: E402
+
+SAMPLE_CROPS = ["Rice", "Corn", "Banana"]
+SAMPLE_REGION = "Central Luzon"
+ENDPOINTS = [
+    ("GET", "/", None),
+    ("POST", f"/live-model-test?crop=Rice&region={SAMPLE_REGION}", None),
+    ("POST", "/predict/batch", {"crops": SAMPLE_CROPS, "regions": [SAMPLE_REGION, "Davao Region"]}),
+    ("GET", "/weather-alert", None),
+    ("POST", f"/confirm-sell?response=OO&crop=Rice&region={SAMPLE_REGION}", None),
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies):
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else None
+    }
+
+
+def bench_prediction(iterations):
+    """Single-row predict_single_price calls vs. one batched predict_batch over the full grid."""
+    from price_predict import CropsPricePredictor
+    from market_data import get_market_data
+
+    predictor = CropsPricePredictor()
+    market_data = get_market_data()
+    date = datetime.now().strftime("%B %d, %Y")
+    predictor.predict_single_price(date, SAMPLE_CROPS[0], SAMPLE_REGION)  # warm the weather snapshot
+
+    latencies = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        predictor.predict_single_price(date, SAMPLE_CROPS[i % len(SAMPLE_CROPS)], SAMPLE_REGION)
+        latencies.append(time.perf_counter() - started)
+
+    crops, regions = list(market_data.crop_names), list(market_data.region_names)
+    started = time.perf_counter()
+    batch = predictor.predict_batch(date=date, crops=crops, regions=regions)
+    batch_seconds = time.perf_counter() - started
+
+    single_total = sum(latencies)
+    return {
+        "single": dict(summarize(latencies), rows_per_second=round(len(latencies) / single_total, 1)),
+        "batch": {
+            "rows": batch["count"],
+            "seconds": round(batch_seconds, 4),
+            "rows_per_second": round(batch["count"] / batch_seconds, 1)
+        }
+    }
+
+
+def bench_matching(price_rows, buyer_rows, data_dir, iterations):
+    """CSV parse vs columnar load, buyer ranker build and ranking time for each synthetic dataset size."""
+    import pandas as pd
+
+    import columnar
+    from buyer_ranking import BuyerRanker
+    from market_data import MarketDataStore
+
+    results = []
+    for prices, buyers in zip(price_rows, buyer_rows):
+        buyers_path, prices_path = ensure_datasets(data_dir, prices, buyers)
+
+        # The text path every load used to take
+        started = time.perf_counter()
+        pd.read_csv(prices_path)
+        pd.read_csv(buyers_path)
+        csv_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        columnar.convert(prices_path)
+        columnar.convert(buyers_path)
+        convert_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        market_data = MarketDataStore(buyers_path, prices_path)
+        load_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        ranker = BuyerRanker(market_data)
+        build_seconds = time.perf_counter() - started
+
+        latencies = []
+        ranked = 0
+        for _ in range(iterations):
+            started = time.perf_counter()
+            ranked = len(ranker.rank(SAMPLE_CROPS, region="Central Luzon", quantity_kg=500, top_k=10))
+            latencies.append(time.perf_counter() - started)
+
+        results.append({
+            "price_rows": prices,
+            "buyer_rows": buyers,
+            "csv_parse_seconds": round(csv_seconds, 4),
+            "columnar_convert_seconds": round(convert_seconds, 4),
+            "load_seconds": round(load_seconds, 4),
+            "ranker_build_seconds": round(build_seconds, 4),
+            "ranked_buyers": ranked,
+            "rank": summarize(latencies)
+        })
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(client, base_url, timeout_seconds):
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get(f"{base_url}/ready")
+            if response.status_code == 200:
+                return time.monotonic()
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"API was not ready after {timeout_seconds}s")
+
+
+async def _load(client, base_url, method, path, body, requests, concurrency):
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, f"{base_url}{path}", json=body)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return dict(summarize(latencies), errors=errors, requests_per_second=round(len(latencies) / elapsed, 1))
+
+
+async def bench_endpoints(weather_url, llm_url, requests, concurrency, startup_timeout, server_workers=1, data_dir=None):
+    """p50/p99 latency per endpoint under concurrent load against a uvicorn (or serve.py) subprocess."""
+    import httpx
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        OPEN_METEO_URL=weather_url,
+        OPENROUTER_BASE_URL=llm_url,
+        OPENROUTER_API_KEY=os.getenv("OPENROUTER_API_KEY", "benchmark"),
+        WARMUP_ON_STARTUP="1"
+    )
+    # All load comes from one address; lift the per-client limits so they do not cap the measurement
+    for gate in ("LIVE_MODEL_TEST", "WEATHER_ALERT", "CONFIRM_SELL"):
+        env.setdefault(f"ADMISSION_{gate}_CLIENT_RATE", "1000000")
+        env.setdefault(f"ADMISSION_{gate}_CLIENT_BURST", "1000000")
+    if server_workers > 1:
+        # Keep the benchmark's shared state out of the backend directory
+        data_dir = data_dir or tempfile.gettempdir()
+        os.makedirs(data_dir, exist_ok=True)
+        env["STATE_BACKEND"] = f"sqlite:///{os.path.join(data_dir, f'state-{port}.db')}"
+        command = [sys.executable, "serve.py", "--workers", str(server_workers)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app:app"]
+    server = subprocess.Popen(
+        command + ["--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+            started = time.monotonic()
+            ready_at = await _wait_ready(client, base_url, startup_timeout)
+            results = {
+                "startup_seconds": round(ready_at - started, 3),
+                "concurrency": concurrency,
+                "server_workers": server_workers,
+                "endpoints": {}
+            }
+            for method, path, body in ENDPOINTS:
+                results["endpoints"][f"{method} {path.split('?')[0]}"] = await _load(
+                    client, base_url, method, path, body, requests, concurrency
+                )
+            return results
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--price-rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--buyer-rows", type=int, nargs="+", default=[150, 10_000])
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "farm-assist-bench-data"))
+    parser.add_argument("--iterations", type=int, default=50, help="repetitions for in-process measurements")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--weather-latency", type=float, default=0.05, help="simulated Open-Meteo latency (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="simulated LLM latency (s)")
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--server-workers", type=int, default=1, help="serve the endpoint benchmark with serve.py")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["prediction", "matching", "endpoints"])
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if len(args.price_rows) != len(args.buyer_rows):
+        parser.error("--price-rows and --buyer-rows need the same number of sizes")
+
+    weather_server = FakeOpenMeteoServer(latency_seconds=args.weather_latency).start()
+    llm_server = FakeOpenAIServer(latency_seconds=args.llm_latency).start()
+    # Set before the weather and LLM modules are imported so they pick up the fake upstreams
+    os.environ["OPEN_METEO_URL"] = weather_server.url
+    os.environ["OPENROUTER_BASE_URL"] = llm_server.base_url
+    os.chdir(BACKEND_DIR)
+
+    report = {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True
+            ).stdout.strip() or None,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args)
+        }
+    }
+    try:
+        if "prediction" not in args.skip:
+            report["prediction"] = bench_prediction(args.iterations)
+        if "matching" not in args.skip:
+            report["matching"] = bench_matching(args.price_rows, args.buyer_rows, args.data_dir, args.iterations)
+        if "endpoints" not in args.skip:
+            report["endpoints"] = asyncio.run(bench_endpoints(
+                weather_server.url, llm_server.base_url, args.requests, args.concurrency, args.startup_timeout,
+                server_workers=args.server_workers, data_dir=args.data_dir
+            ))
+    finally:
+        weather_server.stop()
+        llm_server.stop()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+from regional_weather import REGION_COORDINATES, resolve_region
+
+if TYPE_CHECKING:
+    from market_data import MarketDataStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEIGHTS = {
+    "price": 0.4,
+    "budget": 0.25,
+    "distance": 0.2,
+    "intent": 0.15
+}
+INTENT_SCORES = {"high": 1.0, "medium": 0.6, "low": 0.3}
+EARTH_RADIUS_KM = 6371.0
+
+
+def _region_distances(regions: List[str]) -> np.ndarray:
+    """Great-circle distance in km between every pair of region centers."""
+    coordinates = np.radians(np.array([REGION_COORDINATES[region] for region in regions]))
+    lat, lon = coordinates[:, 0][:, None], coordinates[:, 1][:, None]
+    a = np.sin((lat - lat.T) / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin((lon - lon.T) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _factorize(values: pd.Series):
+    """(codes, uniques) with -1 for missing values; a Categorical's own codes are used without hashing any rows."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values)
+
+
+def _factorize_lower(values: pd.Series):
+    """Case-insensitive (codes, uniques); only the distinct values are lower-cased. Missing values get code -1."""
+    codes, uniques = _factorize(values)
+    lookup, lowered = pd.factorize(pd.Index(np.asarray(uniques, dtype=object)).str.lower())
+    return np.append(lookup, -1).astype(np.int32)[codes], list(lowered)
+
+
+class BuyerRanker:
+    """Scores every buyer for a farmer's crops, region and quantity in one NumPy pass.
+
+    Buyer columns are encoded once per market data load and stored grouped by
+    crop, so the candidates for a request are contiguous slices. Everything
+    that does not depend on the request (price per buyer, how many kg the
+    budget covers, intent) is precomputed; a ranking is a few float32 vector
+    operations and an argpartition for the top k.
+    """
+
+    def __init__(self, market_data: "MarketDataStore"):
+        self.buyers = market_data.buyers
+        self.version = market_data.version
+        frame = market_data.buyer_frame(
+            ["Region", "Crop Interest", "Quantity Desired (kg)", "Budget (PHP)", "Purchase Intent", "Buyer Type"]
+        )
+        crop_codes, crops = _factorize_lower(frame["Crop Interest"])
+        self.crop_index = {crop: code for code, crop in enumerate(crops)}
+
+        self.regions = list(REGION_COORDINATES)
+        region_index = {region: code for code, region in enumerate(self.regions)}
+        raw_region_codes, raw_regions = _factorize(frame["Region"])
+        # Region code len(regions) stands for a region without coordinates
+        region_lookup = np.array(
+            [region_index.get(resolve_region(str(region)) or "", len(self.regions)) for region in raw_regions] + [len(self.regions)],
+            dtype=np.int16
+        )
+        region_codes = region_lookup[raw_region_codes]
+
+        # Average price per (buyer crop, buyer region); regions without data use the crop-wide average
+        price_table = np.full((len(crops), len(self.regions) + 1), np.nan)
+        for crop, code in self.crop_index.items():
+            crop_avg = market_data.average_price(crop)
+            price_table[code, :] = crop_avg if crop_avg is not None else np.nan
+            for region_code, region in enumerate(self.regions):
+                price = market_data.average_price(crop, region)
+                if price is not None:
+                    price_table[code, region_code] = price
+
+        # Group buyers by crop so a request's candidates are contiguous slices
+        self.order = np.argsort(crop_codes, kind="stable").astype(np.int32)
+        crop_codes = crop_codes[self.order]
+        self.crop_offsets = np.searchsorted(crop_codes, np.arange(len(crops) + 1))
+        self.region_codes = region_codes[self.order]
+        self.price = price_table[crop_codes, self.region_codes].astype(np.float32)
+        quantity = pd.to_numeric(frame["Quantity Desired (kg)"], errors="coerce").fillna(0).to_numpy(np.float32)
+        budget = pd.to_numeric(frame["Budget (PHP)"], errors="coerce").fillna(0).to_numpy(np.float32)
+        self.quantity = quantity[self.order]
+        self.affordable_kg = np.nan_to_num(budget[self.order] / self.price, nan=0.0)
+        intent_codes, intents = _factorize_lower(frame["Purchase Intent"])
+        intent_scores = np.array([INTENT_SCORES.get(intent, 0.0) for intent in intents] + [0.0], dtype=np.float32)
+        self.intent = intent_scores[intent_codes][self.order]
+        buyer_type_codes, buyer_types = _factorize_lower(frame["Buyer Type"])
+        self.buyer_type_codes = buyer_type_codes[self.order].astype(np.int16)
+        self.buyer_type_index = {buyer_type: code for code, buyer_type in enumerate(buyer_types)}
+        self.max_price = np.array([
+            np.nanmax(self.price[start:end]) if end > start and not np.isnan(self.price[start:end]).all() else np.nan
+            for start, end in zip(self.crop_offsets[:-1], self.crop_offsets[1:])
+        ])
+
+        distances = _region_distances(self.regions)
+        self.proximity = np.full((len(self.regions) + 1, len(self.regions) + 1), 0.5, dtype=np.float32)  # unknown: neutral
+        self.proximity[:-1, :-1] = 1 - distances / max(distances.max(), 1.0)
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """Bytes held in the ranker's per-buyer arrays."""
+        nbytes = sum(value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray))
+        return {
+            "buyers": len(self.buyers),
+            "bytes": nbytes,
+            "bytes_per_buyer": round(nbytes / len(self.buyers), 1) if len(self.buyers) else None
+        }
+
+    def _candidates(self, crop_codes: List[int]) -> np.ndarray:
+        slices = [np.arange(self.crop_offsets[code], self.crop_offsets[code + 1]) for code in sorted(set(crop_codes))]
+        return slices[0] if len(slices) == 1 else np.concatenate(slices)
+
+    def _score(
+        self,
+        crops: List[str],
+        region: Optional[str],
+        quantity_kg: Optional[float],
+        top_k: int,
+        buyer_type: Optional[str],
+        weights: Optional[Dict[str, float]]
+    ) -> Optional[Dict[str, np.ndarray]]:
+        """Rows of the top ``top_k`` buyers, best first, with their price and score components; None if there are none."""
+        weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        crop_codes = [self.crop_index[crop.lower()] for crop in crops if crop.lower() in self.crop_index]
+        crop_codes = [code for code in crop_codes if not np.isnan(self.max_price[code])]
+        if not crop_codes or top_k <= 0:
+            return None
+
+        candidates = self._candidates(crop_codes)
+        if buyer_type:
+            candidates = candidates[self.buyer_type_codes[candidates] == self.buyer_type_index.get(buyer_type.lower(), -1)]
+        price = self.price[candidates]
+        valid = ~np.isnan(price)
+        if not valid.all():
+            candidates, price = candidates[valid], price[valid]
+        if len(candidates) == 0:
+            return None
+
+        # Share of the farmer's harvest (or, without one, of the buyer's own order) the buyer wants and can afford
+        quantity = self.quantity[candidates]
+        if quantity_kg is None:
+            budget_fit = np.minimum(self.affordable_kg[candidates], quantity) / np.maximum(quantity, 1.0)
+        else:
+            wanted = np.minimum(quantity, np.float32(quantity_kg))
+            budget_fit = np.minimum(self.affordable_kg[candidates], wanted) / np.float32(max(quantity_kg, 1.0))
+        np.clip(budget_fit, 0.0, 1.0, out=budget_fit)
+
+        farmer_region = resolve_region(region) if region else None
+        farmer_code = self.regions.index(farmer_region) if farmer_region else len(self.regions)
+        proximity = self.proximity[farmer_code][self.region_codes[candidates]]
+        price_score = price / np.float32(self.max_price[crop_codes].max())
+
+        scores = np.float32(weights["price"]) * price_score
+        scores += np.float32(weights["budget"]) * budget_fit
+        scores += np.float32(weights["distance"]) * proximity
+        scores += np.float32(weights["intent"]) * self.intent[candidates]
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return {
+            "rows": self.order[candidates[top]],
+            "price": price[top],
+            "score": scores[top],
+            "price_score": price_score[top],
+            "budget": budget_fit[top],
+            "distance": proximity[top],
+            "intent": self.intent[candidates[top]]
+        }
+
+    @timed("rank_buyers")
+    def rank(
+        self,
+        crops: List[str],
+        region: Optional[str] = None,
+        quantity_kg: Optional[float] = None,
+        top_k: int = 10,
+        buyer_type: Optional[str] = None,
+        weights: Optional[Dict[str, float]] = None
+    ) -> List[Dict[str, Any]]:
+        """Top ``top_k`` buyers for the given crops, best first, each with its score breakdown."""
+        top = self._score(crops, region, quantity_kg, top_k, buyer_type, weights)
+        if top is None:
+            return []
+        return [
+            dict(
+                self.buyer(row, price, score),
+                score_breakdown={
+                    "price": round(float(top["price_score"][i]), 4),
+                    "budget": round(float(top["budget"][i]), 4),
+                    "distance": round(float(top["distance"][i]), 4),
+                    "intent": round(float(top["intent"][i]), 4)
+                }
+            )
+            for i, (row, price, score) in enumerate(zip(top["rows"], top["price"], top["score"]))
+        ]
+
+    @timed("rank_buyers")
+    def rank_rows(
+        self,
+        crops: List[str],
+        region: Optional[str] = None,
+        quantity_kg: Optional[float] = None,
+        top_k: int = 10
+    ) -> List[Tuple[int, float, float]]:
+        """``rank`` as (buyer row, price, score) triples, for callers that keep rankings and expand them later."""
+        top = self._score(crops, region, quantity_kg, top_k, None, None)
+        if top is None:
+            return []
+        return [
+            (int(row), round(float(price), 2), round(float(score), 4))
+            for row, price, score in zip(top["rows"], top["price"], top["score"])
+        ]
+
+    def buyer(self, row: int, price: float, score: float) -> Dict[str, Any]:
+        """A ranked buyer record for a row of the buyer table."""
+        return dict(self.buyers[int(row)], price_info=round(float(price), 2), score=round(float(score), 4))
+
+
+_rankers: Dict[int, BuyerRanker] = {}
+_rankers_lock = threading.Lock()
+
+
+def loaded_rankers() -> List[BuyerRanker]:
+    """Rankers built so far, without building any."""
+    with _rankers_lock:
+        return list(_rankers.values())
+
+
+def get_buyer_ranker(market_data: "MarketDataStore") -> BuyerRanker:
+    """Returns the ranker for a market data store, rebuilding it after the store reloads its buyers."""
+    key = id(market_data)
+    ranker = _rankers.get(key)
+    if ranker is not None and ranker.buyers is market_data.buyers:
+        return ranker
+    with _rankers_lock:
+        ranker = _rankers.get(key)
+        if ranker is None or ranker.buyers is not market_data.buyers:
+            ranker = BuyerRanker(market_data)
+            _rankers[key] = ranker
+            logger.info(f"Buyer ranker built for {len(ranker.buyers)} buyers")
+    return ranker
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+from metrics import inc
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _succeeded(value: Any) -> bool:
+    # This codebase reports failures as {"status": "error", ...} results rather than exceptions
+    return not (isinstance(value, dict) and value.get("status", "success") != "success")
+
+
+def _consume_exception(task: asyncio.Task):
+    # Every waiter may be gone by the time a computation fails; don't warn about it
+    if not task.cancelled():
+        task.exception()
+
+
+class Coalescer:
+    """Single-flight for async computations, with a short-lived result cache.
+
+    Concurrent ``run`` calls with the same key share one in-flight computation
+    and all receive its result or its exception. A successful result is kept
+    for ``ttl_seconds`` (0 disables this) so a burst arriving just after a
+    computation finished does not start another. Exceptions and
+    ``{"status": "error"}`` results reach only the callers already waiting,
+    so a transient failure is never replayed after its cause has cleared. Results are shared, so
+    callers must not mutate them. The computation runs in its own task: a
+    caller that is cancelled (e.g. a client that disconnects) does not cancel
+    it for the others.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float = 5.0, max_entries: int = 4096):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._results = OrderedDict()  # key -> (expires_at, value)
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        if self.ttl_seconds > 0:
+            entry = self._results.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self.hits += 1
+                    inc("cache_requests_total", cache=self.name, result="hit")
+                    return value
+                del self._results[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            inc("coalesced_requests_total", flight=self.name)
+            return await asyncio.shield(task)
+
+        self.misses += 1
+        if self.ttl_seconds > 0:
+            inc("cache_requests_total", cache=self.name, result="miss")
+        task = asyncio.ensure_future(self._compute(key, factory))
+        task.add_done_callback(_consume_exception)
+        self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        try:
+            value = await factory()
+        finally:
+            self._in_flight.pop(key, None)
+        if self.ttl_seconds > 0 and _succeeded(value):
+            self._results[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._in_flight),
+            "cached": len(self._results),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced
+        }
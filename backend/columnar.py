@@ -0,0 +1,328 @@
+"""Columnar, memory-mapped copies of the CSV datasets.
+
+    python columnar.py philippines_crop_prices_mock_data.csv fictional_buyers_dataset.csv
+
+``open_table(csv_path)`` returns the columnar snapshot of a CSV, converting it
+first if it is missing or older than the CSV. Each snapshot is a directory
+``<csv_path>.cols/v<format>-<size>-<mtime_ns>/`` holding one raw binary file
+per column and ``meta.json``. Numbers and dates are stored as fixed-width
+arrays and text columns are dictionary encoded (codes plus the list of
+distinct values), so opening a table parses nothing and only touches the pages
+that are read. Codes and integers are stored in the narrowest type that holds
+them: a column with a dozen regions takes one byte per row, not four.
+"""
+import json
+import logging
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DATE_COLUMNS = {"Date"}
+CHUNK_ROWS = 1_000_000
+META_FILE = "meta.json"
+# Part of the snapshot name, so snapshots written in an older layout are rebuilt
+FORMAT_VERSION = 2
+
+
+def _column_file(index: int) -> str:
+    return f"col{index:03d}.bin"
+
+
+def _narrowest(low: int, high: int, dtypes=(np.int8, np.int16, np.int32, np.int64)) -> np.dtype:
+    """The smallest signed integer type holding every value in [low, high]."""
+    for dtype in dtypes:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def is_mapped(array: np.ndarray) -> bool:
+    """Whether ``array`` is (a view of) a memory-mapped file rather than memory of its own."""
+    base = array
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap):
+            return True
+        base = base.base
+    return isinstance(base, mmap.mmap)
+
+
+class TableRows(Sequence):
+    """Rows of a table as dicts, built on access instead of held in memory."""
+
+    def __init__(self, table: "ColumnarTable"):
+        self.table = table
+        self._columns = [(name, table.kind(name), table.array(name), table.categories(name)) for name in table.columns]
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        row = {}
+        for name, kind, values, categories in self._columns:
+            value = values[index]
+            if kind == "category":
+                row[name] = categories[value] if value >= 0 else None
+            elif kind == "datetime":
+                row[name] = None if np.isnat(value) else str(value)[:10]
+            elif kind == "float64":
+                row[name] = None if np.isnan(value) else float(value)
+            else:
+                row[name] = int(value)
+        return row
+
+
+class ColumnarTable:
+    """A read-only columnar snapshot of one CSV, with every column memory-mapped."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.columns: List[str] = [column["name"] for column in self.meta["columns"]]
+        self.source_size: int = self.meta["source_size"]
+        self._specs = {column["name"]: dict(column, index=i) for i, column in enumerate(self.meta["columns"])}
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def kind(self, name: str) -> str:
+        return self._specs[name]["kind"]
+
+    def categories(self, name: str) -> Optional[List[str]]:
+        """Distinct values of a dictionary-encoded column, indexed by code."""
+        return self._specs[name].get("categories")
+
+    def array(self, name: str) -> np.ndarray:
+        """The stored array without copying: codes for text columns, datetime64[ns] for dates."""
+        array = self._arrays.get(name)
+        if array is None:
+            spec = self._specs[name]
+            # Snapshots without a stored dtype predate narrowing and use int32 codes
+            dtype = spec.get("dtype") or {"category": np.int32, "datetime": "datetime64[ns]"}.get(spec["kind"], spec["kind"])
+            path = os.path.join(self.directory, _column_file(spec["index"]))
+            if len(self) == 0:
+                array = np.empty(0, dtype=dtype)
+            else:
+                array = np.memmap(path, dtype=dtype, mode="r", shape=(len(self),))
+            self._arrays[name] = array
+        return array
+
+    def nbytes(self) -> int:
+        """Size of every column's stored array, mapped or not."""
+        return sum(self.array(name).nbytes for name in self.columns)
+
+    def column(self, name: str):
+        """A column ready for pandas; text columns become Categoricals over the mapped codes."""
+        array = self.array(name)
+        if self.kind(name) == "category":
+            return pd.Categorical.from_codes(array, categories=self.categories(name), validate=False)
+        return array
+
+    def to_frame(self, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        return pd.DataFrame({name: self.column(name) for name in (columns or self.columns)}, copy=False)
+
+    def rows(self) -> TableRows:
+        return TableRows(self)
+
+
+class _ColumnWriter:
+    """Appends one column's chunks to its binary file, dictionary encoding text as it goes."""
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.kind: Optional[str] = None
+        self.codes: Dict[str, int] = {}
+        self.rows = 0
+        self.low = 0
+        self.high = 0
+        self._file = open(path, "wb")
+
+    def _kind_of(self, values: pd.Series) -> str:
+        if self.name in DATE_COLUMNS:
+            return "datetime"
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+            return "int64"
+        if pd.api.types.is_float_dtype(values):
+            return "float64"
+        return "category"
+
+    def _promote_to_float(self):
+        """Rewrites the integers written so far as floats once a later chunk has decimals or blanks."""
+        self._file.close()
+        existing = np.fromfile(self.path, dtype=np.int64).astype(np.float64)
+        existing.tofile(self.path)
+        self._file = open(self.path, "ab")
+        self.kind = "float64"
+
+    def write(self, values: pd.Series):
+        kind = self._kind_of(values)
+        if self.kind is None:
+            self.kind = kind
+        elif self.kind == "int64" and kind == "float64":
+            self._promote_to_float()
+        elif self.kind in ("int64", "float64") and kind == "category":
+            raise ValueError(f"Column {self.name} mixes numbers and text")
+
+        if self.kind == "category":
+            if kind != "category":
+                values = values.astype(str).where(values.notna())
+            for value in values.dropna().unique():
+                if value not in self.codes:
+                    self.codes[value] = len(self.codes)
+            array = values.map(self.codes).fillna(-1).to_numpy(np.int32)
+        elif self.kind == "datetime":
+            try:
+                # The datasets use ISO dates, which parse far faster than mixed formats
+                parsed = pd.to_datetime(values, format="ISO8601")
+            except (TypeError, ValueError):
+                parsed = pd.to_datetime(values, format="mixed", errors="coerce")
+            array = parsed.to_numpy("datetime64[ns]")
+        else:
+            array = values.to_numpy(self.kind)
+            if self.kind == "int64" and len(array):
+                self.low, self.high = min(self.low, int(array.min())), max(self.high, int(array.max()))
+        array.tofile(self._file)
+        self.rows += len(array)
+
+    def _narrow(self, written: np.dtype, dtype: np.dtype):
+        """Rewrites the file as ``dtype``, a chunk at a time."""
+        if self.rows == 0 or dtype == written:
+            return
+        source = np.memmap(self.path, dtype=written, mode="r", shape=(self.rows,))
+        with open(self.path + ".narrow", "wb") as f:
+            for start in range(0, self.rows, CHUNK_ROWS):
+                source[start:start + CHUNK_ROWS].astype(dtype).tofile(f)
+        del source
+        os.replace(self.path + ".narrow", self.path)
+
+    def close(self) -> Dict[str, Any]:
+        self._file.close()
+        spec = {"name": self.name, "kind": self.kind or "float64"}
+        if self.kind == "category":
+            spec["categories"] = list(self.codes)
+            dtype = _narrowest(-1, len(self.codes), (np.int8, np.int16, np.int32))
+            self._narrow(np.dtype(np.int32), dtype)
+            spec["dtype"] = dtype.name
+        elif self.kind == "int64":
+            dtype = _narrowest(self.low, self.high)
+            self._narrow(np.dtype(np.int64), dtype)
+            spec["dtype"] = dtype.name
+        return spec
+
+
+def _snapshot_name(stat: os.stat_result) -> str:
+    return f"v{FORMAT_VERSION}-{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def _prune(root: str, keep: str):
+    """Deletes every snapshot but ``keep`` and the newest one before it.
+
+    Columns are mapped lazily, so a reader that opened the previous snapshot
+    (a live API worker or a backtest process) still needs its files; each
+    reader switches to the new snapshot on its next ``open_table``, by which
+    time the snapshot after this one is the earliest that can prune it.
+    """
+    older = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name != keep and not name.startswith(".") and os.path.isdir(path):
+            older.append((os.stat(path).st_mtime_ns, name))
+    for _, name in sorted(older)[:-1]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def convert(csv_path: str, chunk_rows: int = CHUNK_ROWS) -> ColumnarTable:
+    """Writes the columnar snapshot of ``csv_path`` in bounded-memory chunks and returns it."""
+    stat = os.stat(csv_path)
+    root = csv_path + ".cols"
+    target = os.path.join(root, _snapshot_name(stat))
+    os.makedirs(root, exist_ok=True)
+
+    # Build in a scratch directory and rename it into place, so readers and
+    # other processes converting the same file never see a partial snapshot
+    staging = tempfile.mkdtemp(dir=root, prefix=".staging-")
+    try:
+        writers = None
+        rows = 0
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+            if writers is None:
+                writers = [_ColumnWriter(name, os.path.join(staging, _column_file(i))) for i, name in enumerate(chunk.columns)]
+            for writer, name in zip(writers, chunk.columns):
+                writer.write(chunk[name])
+            rows += len(chunk)
+        if writers is None:
+            writers = [
+                _ColumnWriter(name, os.path.join(staging, _column_file(i)))
+                for i, name in enumerate(pd.read_csv(csv_path, nrows=0).columns)
+            ]
+        meta = {
+            "source": os.path.abspath(csv_path),
+            "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns,
+            "rows": rows,
+            "columns": [writer.close() for writer in writers]
+        }
+        with open(os.path.join(staging, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Another process finished the same snapshot first
+            if not os.path.exists(os.path.join(target, META_FILE)):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    _prune(root, keep=os.path.basename(target))
+    logger.info(f"Converted {csv_path} to columnar format: {rows} rows")
+    return ColumnarTable(target)
+
+
+_tables: Dict[str, ColumnarTable] = {}
+_tables_lock = threading.Lock()
+
+
+def open_table(csv_path: str) -> ColumnarTable:
+    """The up-to-date columnar snapshot of a CSV, converting it first if the CSV changed."""
+    stat = os.stat(csv_path)
+    directory = os.path.join(csv_path + ".cols", _snapshot_name(stat))
+    with _tables_lock:
+        table = _tables.get(csv_path)
+        if table is not None and table.directory == directory:
+            return table
+        if os.path.exists(os.path.join(directory, META_FILE)):
+            table = ColumnarTable(directory)
+        else:
+            table = convert(csv_path)
+        _tables[csv_path] = table
+        return table
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    for path in sys.argv[1:]:
+        table = open_table(path)
+        print(f"{path}: {len(table)} rows -> {table.directory}")
+
+
+if __name__ == "__main__":
+    main()
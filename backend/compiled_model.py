@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from itertools import product
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledModel:
+    """CatBoost oblivious-tree ensemble evaluated directly with NumPy.
+
+    The model's trees are exported once at load. Float splits become index and
+    border arrays, and every split on a categorical feature (CTRs, one-hot) is
+    resolved ahead of time for each known category combination by asking
+    CatBoost itself for the leaf indexes of a probe pool. A prediction is then
+    a gather, a compare and a table lookup over preallocated per-thread
+    buffers, with no DataFrame or Pool involved.
+
+    Only the category values given at construction are supported; callers use
+    ``category_codes`` to check and fall back to the Pool path otherwise.
+    """
+
+    def __init__(self, model, categories: Dict[str, Sequence[str]]):
+        self.model = model
+        feature_names = list(model.feature_names_)
+        cat_indices = list(model.get_cat_feature_indices())
+        self.cat_features = [feature_names[i] for i in cat_indices]
+        self.float_features = [name for i, name in enumerate(feature_names) if i not in cat_indices]
+        self.categories = {name: list(categories[name]) for name in self.cat_features}
+        self._codes = [{value: code for code, value in enumerate(self.categories[name])} for name in self.cat_features]
+
+        spec = self._export(model)
+        float_positions = {
+            feature["feature_index"]: self.float_features.index(feature["feature_id"])
+            for feature in spec["features_info"].get("float_features", [])
+        }
+        trees = spec["oblivious_trees"]
+        n_trees = len(trees)
+        depth = max(len(tree["splits"]) for tree in trees)
+        dummy = len(self.float_features)  # always 0.0 with an infinite border, so it never sets a bit
+
+        self._split_features = np.full((n_trees, depth), dummy, dtype=np.int64)
+        self._split_borders = np.full((n_trees, depth), np.inf, dtype=np.float32)
+        category_bits = np.zeros((n_trees, depth), dtype=bool)
+        leaf_values = np.zeros((n_trees, 2 ** depth), dtype=np.float64)
+        for t, tree in enumerate(trees):
+            for d, split in enumerate(tree["splits"]):
+                if split["split_type"] == "FloatFeature":
+                    self._split_features[t, d] = float_positions[split["float_feature_index"]]
+                    self._split_borders[t, d] = split["border"]
+                else:
+                    category_bits[t, d] = True
+            leaf_values[t, :len(tree["leaf_values"])] = tree["leaf_values"]
+
+        self._pow2 = (1 << np.arange(depth)).astype(np.int64)
+        self._leaf_offsets = np.arange(n_trees, dtype=np.int64) * 2 ** depth
+        self._leaf_values = leaf_values.ravel()
+        scale, bias = spec.get("scale_and_bias", [1.0, [0.0]])
+        self._scale = float(scale)
+        self._bias = float(bias[0] if isinstance(bias, list) else bias)
+        self._ctr_masks = self._resolve_category_splits(feature_names, category_bits)
+        self._local = threading.local()
+
+    @staticmethod
+    def _export(model) -> dict:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "model.json")
+            model.save_model(path, format="json")
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+
+    def _resolve_category_splits(self, feature_names: List[str], category_bits: np.ndarray) -> np.ndarray:
+        """Leaf-index bits contributed by categorical splits, for every category combination."""
+        from catboost import Pool
+
+        combos = list(product(*(self.categories[name] for name in self.cat_features)))
+        probe = pd.DataFrame({
+            name: [combo[self.cat_features.index(name)] for combo in combos] if name in self.cat_features
+            else np.zeros(len(combos))
+            for name in feature_names
+        })
+        leaf_indexes = self.model.calc_leaf_indexes(Pool(probe, cat_features=self.cat_features)).astype(np.int64)
+        masks = leaf_indexes & (category_bits * self._pow2).sum(axis=1)
+        shape = tuple(len(self.categories[name]) for name in self.cat_features)
+        return np.ascontiguousarray(masks.reshape(shape + (masks.shape[1],)))
+
+    def category_codes(self, values: Sequence[str]) -> Optional[Tuple[int, ...]]:
+        """Codes for one row's categorical values (in ``cat_features`` order), or None if any is unknown."""
+        codes = []
+        for lookup, value in zip(self._codes, values):
+            code = lookup.get(value)
+            if code is None:
+                return None
+            codes.append(code)
+        return tuple(codes)
+
+    def _buffers(self):
+        local = self._local
+        if not hasattr(local, "row"):
+            n_trees, depth = self._split_features.shape
+            local.row = np.zeros(len(self.float_features) + 1, dtype=np.float32)
+            local.gathered = np.empty((n_trees, depth), dtype=np.float32)
+            local.bits = np.empty((n_trees, depth), dtype=np.int64)
+            local.leaf = np.empty(n_trees, dtype=np.int64)
+            local.values = np.empty(n_trees, dtype=np.float64)
+        return local
+
+    def predict_one(self, codes: Tuple[int, ...], float_values: Sequence[float]) -> float:
+        """Predicts one row; ``float_values`` are in ``float_features`` order."""
+        b = self._buffers()
+        b.row[:-1] = float_values
+        np.take(b.row, self._split_features, out=b.gathered)
+        np.greater(b.gathered, self._split_borders, out=b.bits)
+        np.dot(b.bits, self._pow2, out=b.leaf)
+        np.bitwise_or(b.leaf, self._ctr_masks[codes], out=b.leaf)
+        np.add(b.leaf, self._leaf_offsets, out=b.leaf)
+        np.take(self._leaf_values, b.leaf, out=b.values)
+        return self._bias + self._scale * float(b.values.sum())
+
+    def predict_matrix(self, codes: np.ndarray, float_values: np.ndarray) -> np.ndarray:
+        """Predicts many rows: ``codes`` is (n_rows, n_cat_features), ``float_values`` is (n_rows, n_float_features)."""
+        n_rows = len(float_values)
+        rows = np.zeros((n_rows, len(self.float_features) + 1), dtype=np.float32)
+        rows[:, :-1] = float_values
+        bits = rows[:, self._split_features] > self._split_borders
+        leaf = bits.astype(np.int64) @ self._pow2
+        leaf |= self._ctr_masks[tuple(codes.T)]
+        leaf += self._leaf_offsets
+        return self._bias + self._scale * self._leaf_values[leaf].sum(axis=1)
+
+    def encode_frame(self, features: pd.DataFrame) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(codes, float_values) for a feature frame, or None if it holds an unknown category."""
+        codes = np.empty((len(features), len(self.cat_features)), dtype=np.int64)
+        for i, name in enumerate(self.cat_features):
+            column = features[name].map(self._codes[i])
+            if column.isna().any():
+                return None
+            codes[:, i] = column.to_numpy(dtype=np.int64)
+        return codes, features[self.float_features].to_numpy(dtype=np.float32)
+
+    def validate(self, n_rows: int = 512, tolerance: float = 1e-6, seed: int = 0) -> float:
+        """Compares against CatBoost's own predictions on random rows; raises ValueError on a mismatch."""
+        from catboost import Pool
+
+        rng = np.random.default_rng(seed)
+        codes = np.column_stack([rng.integers(0, len(self.categories[name]), n_rows) for name in self.cat_features])
+        # Sample each float feature around its split borders so every branch is exercised
+        float_values = np.zeros((n_rows, len(self.float_features)), dtype=np.float32)
+        for f in range(len(self.float_features)):
+            borders = self._split_borders[self._split_features == f]
+            low, high = (borders.min() - 1, borders.max() + 1) if len(borders) else (0.0, 1.0)
+            float_values[:, f] = rng.uniform(low, high, n_rows)
+
+        frame = pd.DataFrame(float_values, columns=self.float_features)
+        for i, name in enumerate(self.cat_features):
+            frame[name] = np.asarray(self.categories[name], dtype=object)[codes[:, i]]
+        frame = frame[list(self.model.feature_names_)]
+
+        expected = self.model.predict(Pool(frame, cat_features=self.cat_features))
+        error = float(np.abs(self.predict_matrix(codes, float_values) - expected).max())
+        if error > tolerance:
+            raise ValueError(f"Compiled model differs from CatBoost by {error}")
+        return error
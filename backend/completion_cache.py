@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from metrics import inc
+from shared_state import StateBackend
+
+logger = logging.getLogger(__name__)
+
+
+def round_floats(value: Any, ndigits: int = 1) -> Any:
+    """Recursively rounds floats so near-identical inputs map to the same cache key."""
+    if isinstance(value, float):
+        return round(value, ndigits)
+    if isinstance(value, dict):
+        return {k: round_floats(v, ndigits) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [round_floats(v, ndigits) for v in value]
+    if hasattr(value, "item"):  # numpy scalars
+        return round_floats(value.item(), ndigits)
+    return value
+
+
+class CompletionCache:
+    """Content-addressed cache for generated LLM text.
+
+    Entries live in an in-memory LRU with a TTL. With a shared ``backend`` they
+    are also written there, so they survive restarts and a completion generated
+    by one worker is served by all of them.
+    """
+
+    NAMESPACE = "completion"
+
+    def __init__(self, ttl_seconds: float = 3600, max_entries: int = 1024, backend: Optional[StateBackend] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.backend = backend
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], temperature: float, inputs: Any = None) -> str:
+        payload = json.dumps(
+            {
+                "model": model,
+                "temperature": temperature,
+                "messages": messages,
+                "inputs": round_floats(inputs)
+            },
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                inc("cache_requests_total", cache="completion", result="hit")
+                return entry[1]
+            if entry:
+                del self._entries[key]
+
+        if self.backend is not None:
+            try:
+                value = self.backend.get(self.NAMESPACE, key)
+            except Exception as e:
+                logger.error(f"Failed to read shared completion cache: {str(e)}")
+                value = None
+            if value is not None:
+                with self._lock:
+                    # The shared entry's own expiry is not returned; keep the local copy for a full TTL at most
+                    self._store(key, value, now + self.ttl_seconds)
+                    self.hits += 1
+                inc("cache_requests_total", cache="completion", result="hit")
+                return value
+
+        with self._lock:
+            self.misses += 1
+            inc("cache_requests_total", cache="completion", result="miss")
+            return None
+
+    def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self.backend is not None:
+            try:
+                self.backend.set(self.NAMESPACE, key, value, ttl_seconds=self.ttl_seconds)
+            except Exception as e:
+                logger.error(f"Failed to persist completion cache entry: {str(e)}")
+
+    def _store(self, key: str, value: str, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self._entries),
+                "persistent": self.backend is not None
+            }
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ComponentRegistry:
+    """Lazily constructed application components.
+
+    Each component is built by its factory on first use (or by a background
+    warmup), so importing the app does not pay for the model, datasets or
+    API clients. Load times and failures are recorded for the readiness check.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        """Returns the component, building it on first use. Safe to call from many threads."""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._locks[name]:
+            if name not in self._instances:
+                started = time.perf_counter()
+                try:
+                    self._instances[name] = self._factories[name]()
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    logger.error(f"Failed to load component {name}: {str(e)}", exc_info=True)
+                    raise
+                self._load_seconds[name] = round(time.perf_counter() - started, 4)
+                self._errors.pop(name, None)
+                logger.info(f"Loaded component {name} in {self._load_seconds[name]}s")
+        return self._instances[name]
+
+    async def aget(self, name: str) -> Any:
+        """Like get(), but builds an unloaded component in a worker thread so the event loop keeps serving."""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, name)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def peek(self, name: str) -> Optional[Any]:
+        """Returns the component only if it is already loaded."""
+        return self._instances.get(name)
+
+    async def warmup(self, names: Iterable[str]):
+        """Loads components one after another in the background; failures are recorded, not raised."""
+        for name in names:
+            try:
+                await self.aget(name)
+            except Exception:
+                pass
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "loaded": name in self._instances,
+                "load_seconds": self._load_seconds.get(name),
+                "error": self._errors.get(name)
+            }
+            for name in self._factories
+        }
@@ -0,0 +1,98 @@
+import functools
+
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_FEATURES = ["Region", "Crop"]
+# Non-categorical model inputs, in model order
+FLOAT_FEATURES = [
+    "Rainfall (mm)", "Temperature (°C)", "Fertilizer Cost (PHP/kg)", "Fuel Price (PHP/liter)",
+    "Pest Outbreak", "Market Demand (1-10)", "Month", "Year", "Quarter", "DayOfYear",
+    "Rainfall_Temperature", "Fertilizer_Fuel_Ratio"
+]
+FEATURE_COLUMNS = CATEGORICAL_FEATURES + FLOAT_FEATURES
+TARGET_COLUMN = "Price per kg"
+
+# placeholder values for inputs the API does not observe at prediction time
+DEFAULT_FERTILIZER_COST = 30
+DEFAULT_FUEL_PRICE = 60
+DEFAULT_MARKET_DEMAND = 5
+
+
+@functools.lru_cache(maxsize=1024)
+def day_key(date) -> str:
+    """ISO day of a request date; request dates repeat all day, so each distinct string is parsed only once."""
+    return pd.Timestamp(pd.to_datetime(date)).date().isoformat()
+
+
+def weather_inputs(weather_data, date):
+    """(rainfall, temperature) model inputs for ``date`` from a parsed forecast.
+
+    Days inside the daily forecast get that day's precipitation sum and mean
+    temperature; other days fall back to the current conditions.
+    """
+    daily = weather_data.get("daily") or {}
+    dates = daily.get("date") or []
+    day = day_key(date)
+    if day in dates and "temperature_mean" in daily:
+        index = dates.index(day)
+        return daily["precipitation_sum"][index], daily["temperature_mean"][index]
+    current = weather_data["current"]
+    return current["precipitation"], current["temperature"]
+
+
+def _labels(values):
+    # Categoricals from the columnar snapshot are passed through instead of expanded into strings
+    if isinstance(values, pd.Series):
+        return values.array
+    if isinstance(values, pd.Categorical):
+        return values
+    return list(values)
+
+
+def derive_features(dates, regions, crops, rainfall, temperature, fertilizer_cost, fuel_price, pest_outbreak, market_demand):
+    """The model's feature frame from raw inputs; shared by training and prediction.
+
+    ``dates``, ``regions`` and ``crops`` are per row; every other input may be
+    per row or a scalar applied to all rows.
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.DatetimeIndex(dates)
+    else:
+        dates = pd.DatetimeIndex(pd.to_datetime(list(dates), format="mixed"))
+    n_rows = len(dates)
+
+    def column(value):
+        return np.broadcast_to(np.asarray(value, dtype=np.float64), (n_rows,))
+
+    rainfall, temperature = column(rainfall), column(temperature)
+    fertilizer_cost, fuel_price = column(fertilizer_cost), column(fuel_price)
+
+    return pd.DataFrame({
+        "Region": _labels(regions),
+        "Crop": _labels(crops),
+        "Rainfall (mm)": rainfall,
+        "Temperature (°C)": temperature,
+        "Fertilizer Cost (PHP/kg)": fertilizer_cost,
+        "Fuel Price (PHP/liter)": fuel_price,
+        "Pest Outbreak": np.broadcast_to(np.asarray(pest_outbreak, dtype=np.int64), (n_rows,)),
+        "Market Demand (1-10)": np.broadcast_to(np.asarray(market_demand, dtype=np.int64), (n_rows,)),
+        "Month": dates.month.to_numpy(),
+        "Year": dates.year.to_numpy(),
+        "Quarter": dates.quarter.to_numpy(),
+        "DayOfYear": dates.dayofyear.to_numpy(),
+        "Rainfall_Temperature": rainfall * temperature,
+        "Fertilizer_Fuel_Ratio": fertilizer_cost / fuel_price
+    })
+
+
+def training_frame(data: pd.DataFrame):
+    """(features, target) from rows shaped like philippines_crop_prices_mock_data.csv."""
+    pest_outbreak = data["Pest Outbreak"].map({"No": 0, "Yes": 1}).fillna(data["Pest Outbreak"]).astype(np.int64)
+    features = derive_features(
+        data["Date"], data["Region"], data["Crop"],
+        data["Rainfall (mm)"], data["Temperature (°C)"],
+        data["Fertilizer Cost (PHP/kg)"], data["Fuel Price (PHP/liter)"],
+        pest_outbreak, data["Market Demand (1-10)"]
+    )
+    return features, data[TARGET_COLUMN].to_numpy(dtype=np.float64)
@@ -0,0 +1,144 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from features import day_key, weather_inputs
+from metrics import inc, timed
+from regional_weather import resolve_region
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastGrid:
+    """Materialized crop x region x next-N-days price table.
+
+    The grid is rebuilt from each new regional weather snapshot in one
+    batched model call. Only (region, day) cells whose weather inputs changed
+    since the last refresh are recomputed, and serving a price is a
+    dictionary lookup.
+    """
+
+    def __init__(self, predictor, crops: List[str], regions: List[str], days: int = 7, max_age_seconds: float = 3 * 3600):
+        self.predictor = predictor
+        self.crops = list(crops)
+        self.regions = list(regions)
+        self.days = days
+        self.max_age_seconds = max_age_seconds
+        self._table = {}  # (crop, region, date) -> base price, keys lowercased
+        self._inputs = {}  # (region, date) -> (rainfall, temperature) used for those cells
+        self._weather = {}  # region -> (weather_data, weather risk record)
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def _inputs_for_days(self, weather_data: Dict[str, Any], dates: List[str]) -> List[tuple]:
+        # Each day gets its own daily forecast, exactly as predict_single_price gives it to the model,
+        # so a grid hit and a live prediction return the same price
+        return [weather_inputs(weather_data, date) for date in dates]
+
+    @timed("forecast_grid_refresh")
+    def refresh(self, weather_by_region: Dict[str, Dict[str, Any]], today=None) -> int:
+        """Recomputes the cells whose weather inputs changed; returns how many were recomputed.
+
+        ``weather_by_region`` maps region names to forecasts; regions without a
+        successful forecast are left out of the grid and served live.
+        """
+        today = pd.Timestamp(today or pd.Timestamp.now()).normalize()
+        dates = [(today + pd.Timedelta(days=day)).date().isoformat() for day in range(self.days)]
+
+        inputs = {}
+        weather = {}
+        for region in self.regions:
+            weather_data = weather_by_region.get(region)
+            if not weather_data or weather_data.get("status") != "success":
+                continue
+            for date, day_inputs in zip(dates, self._inputs_for_days(weather_data, dates)):
+                inputs[(region.lower(), date)] = (region, day_inputs)
+            weather[region.lower()] = (weather_data, self.predictor.analyze_weather_impact(weather_data))
+
+        changed = [
+            (region, date, day_inputs) for (_, date), (region, day_inputs) in inputs.items()
+            if self._inputs.get((region.lower(), date)) != day_inputs
+        ]
+        new_cells = {}
+        if changed:
+            rows = list(itertools.product(changed, self.crops))
+            row_dates = [cell[1] for cell, _ in rows]
+            row_regions = [cell[0] for cell, _ in rows]
+            row_crops = [crop for _, crop in rows]
+            rainfall = np.array([cell[2][0] for cell, _ in rows], dtype=np.float64)
+            temperature = np.array([cell[2][1] for cell, _ in rows], dtype=np.float64)
+
+            features = self.predictor.build_feature_frame(
+                row_dates, row_crops, row_regions, None, rainfall=rainfall, temperature=temperature
+            )
+            base_prices = self.predictor.predict_frame(features)
+            new_cells = {
+                (crop.lower(), region.lower(), date): float(price)
+                for date, crop, region, price in zip(row_dates, row_crops, row_regions, base_prices)
+            }
+
+        with self._lock:
+            self._table = {key: price for key, price in self._table.items() if (key[1], key[2]) in inputs}
+            self._table.update(new_cells)
+            self._inputs = {key: day_inputs for key, (_, day_inputs) in inputs.items()}
+            self._weather = weather
+            self._refreshed_at = time.monotonic()
+
+        logger.info(f"Forecast grid refreshed: {len(new_cells)} of {len(self._table)} cells recomputed")
+        return len(new_cells)
+
+    def invalidate(self):
+        """Drops every cell, e.g. after a model swap; lookups fall back to live predictions until the next refresh."""
+        with self._lock:
+            self._table = {}
+            self._inputs = {}
+
+    def lookup(self, date, crop: str, region: str) -> Optional[Dict[str, Any]]:
+        """Returns a predict_single_price-shaped result from the grid, or None if the cell is missing or stale."""
+        day = day_key(date)
+        # Aliases such as "Region IV-A" share the cells of the region they name
+        region = resolve_region(region) or region
+        with self._lock:
+            base_price = None
+            if self._refreshed_at is not None and time.monotonic() - self._refreshed_at <= self.max_age_seconds:
+                base_price = self._table.get((crop.lower(), region.lower(), day))
+            if base_price is None:
+                inc("cache_requests_total", cache="forecast_grid", result="miss")
+                return None
+            weather_data, risk = self._weather[region.lower()]
+        inc("cache_requests_total", cache="forecast_grid", result="hit")
+
+        return {
+            "status": "success",
+            "weather_data": weather_data,
+            "weather_analysis": risk["label"],
+            "weather_risk": risk,
+            "prediction": {
+                "crop": crop,
+                "region": region,
+                "date": date,
+                "base_price": round(base_price, 2),
+                "adjusted_price": round(base_price * risk["multiplier"], 2)
+            }
+        }
+
+    def predict_price(self, date, crop: str, region: str) -> Dict[str, Any]:
+        """Serves a price from the grid, falling back to a live prediction for cells it does not hold."""
+        result = self.lookup(date, crop, region)
+        if result is not None:
+            return result
+        return self.predictor.predict_single_price(date, crop, region)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cells": len(self._table),
+                "regions": len(self._weather),
+                "days": sorted({date for _, date in self._inputs}),
+                "age_seconds": round(time.monotonic() - self._refreshed_at, 1) if self._refreshed_at else None
+            }
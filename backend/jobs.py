@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from shared_state import StateBackend
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+def _owner_alive(pid: Optional[int]) -> bool:
+    """Whether the worker process that took a job is still running.
+
+    Called before this process submits anything, so a record carrying its own
+    pid was left by an earlier process that had the same pid.
+    """
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """Job records kept in memory, optionally mirrored to a shared backend.
+
+    With a backend, results survive restarts and any worker can answer a status
+    check for a job that another worker is running.
+    """
+
+    NAMESPACE = "jobs"
+
+    def __init__(self, max_jobs: int = 10000, backend: Optional[StateBackend] = None):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()  # job_id -> record
+        self._lock = threading.Lock()
+        self.backend = backend
+
+    def save(self, record: Dict[str, Any]):
+        with self._lock:
+            self._jobs[record["job_id"]] = record
+            self._jobs.move_to_end(record["job_id"])
+            self._evict()
+        if self.backend is not None:
+            try:
+                self.backend.set(self.NAMESPACE, record["job_id"], json.dumps(record, default=str))
+            except Exception as e:
+                logger.error(f"Failed to persist job {record['job_id']}: {str(e)}")
+
+    def _evict(self):
+        # Drop the oldest finished jobs first; queued and running jobs are never evicted
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id]["status"] in (SUCCEEDED, FAILED):
+                del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._jobs.get(job_id)
+        if record is None and self.backend is not None:
+            # Jobs submitted to another worker (or before a restart) are only in the backend
+            value = self.backend.get(self.NAMESPACE, job_id)
+            if value is not None:
+                record = json.loads(value)
+        return record
+
+    def fail_orphans(self) -> int:
+        """Marks queued and running jobs whose worker process is gone as failed; returns how many.
+
+        The queue itself lives in the memory of the worker that accepted the
+        job, so after a restart or a worker crash nothing would ever pick those
+        records up again and they would read as queued forever.
+        """
+        if self.backend is None:
+            return 0
+        orphans = []
+        for _, value in self.backend.entries(self.NAMESPACE):
+            record = json.loads(value)
+            if record["status"] in (QUEUED, RUNNING) and not _owner_alive(record.get("owner_pid")):
+                orphans.append(record)
+        for record in orphans:
+            self.save(dict(
+                record, status=FAILED, error="The worker running this job stopped; submit it again.",
+                finished_at=time.time()
+            ))
+        if orphans:
+            logger.warning(f"Marked {len(orphans)} orphaned jobs as failed")
+        return len(orphans)
+
+    def list(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._jobs.values())[-limit:]
+
+
+class JobQueue:
+    """Bounded queue of async jobs executed by a fixed pool of worker tasks."""
+
+    def __init__(self, workers: int = 4, max_queue: int = 1000, store: Optional[JobStore] = None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.store = store or JobStore()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self._queue = None
+        self._worker_tasks = []
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        if not self._worker_tasks:
+            self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def start(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.store.fail_orphans)
+        self._ensure_started()
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(self, kind: str, func: Callable[..., Awaitable[Any]], **params) -> Dict[str, Any]:
+        """Queues ``func(**params)`` and returns the new job record."""
+        self._ensure_started()
+        record = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": QUEUED,
+            "owner_pid": os.getpid(),
+            "params": params,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None
+        }
+        try:
+            self._queue.put_nowait((record, func))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.max_queue} jobs waiting)")
+
+        self.store.save(record)
+        self.submitted += 1
+        return record
+
+    async def _worker(self, worker_id: int):
+        while True:
+            record, func = await self._queue.get()
+            record = dict(record, status=RUNNING, started_at=time.time())
+            self.store.save(record)
+            self.running += 1
+            try:
+                result = await func(**record["params"])
+                record = dict(record, status=SUCCEEDED, result=result, finished_at=time.time())
+                self.completed += 1
+            except Exception as e:
+                logger.error(f"Job {record['job_id']} failed on worker {worker_id}: {str(e)}", exc_info=True)
+                record = dict(record, status=FAILED, error=str(e), finished_at=time.time())
+                self.failed += 1
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+            self.store.save(record)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "running": self.running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed
+        }
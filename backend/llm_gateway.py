@@ -0,0 +1,322 @@
+import asyncio
+import logging
+import os
+import random
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
+
+from admission import acquire_upstream
+from coalesce import Coalescer
+from completion_cache import CompletionCache
+from metrics import inc, span
+from shared_state import shared_backend
+
+# openai and httpx are imported on first use so importing this module stays cheap
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+DEFAULT_MODEL = "deepseek/deepseek-r1-zero:free"
+DEFAULT_HEADERS = {
+    "HTTP-Referer": "https://farm-assist.example.com",
+    "X-Title": "Farm Assistant API"
+}
+
+_retryable_errors = None
+
+
+def retryable_errors() -> tuple:
+    """Errors worth retrying: the request never completed or the upstream is overloaded."""
+    global _retryable_errors
+    if _retryable_errors is None:
+        import openai
+        _retryable_errors = (
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.RateLimitError,
+            openai.InternalServerError,
+        )
+    return _retryable_errors
+
+
+class LLMGateway:
+    """Shared async client for all OpenRouter chat completions.
+
+    Holds one pooled HTTP connection, caps the number of completions in flight
+    with a semaphore and retries transient failures with exponential backoff,
+    so slow completions never block the event loop.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = OPENROUTER_BASE_URL,
+        max_concurrency: int = 8,
+        timeout_seconds: float = 60.0,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        cache: Optional[CompletionCache] = None
+    ):
+        self.api_key = api_key if api_key is not None else os.getenv("OPENROUTER_API_KEY")
+        if not self.api_key:
+            logger.warning("OPENROUTER_API_KEY environment variable not set. AI functionality will be limited.")
+
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.cache = cache
+        self._client = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.flights = Coalescer("completion", ttl_seconds=0)
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        if self._client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                timeout=self.timeout_seconds
+            )
+            self._client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key or "",
+                default_headers=DEFAULT_HEADERS,
+                http_client=http_client,
+                max_retries=0  # retries are handled here so they respect the semaphore
+            )
+        return self._client
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0.7,
+        timeout_seconds: Optional[float] = None
+    ) -> Any:
+        """Runs one chat completion under the concurrency limit, retrying transient errors."""
+        timeout = timeout_seconds or self.timeout_seconds
+        attempt = 0
+        while True:
+            # Every attempt, retries included, spends an OpenRouter token, so retries cannot multiply a spike
+            await acquire_upstream("openrouter")
+            try:
+                async with self._semaphore:
+                    with span("llm"):
+                        completion = await self.client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            temperature=temperature,
+                            stream=False,
+                            timeout=timeout
+                        )
+                record_usage(completion, model)
+                return completion
+            except retryable_errors() as e:
+                inc("upstream_errors_total", upstream="openrouter", error=type(e).__name__)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random())
+                attempt += 1
+                logger.warning(f"LLM call failed ({type(e).__name__}), retrying in {delay:.2f}s ({attempt}/{self.max_retries})")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                inc("upstream_errors_total", upstream="openrouter", error=type(e).__name__)
+                raise
+
+    async def complete_text(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0.7,
+        cache_inputs: Any = None,
+        use_reasoning: bool = False,
+        timeout_seconds: Optional[float] = None
+    ) -> Optional[str]:
+        """Returns the completion text, serving repeated (model, prompt, inputs) from the cache.
+
+        Identical requests that arrive while the first is still running wait
+        for its completion instead of sending their own.
+        """
+        key = CompletionCache.make_key(model, messages, temperature, cache_inputs)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        async def generate():
+            completion = await self.complete(messages, model=model, temperature=temperature, timeout_seconds=timeout_seconds)
+            content = extract_content(completion, use_reasoning=use_reasoning)
+            if content and self.cache is not None:
+                self.cache.set(key, content)
+            return content
+
+        return await self.flights.run((key, use_reasoning), generate)
+
+    async def stream_text(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0.7,
+        cache_inputs: Any = None,
+        use_reasoning: bool = False,
+        timeout_seconds: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Yields completion text as it arrives; a cached completion is yielded in one piece."""
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(model, messages, temperature, cache_inputs)
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        timeout = timeout_seconds or self.timeout_seconds
+        attempt = 0
+        content_parts = []
+        reasoning_parts = []
+        async with self._semaphore:
+            while True:
+                await acquire_upstream("openrouter")
+                try:
+                    with span("llm_stream_open"):
+                        stream = await self.client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            temperature=temperature,
+                            stream=True,
+                            timeout=timeout
+                        )
+                    break
+                except retryable_errors() as e:
+                    # Only opening the stream is retried; once tokens flow they are final
+                    inc("upstream_errors_total", upstream="openrouter", error=type(e).__name__)
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random())
+                    attempt += 1
+                    logger.warning(f"LLM stream failed ({type(e).__name__}), retrying in {delay:.2f}s ({attempt}/{self.max_retries})")
+                    await asyncio.sleep(delay)
+                except Exception as e:
+                    inc("upstream_errors_total", upstream="openrouter", error=type(e).__name__)
+                    raise
+
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                text = getattr(delta, "content", None)
+                if text:
+                    content_parts.append(text)
+                    yield text
+                elif use_reasoning:
+                    reasoning = getattr(delta, "reasoning", None)
+                    if reasoning:
+                        reasoning_parts.append(reasoning)
+
+        content = "".join(content_parts)
+        if not content and reasoning_parts:
+            content = "".join(reasoning_parts)
+            yield content
+        if content and key is not None:
+            self.cache.set(key, content)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+def record_usage(completion: Any, model: str):
+    """Adds the completion's token usage, when the provider reports it, to the token counters."""
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens:
+            inc("llm_tokens_total", tokens, model=model, kind=kind.split("_")[0])
+
+
+def extract_content(completion: Any, use_reasoning: bool = False) -> Optional[str]:
+    """Safely pulls the message text out of a completion object or dict."""
+    choices = getattr(completion, "choices", None)
+    if choices is None and isinstance(completion, dict):
+        choices = completion.get("choices")
+    if not choices:
+        return None
+
+    choice = choices[0]
+    if isinstance(choice, dict):
+        message = choice.get("message") or {}
+        content = message.get("content")
+        if not content and use_reasoning:
+            content = message.get("reasoning")
+        return content
+
+    message = getattr(choice, "message", None)
+    if not message:
+        return None
+    content = getattr(message, "content", None)
+    if not content and use_reasoning:
+        content = getattr(message, "reasoning", None)
+    return content
+
+
+def clean_boxed(text: str) -> str:
+    """Removes the \\boxed{...} wrapper some reasoning models put around their answer."""
+    return text.replace("\\boxed", "").replace("{", "").replace("}", "").strip()
+
+
+class BoxedStreamCleaner:
+    """Applies clean_boxed to a token stream without waiting for the full text.
+
+    A chunk ending in a partial "\\boxed" marker is held back until the next
+    chunk shows whether it really was the marker.
+    """
+
+    MARKER = "\\boxed"
+
+    def __init__(self):
+        self._pending = ""
+        self._started = False
+
+    def feed(self, chunk: str) -> str:
+        text = (self._pending + chunk).replace(self.MARKER, "")
+        self._pending = ""
+        for size in range(min(len(self.MARKER) - 1, len(text)), 0, -1):
+            if self.MARKER.startswith(text[-size:]):
+                self._pending = text[-size:]
+                text = text[:-size]
+                break
+        return self._emit(text)
+
+    def flush(self) -> str:
+        text, self._pending = self._pending, ""
+        return self._emit(text).rstrip()
+
+    def _emit(self, text: str) -> str:
+        text = text.replace("{", "").replace("}", "")
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+
+_llm_gateway = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Returns the process-wide LLMGateway, creating it on first use."""
+    global _llm_gateway
+    if _llm_gateway is None:
+        # Shared with the other workers when COMPLETION_CACHE_PATH or a shared STATE_BACKEND is set
+        _llm_gateway = LLMGateway(cache=CompletionCache(backend=shared_backend(os.getenv("COMPLETION_CACHE_PATH"))))
+    return _llm_gateway
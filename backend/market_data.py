@@ -0,0 +1,218 @@
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from columnar import ColumnarTable, is_mapped, open_table
+
+logger = logging.getLogger(__name__)
+
+BUYERS_FILE = "fictional_buyers_dataset.csv"
+CROP_PRICES_FILE = "philippines_crop_prices_mock_data.csv"
+
+
+def _file_mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _recode(codes: np.ndarray, lookup: np.ndarray) -> np.ndarray:
+    """Maps stored dictionary codes through ``lookup``; when it is the identity the mapped array is used as is."""
+    if np.array_equal(lookup, np.arange(len(lookup))):
+        return codes
+    return lookup.astype(codes.dtype)[codes]
+
+
+class MarketDataStore:
+    """Buyers and crop prices loaded once into indexed, columnar form.
+
+    Both files are read through their memory-mapped columnar snapshots (see
+    columnar.py). Prices are kept as NumPy arrays with dictionary-encoded
+    Crop/Region codes, and the (crop, region) and (crop) average prices are
+    precomputed so a price lookup is a dictionary hit. Buyers are row views
+    over the buyer table, indexed by crop interest. Files are reloaded
+    automatically when their modification time changes.
+    """
+
+    def __init__(self, buyers_file_path: str = BUYERS_FILE, crop_prices_file_path: str = CROP_PRICES_FILE):
+        self.buyers_file_path = buyers_file_path
+        self.crop_prices_file_path = crop_prices_file_path
+        self._lock = threading.Lock()
+        self._mtimes = (None, None)
+
+        self.buyer_table: Optional[ColumnarTable] = None
+        self.buyers: Sequence[Dict[str, Any]] = []
+        self.buyers_by_crop: Dict[str, np.ndarray] = {}
+        self.crops = np.array([], dtype=object)
+        self.regions = np.array([], dtype=object)
+        self.crop_names = np.array([], dtype=object)
+        self.region_names = np.array([], dtype=object)
+        self.crop_codes = np.array([], dtype=np.int32)
+        self.region_codes = np.array([], dtype=np.int32)
+        self.prices = np.array([], dtype=np.float64)
+        self.crop_region_avg: Dict[Tuple[str, str], float] = {}
+        self.crop_avg: Dict[str, float] = {}
+        # Changes whenever either file is reloaded; the same in every worker for the same files
+        self.version = ""
+
+        self.reload()
+
+    def reload(self):
+        """Reloads both files if either one changed since the last load."""
+        mtimes = (_file_mtime(self.buyers_file_path), _file_mtime(self.crop_prices_file_path))
+        with self._lock:
+            if mtimes == self._mtimes:
+                return
+            buyer_table, buyers, buyers_by_crop = self._load_buyers(self.buyers_file_path)
+            price_columns = self._load_prices(self.crop_prices_file_path)
+
+            self.buyer_table, self.buyers, self.buyers_by_crop = buyer_table, buyers, buyers_by_crop
+            (self.crops, self.regions, self.crop_names, self.region_names, self.crop_codes,
+             self.region_codes, self.prices, self.crop_region_avg, self.crop_avg) = price_columns
+            self._mtimes = mtimes
+            self.version = f"{mtimes[0]}:{mtimes[1]}"
+            logger.info(f"Market data loaded: {len(self.buyers)} buyers, {len(self.prices)} price rows")
+
+    def _load_buyers(self, file_path: str):
+        try:
+            table = open_table(file_path)
+        except FileNotFoundError:
+            logger.error(f"Error: The file {file_path} was not found.")
+            return None, [], {}
+        except Exception as e:
+            logger.error(f"Error loading data from {file_path}: {str(e)}")
+            return None, [], {}
+
+        # Group row numbers by lower-cased crop interest straight from the dictionary codes,
+        # as int32 arrays: 4 bytes per buyer instead of a list slot and an int object
+        codes = np.asarray(table.array("Crop Interest"))
+        interests = [value.lower() for value in table.categories("Crop Interest")]
+        order = np.argsort(codes, kind="stable").astype(np.int32)
+        bounds = np.searchsorted(codes[order], np.arange(len(interests) + 1))
+        buyers_by_crop = {}
+        for code, interest in enumerate(interests):
+            rows = order[bounds[code]:bounds[code + 1]]
+            if interest in buyers_by_crop:
+                rows = np.sort(np.concatenate([buyers_by_crop[interest], rows]))
+            buyers_by_crop[interest] = rows
+        return table, table.rows(), buyers_by_crop
+
+    def buyer_frame(self, columns: List[str]) -> pd.DataFrame:
+        """Buyer columns as a DataFrame over the mapped table, without building row dicts."""
+        if self.buyer_table is None:
+            return pd.DataFrame(columns=columns)
+        return self.buyer_table.to_frame(columns)
+
+    def _load_prices(self, file_path: str):
+        try:
+            table = open_table(file_path)
+            crop_values = table.array("Crop")
+            region_values = table.array("Region")
+            crop_categories = table.categories("Crop")
+            region_categories = table.categories("Region")
+            prices = np.asarray(table.column("Price per kg"), dtype=np.float64)
+        except FileNotFoundError:
+            logger.error(f"Error: The file {file_path} was not found.")
+            crop_values = region_values = np.array([], dtype=np.int32)
+            crop_categories, region_categories = [], []
+            prices = np.array([], dtype=np.float64)
+        except Exception as e:
+            logger.error(f"Error loading data from {file_path}: {str(e)}")
+            crop_values = region_values = np.array([], dtype=np.int32)
+            crop_categories, region_categories = [], []
+            prices = np.array([], dtype=np.float64)
+
+        valid = ~np.isnan(prices) & (crop_values >= 0) & (region_values >= 0)
+        # Re-key the stored dictionaries case-insensitively; only the small category lists are touched
+        crop_lookup, crops = pd.factorize(pd.Index(crop_categories, dtype=object).str.lower())
+        region_lookup, regions = pd.factorize(pd.Index(region_categories, dtype=object).str.lower())
+        crop_codes = _recode(crop_values, crop_lookup)
+        region_codes = _recode(region_values, region_lookup)
+        crops = np.asarray(crops, dtype=object)
+        regions = np.asarray(regions, dtype=object)
+
+        # Keep the original spelling of each code for callers that feed the model
+        crop_names = np.asarray(crop_categories, dtype=object)[np.unique(crop_lookup, return_index=True)[1]]
+        region_names = np.asarray(region_categories, dtype=object)[np.unique(region_lookup, return_index=True)[1]]
+
+        # Aggregate sums and counts per (crop, region) cell in one pass
+        n_regions = max(len(regions), 1)
+        cells = crop_codes[valid].astype(np.int64) * n_regions + region_codes[valid]
+        n_cells = len(crops) * n_regions
+        cell_sums = np.bincount(cells, weights=prices[valid], minlength=n_cells).reshape(-1, n_regions)
+        cell_counts = np.bincount(cells, minlength=n_cells).reshape(-1, n_regions)
+
+        crop_region_avg = {}
+        for crop_code, region_code in zip(*np.nonzero(cell_counts)):
+            crop_region_avg[(crops[crop_code], regions[region_code])] = float(
+                cell_sums[crop_code, region_code] / cell_counts[crop_code, region_code]
+            )
+
+        crop_avg = {}
+        crop_sums = cell_sums.sum(axis=1)
+        crop_counts = cell_counts.sum(axis=1)
+        for crop_code in np.nonzero(crop_counts)[0]:
+            crop_avg[crops[crop_code]] = float(crop_sums[crop_code] / crop_counts[crop_code])
+
+        return (crops, regions, crop_names, region_names, crop_codes, region_codes,
+                prices, crop_region_avg, crop_avg)
+
+    def average_price(self, crop: str, region: Optional[str] = None) -> Optional[float]:
+        """Average price per kg for a crop, optionally within a region."""
+        if region:
+            return self.crop_region_avg.get((crop.lower(), region.lower()))
+        return self.crop_avg.get(crop.lower())
+
+    def buyers_for_crops(self, crops: List[str]) -> List[Dict[str, Any]]:
+        """Buyers whose crop interest matches any of the given crops."""
+        indices = [self.buyers_by_crop[crop] for crop in dict.fromkeys(crop.lower() for crop in crops) if crop in self.buyers_by_crop]
+        if not indices:
+            return []
+        return [self.buyers[i] for i in np.sort(np.concatenate(indices)).tolist()]
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """Bytes held for buyers and price rows. Mapped bytes are file pages shared by every worker."""
+        buyers = len(self.buyers)
+        buyer_mapped = self.buyer_table.nbytes() if self.buyer_table is not None else 0
+        buyer_index = sum(rows.nbytes for rows in self.buyers_by_crop.values())
+        price_rows = len(self.prices)
+        # Codes and prices are the mapped columns themselves unless a recode or cast had to copy them
+        price_arrays = [self.crop_codes, self.region_codes, self.prices]
+        price_mapped = sum(array.nbytes for array in price_arrays if is_mapped(array))
+        price_copied = sum(array.nbytes for array in price_arrays if not is_mapped(array))
+        return {
+            "buyers": {
+                "rows": buyers,
+                "mapped_bytes": buyer_mapped,
+                "index_bytes": buyer_index,
+                "bytes_per_buyer": round((buyer_mapped + buyer_index) / buyers, 1) if buyers else None
+            },
+            "prices": {
+                "rows": price_rows,
+                "mapped_bytes": price_mapped,
+                "copied_bytes": price_copied,
+                "bytes_per_row": round((price_mapped + price_copied) / price_rows, 1) if price_rows else None
+            }
+        }
+
+
+_stores: Dict[Tuple[str, str], MarketDataStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_market_data(buyers_file_path: str = BUYERS_FILE, crop_prices_file_path: str = CROP_PRICES_FILE) -> MarketDataStore:
+    """Returns the shared store for a pair of files, reloading it if either file changed."""
+    key = (buyers_file_path, crop_prices_file_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = MarketDataStore(buyers_file_path, crop_prices_file_path)
+            _stores[key] = store
+            return store
+    store.reload()
+    return store
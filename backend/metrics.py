@@ -0,0 +1,237 @@
+import asyncio
+import contextvars
+import functools
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PREFIX = "farm_"
+# Seconds; covers dictionary lookups through multi-second LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (span name, milliseconds) recorded during the current request, when tracing is on
+_request_trace: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_trace", default=None
+)
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(label_key, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in label_key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+    """In-process counters and histograms rendered in the Prometheus text format.
+
+    Everything is kept in plain dictionaries behind one lock, so recording a
+    sample is a dictionary update and there is no dependency on a metrics
+    client library. Gauges are read from callbacks when the metrics are rendered.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, Histogram]] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def add_gauge(self, name: str, callback: Callable[[], Any], help_text: str = ""):
+        """Registers a gauge read at render time; ``callback`` returns a number or a {labels: value} dict."""
+        self._gauges[name] = callback
+        if help_text:
+            self._help[name] = help_text
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and histogram summaries as plain data, e.g. for JSON reports."""
+        with self._lock:
+            return {
+                "counters": {
+                    name: {_format_labels(key) or "total": value for key, value in series.items()}
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: {
+                        _format_labels(key) or "total": {"count": h.count, "sum": round(h.sum, 6)}
+                        for key, h in series.items()
+                    }
+                    for name, series in self._histograms.items()
+                }
+            }
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                self._header(lines, name, "counter")
+                for key, value in series.items():
+                    lines.append(f"{PREFIX}{name}{_format_labels(key)} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                self._header(lines, name, "histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = 'le="%s"' % bound
+                        lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, le)} {cumulative}")
+                    le = 'le="+Inf"'
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, le)} {histogram.count}")
+                    lines.append(f"{PREFIX}{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{PREFIX}{name}_count{_format_labels(key)} {histogram.count}")
+
+        for name, callback in sorted(self._gauges.items()):
+            try:
+                value = callback()
+            except Exception:
+                continue
+            self._header(lines, name, "gauge")
+            if isinstance(value, dict):
+                for labels, sample in value.items():
+                    lines.append(f"{PREFIX}{name}{_format_labels(_label_key(dict(labels)))} {sample}")
+            else:
+                lines.append(f"{PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name, kind):
+        if name in self._help:
+            lines.append(f"# HELP {PREFIX}{name} {self._help[name]}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+
+registry = MetricsRegistry()
+registry.describe("span_duration_seconds", "Time spent in instrumented hot-path sections.")
+registry.describe("http_request_duration_seconds", "End-to-end HTTP request latency.")
+registry.describe("cache_requests_total", "Cache lookups by cache and result (hit/miss).")
+registry.describe("llm_tokens_total", "LLM tokens used, by kind (prompt/completion).")
+registry.describe("upstream_errors_total", "Failed calls to upstream APIs.")
+
+
+# Fields of /proc/self/status reported by process_memory (values there are in kB)
+_MEMORY_FIELDS = {"VmRSS": "resident", "RssAnon": "anonymous", "RssFile": "file", "VmHWM": "peak"}
+
+
+def process_memory() -> Dict[str, int]:
+    """Resident bytes of this process: total, anonymous (heap), file-backed (mapped files) and peak.
+
+    Where /proc is not available only the peak is known, from getrusage.
+    """
+    usage = {}
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in _MEMORY_FIELDS:
+                    usage[_MEMORY_FIELDS[name]] = int(value.split()[0]) * 1024
+    except OSError:
+        try:
+            import resource
+        except ImportError:
+            return usage
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage["peak"] = peak if sys.platform == "darwin" else peak * 1024
+    return usage
+
+
+def inc(name: str, value: float = 1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    registry.observe(name, value, **labels)
+
+
+@contextmanager
+def span(name: str):
+    """Times the enclosed block into the span histogram and the current request trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe("span_duration_seconds", elapsed, span=name)
+        trace = _request_trace.get()
+        if trace is not None:
+            trace.append((name, elapsed * 1000))
+
+
+def timed(name: str):
+    """Decorator form of span() for sync and async functions."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_trace() -> List[Tuple[str, float]]:
+    """Starts collecting spans for the current request (its context and the tasks it spawns)."""
+    trace = []
+    _request_trace.set(trace)
+    return trace
+
+
+def server_timing(trace: List[Tuple[str, float]], total_ms: Optional[float] = None) -> str:
+    """Formats a trace as a Server-Timing header value; repeated spans are summed."""
+    totals: Dict[str, List[float]] = {}
+    for name, ms in trace:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += ms
+        entry[1] += 1
+    parts = [
+        f"{name};dur={ms:.2f}" + (f';desc="x{count}"' if count > 1 else "")
+        for name, (ms, count) in totals.items()
+    ]
+    if total_ms is not None:
+        parts.append(f"total;dur={total_ms:.2f}")
+    return ", ".join(parts)
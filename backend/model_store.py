@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+BUNDLED_MODEL = "price_predictor.cbm"
+CURRENT_FILE = "CURRENT"
+
+
+def _write_atomic(path: str, text: str):
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class ModelStore:
+    """Versioned model artifacts on disk.
+
+    Each version is a directory ``<root>/<version>/`` holding ``model.cbm`` and
+    ``metadata.json`` (metrics, parameters, training rows). The version the API
+    serves is named in ``<root>/CURRENT``, which is replaced atomically on
+    promote, so a running API never sees a half-written model. Without any
+    promoted version the bundled ``price_predictor.cbm`` is served.
+    """
+
+    def __init__(self, root: str = MODEL_DIR, bundled_model: str = BUNDLED_MODEL):
+        self.root = root
+        self.bundled_model = bundled_model
+        self._lock = threading.Lock()
+
+    def save(self, model, metadata: Dict[str, Any]) -> str:
+        """Writes a new version and returns its name; it is not served until promoted."""
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            version = stamp
+            suffix = 1
+            while os.path.exists(os.path.join(self.root, version)):
+                suffix += 1
+                version = f"{stamp}-{suffix}"
+
+            # Build the version in a scratch directory and rename it into place in one step
+            staging = tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+            model.save_model(os.path.join(staging, "model.cbm"))
+            metadata = dict(metadata, version=version, created_at=datetime.now(timezone.utc).isoformat())
+            with open(os.path.join(staging, "metadata.json"), "w", encoding="utf-8") as f:
+                json.dump(metadata, f, indent=2, default=str)
+            os.rename(staging, os.path.join(self.root, version))
+
+        logger.info(f"Saved model version {version}")
+        return version
+
+    def _check(self, version: str):
+        # Only names the store itself lists, so a version can never point outside the store
+        if version not in self.list_versions() or not os.path.exists(os.path.join(self.root, version, "model.cbm")):
+            raise FileNotFoundError(f"Model version {version} does not exist")
+
+    def promote(self, version: str):
+        self._check(version)
+        _write_atomic(os.path.join(self.root, CURRENT_FILE), version + "\n")
+        logger.info(f"Promoted model version {version}")
+
+    def restore(self, version: Optional[str]):
+        """Points CURRENT back at ``version`` after a failed promotion; None restores the bundled model."""
+        if version is None:
+            try:
+                os.remove(os.path.join(self.root, CURRENT_FILE))
+            except FileNotFoundError:
+                pass
+        else:
+            _write_atomic(os.path.join(self.root, CURRENT_FILE), version + "\n")
+        logger.info(f"Restored model version {version or 'bundled'}")
+
+    def current_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def model_path(self, version: Optional[str] = None) -> str:
+        if version is not None:
+            self._check(version)
+        version = version or self.current_version()
+        if version is None:
+            return self.bundled_model
+        return os.path.join(self.root, version, "model.cbm")
+
+    def metadata(self, version: Optional[str] = None) -> Dict[str, Any]:
+        version = version or self.current_version()
+        if version is None:
+            return {"version": None, "path": self.bundled_model}
+        with open(os.path.join(self.root, version, "metadata.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def list_versions(self) -> List[str]:
+        """Names of every saved version, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if not name.startswith(".") and os.path.isfile(os.path.join(self.root, name, "metadata.json"))
+        )
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """Metadata of every saved version, oldest first."""
+        return [self.metadata(name) for name in self.list_versions()]
@@ -1,87 +1,176 @@
+import functools
+import itertools
+import logging
+import os
+import numpy as np
 import pandas as pd
 from catboost import CatBoostRegressor, Pool
-from weather import get_weather_forecast
+from regional_weather import get_region_forecast, resolve_region
+from weather_risk import assess_forecasts
+from columnar import open_table
+from compiled_model import CompiledModel
+from features import (
+    CATEGORICAL_FEATURES, FLOAT_FEATURES, DEFAULT_FERTILIZER_COST, DEFAULT_FUEL_PRICE, DEFAULT_MARKET_DEMAND,
+    derive_features, weather_inputs
+)
+from metrics import span, timed
+from model_store import ModelStore
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES_FILE = "philippines_crop_prices_mock_data.csv"
+
+
+@functools.lru_cache(maxsize=1024)
+def _date_parts(date):
+    timestamp = pd.Timestamp(pd.to_datetime(date))
+    return timestamp.month, timestamp.year, timestamp.quarter, timestamp.dayofyear
+
+
+def _valid_date(date):
+    try:
+        _date_parts(date)
+    except (ValueError, TypeError, OverflowError):
+        return False
+    return True
+
 
 class CropsPricePredictor:
-    def __init__(self):
-        self.model = CatBoostRegressor()
-        self.model.load_model("price_predictor.cbm")
+    def __init__(self, categories_file=CATEGORIES_FILE, fast_path=None, store=None):
+        self.categories_file = categories_file
+        self.fast_path = os.getenv("FAST_PREDICT", "1") != "0" if fast_path is None else fast_path
+        self.store = store or ModelStore()
+        self.version = None
+        self.load_model()
+
+    def load_model(self, version=None):
+        """Loads a model version (default: the store's current one) and swaps it in for new predictions.
+
+        The new model and its compiled fast path are fully built before the
+        swap, so requests in flight finish on the model they started with.
+        """
+        return self.install(self.prepare_model(version))
+
+    def prepare_model(self, version=None, validate=False):
+        """Loads a model version without serving it; returns the state ``install`` takes.
+
+        With ``validate`` the compiled form must match CatBoost's predictions,
+        and a mismatch raises instead of falling back to the Pool path.
+        """
+        version = version or self.store.current_version()
+        model = CatBoostRegressor()
+        model.load_model(self.store.model_path(version))
+        fast = self._compile(model, strict=validate) if self.fast_path or validate else None
+        return model, fast if self.fast_path else None, version or "bundled"
+
+    def install(self, loaded):
+        """Serves a model prepared by ``prepare_model``, or the previous ``state()``."""
+        self.model, self.fast, self.version = loaded
+        logger.info(f"Serving price model {self.version}")
+        return self.version
+
+    def state(self):
+        return self.model, self.fast, self.version
+
+    def _compile(self, model, strict=False):
+        """Builds the NumPy fast path for the regions and crops in the training data, or None if it cannot be trusted."""
+        try:
+            known = open_table(self.categories_file)
+            fast = CompiledModel(model, {name: sorted(known.categories(name)) for name in CATEGORICAL_FEATURES})
+            if fast.float_features != FLOAT_FEATURES:
+                raise ValueError(f"Unexpected model features: {fast.float_features}")
+            fast.validate()
+            return fast
+        except Exception as e:
+            if strict:
+                raise
+            logger.warning(f"Fast prediction path disabled, using CatBoost Pool: {str(e)}")
+            return None
+
+    @timed("features")
+    def build_feature_frame(self, dates, crops, regions, weather_data, rainfall=None, temperature=None):
+        """Builds a columnar feature matrix for parallel lists of dates, crops and regions.
+
+        ``rainfall`` and ``temperature`` may be given per row; by default each
+        row uses the forecast for its date from ``weather_data``.
+        """
+        if rainfall is None or temperature is None:
+            inputs = np.array([weather_inputs(weather_data, date) for date in dates], dtype=np.float64).reshape(-1, 2)
+            rainfall = inputs[:, 0] if rainfall is None else rainfall
+            temperature = inputs[:, 1] if temperature is None else temperature
+        pest_outbreak = np.asarray(rainfall, dtype=np.float64) > 5
+
+        return derive_features(
+            dates, regions, crops, rainfall, temperature,
+            DEFAULT_FERTILIZER_COST, DEFAULT_FUEL_PRICE, pest_outbreak, DEFAULT_MARKET_DEMAND
+        )
 
     def generate_input_features(self, date, crop, region, weather_data):
-        date = pd.to_datetime(date)
-        month = date.month
-        year = date.year
-        quarter = date.quarter
-        day_of_year = date.dayofyear
-
-        pest_outbreak = 1 if weather_data['current']['precipitation'] > 5 else 0
-        rainfall = weather_data['current']['precipitation']
-        temp = weather_data['current']['temperature']
-        rainfall_temp = rainfall * temp
-
-        # placeholder values for fertilizer cost and fuel price
-        fertilizer_cost = 30
-        fuel_price = 60
-        fert_fuel_ratio = fertilizer_cost / fuel_price
-
-        features = pd.DataFrame([{
-            "Region": region,
-            "Crop": crop,
-            "Rainfall (mm)": rainfall,
-            "Temperature (°C)": temp,
-            "Fertilizer Cost (PHP/kg)": fertilizer_cost,  
-            "Fuel Price (PHP/liter)": fuel_price,
-            "Pest Outbreak": pest_outbreak,
-            "Market Demand (1-10)": 5, 
-            "Month": month,
-            "Year": year,
-            "Quarter": quarter,
-            "DayOfYear": day_of_year,
-            "Rainfall_Temperature": rainfall_temp,
-            "Fertilizer_Fuel_Ratio": fert_fuel_ratio
-        }])
-
-        return features
+        return self.build_feature_frame([date], [crop], [region], weather_data)
     
     def analyze_weather_impact(self, weather_data):
+        """The forecast's weather risk record (level, label, scores, price multiplier and indicators).
+
+        Forecasts from the weather service are scored when they are fetched;
+        any other forecast is scored here from its hourly and daily lists.
+        """
         if weather_data["status"] == "error":
-            return "Unable to analyze weather impact due to weather data error"
-        
-        hourly = weather_data["hourly"]
-        avg_precipitation = sum(hourly["precipitation"]) / len(hourly["precipitation"])
-        max_wind_speed = max(hourly["wind_speed"])
-
-        if avg_precipitation > 10 or max_wind_speed > 30:
-            return "Severe weather conditions detected - possible typhoon threat"
-        elif avg_precipitation > 5:
-            return "Moderate rain expected - minor market impact"
-        else:
-            return "Normal weather conditions"
+            return None
+        return weather_data.get("risk") or assess_forecasts([weather_data])[0]
+
+    def predict_fast(self, date, crop, region, rainfall, temperature):
+        """One prediction through the compiled model; None when the fast path cannot serve this row."""
+        fast = self.fast
+        if fast is None:
+            return None
+        codes = fast.category_codes((region, crop))
+        if codes is None:
+            return None
+        month, year, quarter, day_of_year = _date_parts(date)
+        pest_outbreak = 1 if rainfall > 5 else 0
+        return fast.predict_one(codes, (
+            rainfall, temperature, DEFAULT_FERTILIZER_COST, DEFAULT_FUEL_PRICE, pest_outbreak, DEFAULT_MARKET_DEMAND,
+            month, year, quarter, day_of_year, rainfall * temperature, DEFAULT_FERTILIZER_COST / DEFAULT_FUEL_PRICE
+        ))
+
+    def predict_frame(self, features):
+        """Runs the model once over a feature frame and returns the base prices."""
+        fast = self.fast
+        encoded = fast.encode_frame(features) if fast is not None else None
+        if encoded is not None:
+            with span("model_predict"):
+                return fast.predict_matrix(*encoded)
+
+        with span("pool"):
+            pool = Pool(features, cat_features=["Crop", "Region"])
+        with span("model_predict"):
+            return self.model.predict(pool)
 
     def predict_single_price(self, date, crop, region):
-        weather_data = get_weather_forecast()
+        # Aliases such as "Region IV-A" are priced as the region they name, not as an unseen category
+        region = resolve_region(region) or region
+        with span("weather"):
+            weather_data = get_region_forecast(region)
         if weather_data['status'] == 'error':
             return {
                 "status": "error",
                 "message": "Weather data not available."
             }
 
-        features = self.generate_input_features(date, crop, region, weather_data)
-        prediction_pool = Pool(features, cat_features=["Crop", "Region"])
-        
-        base_price = self.model.predict(prediction_pool)[0]
-        adjusted_price = base_price
-    
-        weather_impact = self.analyze_weather_impact(weather_data)
-        if "typhoon" in weather_impact.lower():
-            adjusted_price *= 1.15  
-        elif "rain" in weather_impact.lower():
-            adjusted_price *= 1.05 
+        with span("model_predict"):
+            rainfall, temperature = weather_inputs(weather_data, date)
+            base_price = self.predict_fast(date, crop, region, rainfall, temperature)
+        if base_price is None:
+            features = self.generate_input_features(date, crop, region, weather_data)
+            base_price = self.predict_frame(features)[0]
+        risk = self.analyze_weather_impact(weather_data)
+        adjusted_price = base_price * risk["multiplier"]
 
         return {
             "status": "success",
             "weather_data": weather_data,
-            "weather_analysis": weather_impact,
+            "weather_analysis": risk["label"],
+            "weather_risk": risk,
             "prediction": {
                 "crop": crop,
                 "region": region,
@@ -90,3 +179,76 @@ class CropsPricePredictor:
                 "adjusted_price": round(adjusted_price, 2)
             }
         }
+
+    def predict_batch(self, items=None, date=None, crops=None, regions=None):
+        """Predicts prices for many rows with one regional weather snapshot and a single model call.
+
+        Pass either ``items`` as (date, crop, region) tuples, or ``date`` with
+        ``crops`` and ``regions`` to price the full crop x region grid.
+        """
+        rows = list(items or [])
+        for index, (row_date, _, _) in enumerate(rows):
+            if not _valid_date(row_date):
+                return {
+                    "status": "error",
+                    "message": f"Invalid date {row_date!r} in item {index}.",
+                    "index": index
+                }
+        if crops and regions:
+            if not _valid_date(date):
+                return {
+                    "status": "error",
+                    "message": f"Invalid date {date!r}."
+                }
+            rows.extend((date, crop, region) for crop, region in itertools.product(crops, regions))
+        if not rows:
+            return {
+                "status": "error",
+                "message": "No prediction rows given."
+            }
+
+        rows = [(row_date, crop, resolve_region(region) or region) for row_date, crop, region in rows]
+        dates, row_crops, row_regions = zip(*rows)
+
+        # Every region is served from the same bulk weather snapshot
+        with span("weather"):
+            weather_by_region = {region: get_region_forecast(region) for region in set(row_regions)}
+        if any(weather_data['status'] == 'error' for weather_data in weather_by_region.values()):
+            return {
+                "status": "error",
+                "message": "Weather data not available."
+            }
+        risk_by_region = {
+            region: self.analyze_weather_impact(weather_data) for region, weather_data in weather_by_region.items()
+        }
+
+        inputs = np.array(
+            [weather_inputs(weather_by_region[region], row_date) for row_date, region in zip(dates, row_regions)],
+            dtype=np.float64
+        )
+        rainfall, temperature = inputs[:, 0], inputs[:, 1]
+        multipliers = np.array([risk_by_region[region]["multiplier"] for region in row_regions])
+
+        features = self.build_feature_frame(dates, row_crops, row_regions, None, rainfall=rainfall, temperature=temperature)
+        base_prices = self.predict_frame(features)
+        adjusted_prices = base_prices * multipliers
+
+        predictions = [
+            {
+                "crop": crop,
+                "region": region,
+                "date": row_date,
+                "weather_analysis": risk_by_region[region]["label"],
+                "weather_risk_score": risk_by_region[region]["score"],
+                "base_price": round(float(base_price), 2),
+                "adjusted_price": round(float(adjusted_price), 2)
+            }
+            for (row_date, crop, region), base_price, adjusted_price
+            in zip(rows, base_prices, adjusted_prices)
+        ]
+
+        return {
+            "status": "success",
+            "count": len(predictions),
+            "predictions": predictions
+        }
@@ -0,0 +1,248 @@
+import io
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from columnar import open_table
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+CROP_PRICES_FILE = "philippines_crop_prices_mock_data.csv"
+STATS_COLUMNS = ["Date", "Crop", "Region", "Price per kg"]
+GRANULARITIES = ["month", "quarter", "year", "month_of_year", "all"]
+# Periods averaged by each granularity's rolling mean
+ROLLING_WINDOWS = {"month": 3, "quarter": 4, "year": 3}
+ALL_REGIONS = "*"
+
+
+def _periods(dates: pd.Series, granularity: str) -> pd.Series:
+    """Sortable integer period codes; grouping on these is much cheaper than on formatted dates."""
+    if granularity == "month":
+        return dates.dt.year * 100 + dates.dt.month
+    if granularity == "quarter":
+        return dates.dt.year * 10 + dates.dt.quarter
+    if granularity == "year":
+        return dates.dt.year
+    if granularity == "month_of_year":
+        return dates.dt.month
+    return pd.Series(0, index=dates.index)
+
+
+def _period_label(code: int, granularity: str) -> str:
+    if granularity == "month":
+        return f"{code // 100}-{code % 100:02d}"
+    if granularity == "quarter":
+        return f"{code // 10}-Q{code % 10}"
+    if granularity == "year":
+        return str(code)
+    if granularity == "month_of_year":
+        return f"{code:02d}"
+    return "all"
+
+
+def _summarize(frame: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """count, mean, median, p10, p90, min and max of price for every group in one groupby."""
+    grouped = frame.groupby(keys, sort=True)["price"]
+    stats = grouped.agg(["count", "mean", "median", "min", "max"])
+    quantiles = grouped.quantile([0.1, 0.9]).unstack()
+    stats["p10"] = quantiles[0.1]
+    stats["p90"] = quantiles[0.9]
+    return stats
+
+
+def _rolling_mean(cumulative: np.ndarray, positions: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over up to ``window`` values from per-group running sums and positions within each group."""
+    rows = np.arange(len(cumulative))
+    full = positions >= window
+    dropped = np.where(full, cumulative[np.where(full, rows - window, 0)], 0.0)
+    return (cumulative - dropped) / np.minimum(positions + 1, window)
+
+
+class PriceStatsCube:
+    """Historical price statistics precomputed per crop x region x period.
+
+    Every (crop, region, granularity) series is built once with vectorized
+    groupbys and stored in a dict, so a query is a lookup. ``refresh`` reads
+    only the bytes appended to the CSV since the last read (the first load comes
+    from the columnar snapshot) and recomputes the series of the (crop, region)
+    pairs the new rows touch. Region ``*`` holds
+    the crop across all regions.
+    """
+
+    def __init__(self, file_path: str = CROP_PRICES_FILE):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._size = 0
+        self._mtime = None
+        self._header: Optional[List[str]] = None
+        self._rows = pd.DataFrame({
+            "crop": pd.Series(dtype=object), "region": pd.Series(dtype=object),
+            "date": pd.Series(dtype="datetime64[ns]"), "price": pd.Series(dtype=np.float64)
+        })
+        self._series: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        self._index: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+        self.refresh()
+
+    @property
+    def rows(self) -> int:
+        return len(self._rows)
+
+    def _read_new_rows(self) -> Optional[pd.DataFrame]:
+        """Rows appended since the last read, or None when the file was replaced rather than appended to."""
+        if self._header is None:
+            return self._read_snapshot()
+        stat = os.stat(self.file_path)
+        if stat.st_size < self._size or (stat.st_size == self._size and stat.st_mtime != self._mtime):
+            return None
+        self._mtime = stat.st_mtime
+        if stat.st_size == self._size:
+            return pd.DataFrame(columns=self._rows.columns)
+        with open(self.file_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        # Only consume complete lines; a row still being written is picked up next time
+        end = data.rfind(b"\n") + 1
+        chunk = data[:end]
+        self._offset += end
+        self._size = self._offset
+        if not chunk.strip():
+            return pd.DataFrame(columns=self._rows.columns)
+
+        raw = pd.read_csv(io.BytesIO(chunk), names=self._header, usecols=STATS_COLUMNS)
+        frame = pd.DataFrame({
+            "crop": raw["Crop"].astype(str).str.lower(),
+            "region": raw["Region"].astype(str).str.lower(),
+            "date": pd.to_datetime(raw["Date"], format="mixed", errors="coerce"),
+            "price": pd.to_numeric(raw["Price per kg"], errors="coerce")
+        })
+        return frame.dropna(subset=["date", "price"])
+
+    def _read_snapshot(self) -> pd.DataFrame:
+        """Every row of the file's columnar snapshot; later refreshes read the CSV from where it ends."""
+        table = open_table(self.file_path)
+        self._header = table.columns
+        self._offset = self._size = table.source_size
+        self._mtime = os.stat(self.file_path).st_mtime
+
+        def lowered(name):
+            categories = np.array([value.lower() for value in table.categories(name)] + [None], dtype=object)
+            return categories[table.array(name)]
+
+        frame = pd.DataFrame({
+            "crop": lowered("Crop"),
+            "region": lowered("Region"),
+            "date": table.array("Date"),
+            "price": table.array("Price per kg")
+        })
+        return frame.dropna()
+
+    @timed("price_stats_refresh")
+    def refresh(self) -> int:
+        """Folds rows appended to the file into the cube; returns how many were added."""
+        with self._lock:
+            try:
+                new_rows = self._read_new_rows()
+            except FileNotFoundError:
+                logger.error(f"Error: The file {self.file_path} was not found.")
+                return 0
+            if new_rows is None:
+                logger.info(f"{self.file_path} was rewritten; rebuilding price statistics")
+                self._offset = self._size = 0
+                self._mtime = self._header = None
+                self._rows = self._rows.iloc[:0]
+                self._series, self._index = {}, {}
+                new_rows = self._read_new_rows()
+            if len(new_rows) == 0:
+                return 0
+
+            touched = new_rows[["crop", "region"]].drop_duplicates()
+            self._rows = pd.concat([self._rows, new_rows], ignore_index=True)
+            if self._series:
+                affected = self._rows[self._rows["crop"].isin(touched["crop"])]
+                pairs = set(map(tuple, touched.to_numpy()))
+            else:
+                affected = self._rows
+                pairs = None
+            self._rebuild(affected, pairs)
+            logger.info(f"Price statistics updated with {len(new_rows)} rows ({len(self._rows)} total)")
+            return len(new_rows)
+
+    def _rebuild(self, rows: pd.DataFrame, pairs: Optional[set]):
+        """Recomputes the series for ``pairs`` (all pairs in ``rows`` if None) and their crop-wide series."""
+        series = dict(self._series)
+        index = dict(self._index)
+        if pairs is not None:
+            in_pairs = pd.MultiIndex.from_frame(rows[["crop", "region"]]).isin(list(pairs))
+            region_rows = rows[in_pairs]
+        else:
+            region_rows = rows
+        crop_rows = rows.assign(region=ALL_REGIONS)
+        both = pd.concat([region_rows, crop_rows], ignore_index=True)
+
+        for granularity in GRANULARITIES:
+            frame = both.assign(period=_periods(both["date"], granularity))
+            stats = _summarize(frame, ["crop", "region", "period"])
+            window = ROLLING_WINDOWS.get(granularity)
+            if window:
+                by_pair = stats.groupby(level=["crop", "region"], sort=False)["mean"]
+                stats["rolling_mean"] = _rolling_mean(by_pair.cumsum().to_numpy(), by_pair.cumcount().to_numpy(), window)
+                stats["change_pct"] = by_pair.pct_change() * 100
+            stats = stats.round(2)
+            stats["count"] = stats["count"].astype(int)
+
+            keys = list(zip(stats.index.get_level_values("crop"), stats.index.get_level_values("region")))
+            labels = {code: _period_label(int(code), granularity) for code in stats.index.unique(level="period")}
+            records = stats.reset_index(level=["crop", "region"], drop=True).rename_axis("period").reset_index()
+            records["period"] = records["period"].map(labels)
+            records = records.astype(object).where(records.notna(), None).to_dict("records")
+            grouped: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+            for key, record in zip(keys, records):
+                grouped.setdefault(key, []).append(record)
+            for (crop, region), entries in grouped.items():
+                key = (crop, region, granularity)
+                series[key] = entries
+                index[key] = {entry["period"]: i for i, entry in enumerate(entries)}
+
+        # Swap whole dicts so readers never see a half-updated cube
+        self._series, self._index = series, index
+
+    def stats(
+        self,
+        crop: str,
+        region: Optional[str] = None,
+        granularity: str = "month",
+        period: Optional[str] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """The period series for a crop (and region), or just one period; None if there is no data."""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        key = (crop.lower(), region.lower() if region else ALL_REGIONS, granularity)
+        series = self._series.get(key)
+        if series is None:
+            return None
+        if period is None:
+            return series
+        position = self._index[key].get(period)
+        return None if position is None else [series[position]]
+
+
+_cubes: Dict[str, PriceStatsCube] = {}
+_cubes_lock = threading.Lock()
+
+
+def get_price_stats(file_path: str = CROP_PRICES_FILE) -> PriceStatsCube:
+    """Returns the shared cube for a price file, folding in any rows appended since the last call."""
+    with _cubes_lock:
+        cube = _cubes.get(file_path)
+        if cube is None:
+            cube = PriceStatsCube(file_path)
+            _cubes[file_path] = cube
+            return cube
+    cube.refresh()
+    return cube
@@ -0,0 +1,97 @@
+import logging
+from typing import Any, Dict, Optional
+
+from weather import get_weather_service, get_weather_forecast
+
+logger = logging.getLogger(__name__)
+
+# Approximate regional centers for every Region in the price dataset
+REGION_COORDINATES = {
+    "Ilocos Region": (16.6159, 120.3166),
+    "Cagayan Valley": (17.6132, 121.7270),
+    "Central Luzon": (15.4828, 120.7120),
+    "CALABARZON": (14.1008, 121.0794),
+    "Bicol Region": (13.4210, 123.4137),
+    "Western Visayas": (10.7202, 122.5621),
+    "Central Visayas": (10.3157, 123.8854),
+    "Eastern Visayas": (11.2443, 125.0039),
+    "Zamboanga Peninsula": (7.8257, 123.4370),
+    "Northern Mindanao": (8.4542, 124.6319),
+    "Davao Region": (7.1907, 125.4553),
+    "SOCCSKSARGEN": (6.2706, 124.6856),
+}
+
+# Official region numbers people type in chat, e.g. "Region IV-A"
+REGION_ALIASES = {
+    "region i": "Ilocos Region",
+    "region ii": "Cagayan Valley",
+    "region iii": "Central Luzon",
+    "region iv-a": "CALABARZON",
+    "region v": "Bicol Region",
+    "region vi": "Western Visayas",
+    "region vii": "Central Visayas",
+    "region viii": "Eastern Visayas",
+    "region ix": "Zamboanga Peninsula",
+    "region x": "Northern Mindanao",
+    "region xi": "Davao Region",
+    "region xii": "SOCCSKSARGEN",
+}
+
+_REGIONS_BY_NAME = {name.lower(): name for name in REGION_COORDINATES}
+
+
+def resolve_region(region: str) -> Optional[str]:
+    """Maps a region name or alias to its key in REGION_COORDINATES."""
+    if not region:
+        return None
+    key = region.strip().lower()
+    return _REGIONS_BY_NAME.get(key) or REGION_ALIASES.get(key)
+
+
+class RegionalWeather:
+    """Per-region forecasts served from one bulk Open-Meteo snapshot covering all regions."""
+
+    def __init__(self, service=None, coordinates: Dict[str, tuple] = REGION_COORDINATES):
+        self.service = service or get_weather_service()
+        self.regions = list(coordinates)
+        self.locations = [coordinates[region] for region in self.regions]
+        latitudes, longitudes = zip(*self.locations)
+        self.key = self.service.locations_key(latitudes, longitudes)
+
+    def by_region(self, snapshot: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Splits a bulk snapshot into a region -> forecast mapping."""
+        if snapshot.get("status") != "success":
+            return {}
+        return dict(zip(self.regions, snapshot["locations"]))
+
+    def get_all(self) -> Dict[str, Dict[str, Any]]:
+        return self.by_region(self.service.get_forecasts(self.locations))
+
+    def get_region(self, region: str) -> Dict[str, Any]:
+        """Forecast for one region, falling back to the default location for unknown regions."""
+        name = resolve_region(region)
+        if name is None:
+            return get_weather_forecast()
+
+        snapshot = self.service.get_forecasts(self.locations)
+        if snapshot["status"] != "success":
+            return snapshot
+        return snapshot["locations"][self.regions.index(name)]
+
+    def warm(self):
+        return self.service.get_forecasts(self.locations)
+
+
+_regional_weather = None
+
+
+def get_regional_weather() -> RegionalWeather:
+    """Returns the process-wide RegionalWeather, creating it on first use."""
+    global _regional_weather
+    if _regional_weather is None:
+        _regional_weather = RegionalWeather()
+    return _regional_weather
+
+
+def get_region_forecast(region: str) -> Dict[str, Any]:
+    return get_regional_weather().get_region(region)
@@ -0,0 +1,146 @@
+"""Runs the API in several worker processes.
+
+    python serve.py --workers 4 --port 8000
+
+The parent imports the app and loads the datasets, the price statistics and
+the buyer ranker once, then forks the workers. They share those pages
+copy-on-write instead of each building its own copy. The price model is the
+exception: loading it validates the compiled fast path with CatBoost
+predictions, which starts CatBoost's native thread pool, and a child forked
+from a process with that pool running can deadlock in its first prediction.
+Each worker loads the model itself after the fork. All workers accept
+connections on one listening socket. A worker that dies is restarted, and
+SIGTERM or SIGINT stops them all.
+
+Request handling is stateless across workers. With more than one worker,
+STATE_BACKEND defaults to SQLite (``farm_state.db``). Jobs, generated
+initiatives, chat sessions and cached completions go there, so any worker can
+answer for them. MODEL_WATCH_SECONDS defaults to 10, so every worker converges on the
+promoted model version. Metrics (/metrics) are per worker.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import time
+
+logger = logging.getLogger(__name__)
+
+# Nothing here may run CatBoost: the workers are forked afterwards (see above)
+PRELOAD_COMPONENTS = ["market_data", "price_stats"]
+# Minimum time between restarts of one worker slot, so a crashing worker does not spin
+RESTART_DELAY_SECONDS = 1.0
+
+
+def preload(application):
+    """Builds the read-only components in the parent so the forked workers inherit them."""
+    from buyer_ranking import get_buyer_ranker
+
+    started = time.perf_counter()
+    for name in PRELOAD_COMPONENTS:
+        application.components.get(name)
+    get_buyer_ranker(application.components.get("market_data"))
+    logger.info(f"Preloaded {', '.join(PRELOAD_COMPONENTS)} and the buyer ranker in {time.perf_counter() - started:.1f}s")
+
+
+def run_worker(config, sock):
+    import uvicorn
+
+    # uvicorn installs its own handlers for a graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def supervise(config, sock, workers: int):
+    """Forks ``workers`` workers on ``sock`` and keeps that many running until told to stop."""
+    children = {}  # pid -> slot
+    last_start = {}
+    stopping = False
+
+    def spawn(slot):
+        delay = last_start.get(slot, 0) + RESTART_DELAY_SECONDS - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        last_start[slot] = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(config, sock)
+            except BaseException:
+                logger.exception(f"Worker {slot} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = slot
+        logger.info(f"Started worker {slot} (pid {pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(workers):
+        spawn(slot)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = children.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        logger.warning(f"Worker {slot} (pid {pid}) exited with status {status}; restarting it")
+        spawn(slot)
+    logger.info("All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Farm Assistant API from several worker processes.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-preload", action="store_true", help="let each worker load its components itself")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.workers > 1:
+        # Must be set before the app is imported: its stores pick their backend at import time
+        os.environ.setdefault("STATE_BACKEND", "sqlite:///farm_state.db")
+        os.environ.setdefault("MODEL_WATCH_SECONDS", "10")
+
+    import uvicorn
+
+    if not hasattr(os, "fork"):
+        # No fork (Windows): uvicorn's own workers each import and load everything themselves
+        logger.warning("os.fork is unavailable; starting uvicorn workers without preloading")
+        uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+        return
+
+    import app as application
+
+    if not args.no_preload:
+        preload(application)
+    config = uvicorn.Config(application.app, host=args.host, port=args.port, log_level=args.log_level)
+    sock = config.bind_socket()
+    # Keep the garbage collector from touching (and so copying) the preloaded objects in every worker
+    gc.freeze()
+
+    if args.workers <= 1:
+        run_worker(config, sock)
+    else:
+        supervise(config, sock, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Conversation sessions, so a chat turn reuses what earlier turns computed.
+
+A session holds one compact entry per (crop, region) the farmer asked about:
+the price prediction, the weather risk snapshot it used, the reply sent (if
+it was complete) and the top buyers as (buyer row, price, score) triples.
+Nothing bulky is kept. Forecast arrays are left out, and buyers are stored by
+their row in the buyer table rather than as full records. ``/confirm-sell`` takes its buyers
+from the session instead of ranking again, and asking about the same crop and
+region again within ``reuse_seconds`` answers from the session.
+
+Sessions are JSON strings in an in-memory LRU. Each expires ``ttl_seconds``
+after its last turn. The store is bounded by ``max_sessions``, by
+``max_bytes`` of stored JSON and by ``max_turns`` per session. With a shared
+``backend`` sessions are also written there, so a follow-up can land on any
+worker.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from metrics import inc
+from shared_state import StateBackend
+
+logger = logging.getLogger(__name__)
+
+# Session ids are generated here; anything longer is not one of ours
+MAX_SESSION_ID_LENGTH = 64
+
+
+def turn_key(crop: str, region: str) -> str:
+    return f"{crop.strip().lower()}|{region.strip().lower()}"
+
+
+def compact_turn(
+    date: str,
+    crop: str,
+    region: str,
+    price_prediction: Dict[str, Any],
+    message: Optional[str],
+    buyers: List[List[Any]],
+    market_version: str
+) -> Dict[str, Any]:
+    """The parts of a /live-model-test turn a later turn can reuse."""
+    risk = price_prediction.get("weather_risk") or {}
+    current = (price_prediction.get("weather_data") or {}).get("current") or {}
+    return {
+        "date": date,
+        "crop": crop,
+        "region": region,
+        "at": round(time.time(), 1),
+        "message": message,
+        "base_price": price_prediction["prediction"]["base_price"],
+        "adjusted_price": price_prediction["prediction"]["adjusted_price"],
+        "weather": {
+            "label": price_prediction["weather_analysis"],
+            "level": risk.get("level"),
+            "score": risk.get("score"),
+            "multiplier": risk.get("multiplier"),
+            "current": {name: round(float(value), 1) for name, value in current.items() if value is not None}
+        },
+        "market": market_version,
+        "buyers": buyers
+    }
+
+
+class SessionStore:
+    """TTL- and size-bounded sessions keyed by session id."""
+
+    NAMESPACE = "sessions"
+
+    def __init__(
+        self,
+        ttl_seconds: float = 1800,
+        max_sessions: int = 10000,
+        max_bytes: int = 32 * 1024 * 1024,
+        max_turns: int = 8,
+        reuse_seconds: float = 600,
+        backend: Optional[StateBackend] = None
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+        self.reuse_seconds = reuse_seconds
+        self.backend = backend
+        self.bytes = 0
+        self.evicted = 0
+        self._entries = OrderedDict()  # session id -> (expires_at, JSON, size in bytes)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def get(self, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """The session, or None if it is unknown or has expired."""
+        if not session_id or len(session_id) > MAX_SESSION_ID_LENGTH:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(session_id)
+                return json.loads(entry[1])
+            if entry:
+                self._remove(session_id)
+
+        if self.backend is not None:
+            try:
+                value = self.backend.get(self.NAMESPACE, session_id)
+            except Exception as e:
+                logger.error(f"Failed to read shared session: {str(e)}")
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._store(session_id, value, now + self.ttl_seconds)
+                return json.loads(value)
+        return None
+
+    @staticmethod
+    def _dumps(session: Dict[str, Any]) -> str:
+        return json.dumps(session, ensure_ascii=False, separators=(",", ":"))
+
+    def save(self, session_id: str, session: Dict[str, Any]):
+        value = self._dumps(session)
+        with self._lock:
+            self._store(session_id, value, time.time() + self.ttl_seconds)
+        if self.backend is not None:
+            try:
+                self.backend.set(self.NAMESPACE, session_id, value, ttl_seconds=self.ttl_seconds)
+            except Exception as e:
+                logger.error(f"Failed to persist session: {str(e)}")
+
+    def record_turn(self, session_id: str, turn: Dict[str, Any]) -> Dict[str, Any]:
+        """Adds or replaces the session's entry for the turn's crop and region and makes it the latest.
+
+        The read and the write are one atomic update, in the shared backend
+        when there is one, so two workers answering the same session at once
+        both keep their turn.
+        """
+        key = turn_key(turn["crop"], turn["region"])
+
+        def apply(value: Optional[str]) -> str:
+            session = json.loads(value) if value else {"turns": {}}
+            turns = session["turns"]
+            turns.pop(key, None)
+            turns[key] = turn
+            while len(turns) > self.max_turns:
+                turns.pop(next(iter(turns)))
+            session["last"] = key
+            return self._dumps(session)
+
+        if self.backend is not None:
+            try:
+                value = self.backend.update(self.NAMESPACE, session_id, apply, ttl_seconds=self.ttl_seconds)
+                with self._lock:
+                    self._store(session_id, value, time.time() + self.ttl_seconds)
+                return json.loads(value)
+            except Exception as e:
+                logger.error(f"Failed to persist session: {str(e)}")
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            value = apply(entry[1] if entry and entry[0] > now else None)
+            self._store(session_id, value, now + self.ttl_seconds)
+        return json.loads(value)
+
+    def find_turn(self, session: Optional[Dict[str, Any]], crop: str, region: str) -> Optional[Dict[str, Any]]:
+        if not session:
+            return None
+        return session["turns"].get(turn_key(crop, region))
+
+    def reusable_turn(self, session: Optional[Dict[str, Any]], date: str, crop: str, region: str) -> Optional[Dict[str, Any]]:
+        """The stored turn for the same question on the same day, if it is recent enough to answer again."""
+        turn = self.find_turn(session, crop, region)
+        if turn is None or not turn["message"] or turn["date"] != date or time.time() - turn["at"] > self.reuse_seconds:
+            return None
+        inc("session_reuse_total", kind="prediction")
+        return turn
+
+    def _remove(self, session_id: str):
+        _, _, size = self._entries.pop(session_id)
+        self.bytes -= size
+
+    def _store(self, session_id: str, value: str, expires_at: float):
+        if session_id in self._entries:
+            self._remove(session_id)
+        # Counted in UTF-8 bytes, not characters: Filipino text and emoji take several bytes each
+        size = len(value.encode("utf-8"))
+        self._entries[session_id] = (expires_at, value, size)
+        self.bytes += size
+        while len(self._entries) > self.max_sessions or (self.bytes > self.max_bytes and len(self._entries) > 1):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "bytes": self.bytes,
+                "evicted": self.evicted,
+                "shared": self.backend is not None
+            }
@@ -0,0 +1,302 @@
+"""State shared by every worker process: job records, generated initiatives and cached completions.
+
+Values are strings (callers store JSON), so backends are interchangeable:
+
+    STATE_BACKEND=memory                    # default; one process only
+    STATE_BACKEND=sqlite:///farm_state.db   # any number of workers on one host
+
+``MemoryBackend`` is the in-process stand-in for a Redis-style store and keeps
+single-worker behaviour unchanged. ``SQLiteBackend`` runs in WAL mode, so
+workers read concurrently while one writes, and opens its connections per
+process so it is safe to create before forking.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_PATH = "farm_state.db"
+# Expired keys are purged once every this many writes
+PURGE_EVERY = 256
+
+
+class StateBackend(ABC):
+    """Key-value entries with optional expiry plus append-only lists, both grouped by namespace."""
+
+    # Whether other processes see the same state
+    shared = False
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: str, ttl_seconds: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str):
+        ...
+
+    @abstractmethod
+    def update(
+        self, namespace: str, key: str, func: Callable[[Optional[str]], str], ttl_seconds: Optional[float] = None
+    ) -> str:
+        """Atomically replaces a value with ``func(current value or None)`` and returns the new value."""
+
+    @abstractmethod
+    def entries(self, namespace: str) -> List[Tuple[str, str]]:
+        """Every unexpired (key, value) pair of a namespace."""
+
+    @abstractmethod
+    def append(self, namespace: str, value: str, max_len: Optional[int] = None):
+        """Adds ``value`` to the end of a list, dropping the oldest entries beyond ``max_len``."""
+
+    @abstractmethod
+    def items(self, namespace: str, limit: Optional[int] = None) -> List[str]:
+        """A list's entries, oldest first; with ``limit``, only the newest ``limit``."""
+
+    @abstractmethod
+    def length(self, namespace: str) -> int:
+        ...
+
+
+class MemoryBackend(StateBackend):
+    """Dicts and deques behind one lock; state lives and dies with the process."""
+
+    def __init__(self):
+        self._values: Dict[Tuple[str, str], Tuple[Optional[float], str]] = {}
+        self._lists: Dict[str, Deque[str]] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._values.get((namespace, key))
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._values[(namespace, key)]
+                return None
+            return value
+
+    def set(self, namespace: str, key: str, value: str, ttl_seconds: Optional[float] = None):
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            self._values[(namespace, key)] = (expires_at, value)
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                now = time.time()
+                for expired in [k for k, (at, _) in self._values.items() if at is not None and at <= now]:
+                    del self._values[expired]
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._values.pop((namespace, key), None)
+
+    def update(
+        self, namespace: str, key: str, func: Callable[[Optional[str]], str], ttl_seconds: Optional[float] = None
+    ) -> str:
+        now = time.time()
+        with self._lock:
+            entry = self._values.get((namespace, key))
+            current = entry[1] if entry and (entry[0] is None or entry[0] > now) else None
+            value = func(current)
+            self._values[(namespace, key)] = (now + ttl_seconds if ttl_seconds else None, value)
+            return value
+
+    def entries(self, namespace: str) -> List[Tuple[str, str]]:
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value) for (entry_namespace, key), (expires_at, value) in self._values.items()
+                if entry_namespace == namespace and (expires_at is None or expires_at > now)
+            ]
+
+    def append(self, namespace: str, value: str, max_len: Optional[int] = None):
+        with self._lock:
+            entries = self._lists.setdefault(namespace, deque())
+            entries.append(value)
+            while max_len is not None and len(entries) > max_len:
+                entries.popleft()
+
+    def items(self, namespace: str, limit: Optional[int] = None) -> List[str]:
+        with self._lock:
+            entries = list(self._lists.get(namespace, ()))
+        if limit is not None:
+            entries = entries[-limit:] if limit > 0 else []
+        return entries
+
+    def length(self, namespace: str) -> int:
+        with self._lock:
+            return len(self._lists.get(namespace, ()))
+
+
+class SQLiteBackend(StateBackend):
+    """One SQLite file shared by every process on the host."""
+
+    shared = True
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, timeout_seconds: float = 30.0):
+        self.path = path
+        self.timeout_seconds = timeout_seconds
+        self._local = threading.local()
+        self._writes = 0
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "namespace TEXT, key TEXT, value TEXT, expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        db.execute("CREATE TABLE IF NOT EXISTS lists (id INTEGER PRIMARY KEY AUTOINCREMENT, namespace TEXT, value TEXT)")
+        db.execute("CREATE INDEX IF NOT EXISTS lists_namespace ON lists (namespace, id)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not cross threads or a fork, so each thread of each process opens its own
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.timeout_seconds, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, namespace: str, key: str, value: str, ttl_seconds: Optional[float] = None):
+        now = time.time()
+        db = self._connection()
+        db.execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, value, now + ttl_seconds if ttl_seconds else None)
+        )
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            db.execute("DELETE FROM kv WHERE expires_at <= ?", (now,))
+
+    def delete(self, namespace: str, key: str):
+        self._connection().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def update(
+        self, namespace: str, key: str, func: Callable[[Optional[str]], str], ttl_seconds: Optional[float] = None
+    ) -> str:
+        now = time.time()
+        db = self._connection()
+        # The write lock is taken before the read, so concurrent updates of a key from other workers queue up
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, now)
+            ).fetchone()
+            value = func(row[0] if row else None)
+            db.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, now + ttl_seconds if ttl_seconds else None)
+            )
+        return value
+
+    def entries(self, namespace: str) -> List[Tuple[str, str]]:
+        rows = self._connection().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time())
+        ).fetchall()
+        return [(key, value) for key, value in rows]
+
+    def append(self, namespace: str, value: str, max_len: Optional[int] = None):
+        db = self._connection()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("INSERT INTO lists (namespace, value) VALUES (?, ?)", (namespace, value))
+            if max_len is not None:
+                db.execute(
+                    "DELETE FROM lists WHERE namespace = ? AND id <= "
+                    "(SELECT id FROM lists WHERE namespace = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (namespace, namespace, max_len)
+                )
+
+    def items(self, namespace: str, limit: Optional[int] = None) -> List[str]:
+        if limit is None:
+            rows = self._connection().execute(
+                "SELECT value FROM lists WHERE namespace = ? ORDER BY id", (namespace,)
+            ).fetchall()
+        else:
+            rows = self._connection().execute(
+                "SELECT value FROM lists WHERE namespace = ? ORDER BY id DESC LIMIT ?", (namespace, max(limit, 0))
+            ).fetchall()[::-1]
+        return [row[0] for row in rows]
+
+    def length(self, namespace: str) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM lists WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+
+class SharedList:
+    """A list of strings kept in a backend, so every worker appends to and reads the same one."""
+
+    def __init__(self, backend: StateBackend, namespace: str, max_len: Optional[int] = None):
+        self.backend = backend
+        self.namespace = namespace
+        self.max_len = max_len
+
+    def append(self, value: str):
+        self.backend.append(self.namespace, value, self.max_len)
+
+    def items(self, limit: Optional[int] = None) -> List[str]:
+        return self.backend.items(self.namespace, limit)
+
+    def __len__(self) -> int:
+        return self.backend.length(self.namespace)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.items())
+
+
+_backends: Dict[str, StateBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def _sqlite_backend(path: str) -> StateBackend:
+    path = os.path.abspath(path)
+    with _backends_lock:
+        backend = _backends.get(path)
+        if backend is None:
+            backend = SQLiteBackend(path)
+            _backends[path] = backend
+            logger.info(f"Shared state in SQLite at {path}")
+        return backend
+
+
+def get_state_backend() -> StateBackend:
+    """The process-wide backend named by STATE_BACKEND ("memory", "sqlite" or "sqlite:///<path>")."""
+    spec = os.getenv("STATE_BACKEND", "memory").strip()
+    if spec == "sqlite":
+        return _sqlite_backend(DEFAULT_SQLITE_PATH)
+    if spec.startswith("sqlite:///"):
+        return _sqlite_backend(spec[len("sqlite:///"):])
+    if spec != "memory":
+        raise ValueError(f"Unknown STATE_BACKEND {spec!r}; use memory or sqlite:///<path>")
+    with _backends_lock:
+        backend = _backends.get("memory")
+        if backend is None:
+            backend = MemoryBackend()
+            _backends["memory"] = backend
+        return backend
+
+
+def shared_backend(path: Optional[str] = None) -> Optional[StateBackend]:
+    """A backend every worker sees: SQLite at ``path`` if given, else STATE_BACKEND if it is shared, else None."""
+    if path:
+        return _sqlite_backend(path)
+    backend = get_state_backend()
+    return backend if backend.shared else None
@@ -1,159 +1,345 @@
-from typing import Dict, List, Any
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Any, Optional, Tuple
+import asyncio
 import logging
 import json
-import csv
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from openai import OpenAI
 import os
+from llm_gateway import get_llm_gateway, extract_content, clean_boxed
+from metrics import inc, timed
+from shared_state import SharedList, get_state_backend
+
+if TYPE_CHECKING:
+    from market_data import MarketDataStore
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+SELLING_SYSTEM_PROMPT = (
+    """Ikaw ay isang expert na sales strategist sa agrikultura. 
+    Ang goal mo ay gumawa ng personalized na selling initiative na magkokonekta sa ani ng magsasaka sa pinaka-best na buyer base sa presyo, 
+    klase ng buyer, at regional na data. Dapat isang maikling talata lang ang initiative na nagpapaliwanag kung bakit swak ang buyer na ito at
+    paano siya dapat lapitan o kausapin.
+
+    IMPORTANT RULES:
+    1. TAGLISH LANG
+    2. Huwag magsalita ng english.
+    2. 2 hanggang 3 pangungusap lang.
+    3. Iwasan ang jargon at masyadong teknikal na salita.
+
+    """ 
+)
+# Packed requests carry several buyers in one prompt and ask for one initiative per item id
+PACKED_SYSTEM_PROMPT = SELLING_SYSTEM_PROMPT + (
+    """4. May listahan ng "items" sa input; gumawa ng hiwalay na initiative para sa bawat isa.
+    5. Sumagot lang ng JSON na ganito ang anyo, walang ibang text:
+    {"initiatives": [{"id": <id ng item>, "initiative": "<initiative>"}]}
+    """
+)
+
+# Most recent initiatives kept; older ones are dropped as new ones are stored
+INITIATIVES_MAX = int(os.getenv("INITIATIVES_MAX", "1000"))
+
+
+@dataclass(frozen=True, slots=True)
+class Initiative:
+    """A stored initiative. Kept in the shared list as a compact JSON array."""
+
+    text: str
+    crop: Optional[str] = None
+    buyer: Optional[str] = None
+    created_at: Optional[float] = None
+
+    def dumps(self) -> str:
+        return json.dumps([self.created_at, self.crop, self.buyer, self.text], ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, value: str) -> "Initiative":
+        try:
+            created_at, crop, buyer, text = json.loads(value)
+            return cls(text, crop, buyer, created_at)
+        except (TypeError, ValueError):
+            # Stored before initiatives were records: the bare text
+            return cls(value)
+
+
 class FarmTaskManager:
     def __init__(self):
-        api_key = os.getenv("OPENROUTER_API_KEY")
-        if not api_key:
-            logger.warning("OPENROUTER_API_KEY environment variable not set. AI functionality will be limited.")
-        
-        self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key,
-            default_headers={
-                "HTTP-Referer": "https://farm-assist.example.com",
-                "X-Title": "Farm Assistant API"
-            }
-        )
-        self.initiatives = []  # Store generated initiatives
-        self.tasks = {}  # Store generated tasks with IDs
+        self.llm = get_llm_gateway()
+        # Generated initiatives across all jobs, in the shared backend so every worker lists the same ones
+        self.initiatives = SharedList(get_state_backend(), "initiatives", max_len=INITIATIVES_MAX)
 
-    def _load_csv_data(self, file_path: str) -> List[Dict[str, Any]]:
-        """Loads data from a CSV file into a list of dictionaries."""
-        data = []
-        try:
-            with open(file_path, mode="r", encoding="utf-8") as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    data.append(row)
-            logger.info(f"Successfully loaded data from {file_path}")
-        except FileNotFoundError:
-            logger.error(f"Error: The file {file_path} was not found.")
-        except Exception as e:
-            logger.error(f"Error loading data from {file_path}: {str(e)}")
-        return data
+    def _store_initiative(self, text: str, crop: Optional[str], buyer: Dict[str, Any]):
+        record = Initiative(text, crop, buyer.get("Buyer Name"), round(time.time(), 1))
+        self.initiatives.append(record.dumps())
+
+    def stored_initiatives(self, limit: Optional[int] = None) -> List[Initiative]:
+        """Stored initiatives, oldest first; with ``limit``, only the newest ``limit``."""
+        return [Initiative.loads(value) for value in self.initiatives.items(limit)]
 
-    def _get_crop_price_info(self, crop_name: str, crop_prices_data: List[Dict[str, Any]], region: str = None) -> Dict[str, Any]:
+    def _get_crop_price_info(self, crop_name: str, market_data: "MarketDataStore", region: str = None) -> Dict[str, Any]:
         """Retrieves average price for a specific crop, optionally filtered by region."""
-        relevant_prices = []
-        for record in crop_prices_data:
-            if record.get("Crop", "").lower() == crop_name.lower():
-                if region and record.get("Region", "").lower() == region.lower():
-                    try:
-                        relevant_prices.append(float(record.get("Price per kg", 0)))
-                    except ValueError:
-                        pass  # Ignore if price is not a valid float
-                elif not region:
-                    try:
-                        relevant_prices.append(float(record.get("Price per kg", 0)))
-                    except ValueError:
-                        pass
-        
-        if relevant_prices:
-            avg_price = sum(relevant_prices) / len(relevant_prices)
+        avg_price = market_data.average_price(crop_name, region)
+        if avg_price is not None:
             return {"crop": crop_name, "average_price_per_kg": round(avg_price, 2)}
         return {"crop": crop_name, "average_price_per_kg": "N/A"}
 
+    @staticmethod
+    def _initiative_context(buyer: Dict[str, Any], current_date: str) -> Dict[str, Any]:
+        return {
+            "buyer_profile": buyer,
+            "product_market_context": {
+                "crop": buyer.get("Crop Interest"),
+                "average_price_per_kg": buyer["price_info"]
+            },
+            "current_date": current_date
+        }
+
+    @staticmethod
+    def _rank_buyers(
+        user_crops: List[str],
+        region: Optional[str],
+        quantity_kg: Optional[float],
+        buyers_file_path: str,
+        crop_prices_file_path: str
+    ) -> List[Dict[str, Any]]:
+        """The best buyer for ``user_crops``, as a one-item list; empty without buyer data."""
+        from buyer_ranking import get_buyer_ranker
+        from market_data import get_market_data
+
+        market_data = get_market_data(buyers_file_path, crop_prices_file_path)
+        if not market_data.buyers:
+            logger.warning("No buyer data loaded. Cannot generate initiatives.")
+            return []
+        return get_buyer_ranker(market_data).rank(user_crops, region=region, quantity_kg=quantity_kg, top_k=1)
+
+    @timed("selling_initiative")
     async def generate_selling_initiatives(
         self,
         user_crops: List[str],
         buyers_file_path: str = "fictional_buyers_dataset.csv",
-        crop_prices_file_path: str = "philippines_crop_prices_mock_data.csv"
+        crop_prices_file_path: str = "philippines_crop_prices_mock_data.csv",
+        region: Optional[str] = None,
+        quantity_kg: Optional[float] = None,
+        ranked_buyers: Optional[List[Dict[str, Any]]] = None
     ) -> List[str]:
-        """Generate one best selling initiative based on buyer and crop price data."""
-        logger.info("Starting selling initiative generation.")
-
-        buyers_data = self._load_csv_data(buyers_file_path)
-        crop_prices_data = self._load_csv_data(crop_prices_file_path)
+        """Generate one best selling initiative based on buyer and crop price data.
 
-        if not buyers_data:
-            logger.warning("No buyer data loaded. Cannot generate initiatives.")
-            return []
+        ``ranked_buyers`` are buyers already ranked for these crops (from the
+        caller's chat session); without them the buyers are ranked here.
+        """
+        logger.info("Starting selling initiative generation.")
 
-        self.initiatives = []
-        current_date_str = datetime.now().strftime("%Y-%m-%d")
+        if not ranked_buyers:
+            # Loading market data and ranking are CPU-bound; keep them off the event loop
+            ranked_buyers = await asyncio.get_running_loop().run_in_executor(
+                None, self._rank_buyers, user_crops, region, quantity_kg, buyers_file_path, crop_prices_file_path
+            )
 
-        # Filter buyers who are interested in user crops and sort by price (if available)
-        filtered_buyers = []
-        for buyer in buyers_data:
-            crop_interest = buyer.get("Crop Interest", "").lower()
-            if crop_interest in [crop.lower() for crop in user_crops]:
-                price_info = self._get_crop_price_info(crop_interest, crop_prices_data, buyer.get("Region"))
-                avg_price = price_info["average_price_per_kg"]
-                if avg_price == "N/A":
-                    price_info = self._get_crop_price_info(crop_interest, crop_prices_data)
-                    avg_price = price_info["average_price_per_kg"]
-                if isinstance(avg_price, (int, float)):
-                    buyer["price_info"] = avg_price
-                    filtered_buyers.append(buyer)
-
-        if not filtered_buyers:
+        if not ranked_buyers:
             logger.warning("No suitable buyer with price info found.")
             return []
 
-        # Sort buyers by price (descending)
-        best_buyer = sorted(filtered_buyers, key=lambda b: b["price_info"], reverse=True)[0]
-
-        context_for_ai = {
-            "buyer_profile": best_buyer,
-            "product_market_context": {
-                "crop": best_buyer.get("Crop Interest"),
-                "average_price_per_kg": best_buyer["price_info"]
-            },
-            "current_date": current_date_str
-        }
-
-        system_prompt = (
-            """Ikaw ay isang expert na sales strategist sa agrikultura. 
-            Ang goal mo ay gumawa ng personalized na selling initiative na magkokonekta sa ani ng magsasaka sa pinaka-best na buyer base sa presyo, 
-            klase ng buyer, at regional na data. Dapat isang maikling talata lang ang initiative na nagpapaliwanag kung bakit swak ang buyer na ito at
-            paano siya dapat lapitan o kausapin.
+        current_date_str = datetime.now().strftime("%Y-%m-%d")
 
-            IMPORTANT RULES:
-            1. TAGLISH LANG
-            2. Huwag magsalita ng english.
-            2. 2 hanggang 3 pangungusap lang.
-            3. Iwasan ang jargon at masyadong teknikal na salita.
+        # Best buyer by price, budget fit, distance and purchase intent
+        best_buyer = dict(ranked_buyers[0])
+        best_buyer.pop("score_breakdown", None)
 
-            """ 
-        )
+        context_for_ai = self._initiative_context(best_buyer, current_date_str)
 
         user_prompt_content = json.dumps(context_for_ai, indent=2)
 
         try:
-            if not self.client.api_key:
+            if not self.llm.api_key:
                 logger.error("API key not configured. Skipping API call.")
                 return ["Could not generate initiative due to API key missing."]
 
             logger.info(f"Sending request to AI for best buyer: {best_buyer.get('Buyer Name')}")
-            completion = self.client.chat.completions.create(
-                model="deepseek/deepseek-r1-zero:free",
+            completion = await self.llm.complete(
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": SELLING_SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt_content}
                 ],
                 temperature=0.7
             )
 
-            ai_response = completion.choices[0].message.content.strip()
+            ai_response = clean_boxed(extract_content(completion) or "")
             logger.info(f"Received AI response: {ai_response}")
-            self.initiatives.append(ai_response)
-            return self.initiatives
+            self._store_initiative(ai_response, best_buyer.get("Crop Interest"), best_buyer)
+            return [ai_response]
 
         except Exception as e:
             logger.error(f"AI initiative generation failed: {str(e)}", exc_info=True)
             return [f"Failed to generate initiative. Error: {str(e)}"]
 
+    async def _generate_one(self, crop: str, buyer: Dict[str, Any], current_date: str) -> Dict[str, Any]:
+        """One initiative for one (crop, buyer) pair; failures are reported in the result, not raised."""
+        result = {"crop": crop, "buyer": buyer}
+        try:
+            # Not cached: each request should get a fresh initiative, as the single path does
+            completion = await self.llm.complete(
+                messages=[
+                    {"role": "system", "content": SELLING_SYSTEM_PROMPT},
+                    {"role": "user", "content": json.dumps(self._initiative_context(buyer, current_date), indent=2)}
+                ],
+                temperature=0.7
+            )
+            text = extract_content(completion)
+            if not text:
+                return dict(result, status="error", error="Empty completion")
+            return dict(result, status="success", initiative=clean_boxed(text))
+        except Exception as e:
+            logger.error(f"Initiative for {buyer.get('Buyer Name')} failed: {str(e)}")
+            return dict(result, status="error", error=str(e))
+
+    async def _generate_packed(self, pairs: List[Tuple[str, Dict[str, Any]]], current_date: str) -> List[Dict[str, Any]]:
+        """Initiatives for several pairs from one structured-output completion.
+
+        Items the reply is missing, or a reply that is not the requested JSON,
+        fall back to one completion per pair.
+        """
+        items = [dict(self._initiative_context(buyer, current_date), id=i) for i, (_, buyer) in enumerate(pairs)]
+        texts = {}
+        try:
+            completion = await self.llm.complete(
+                messages=[
+                    {"role": "system", "content": PACKED_SYSTEM_PROMPT},
+                    {"role": "user", "content": json.dumps({"items": items}, indent=2)}
+                ],
+                temperature=0.7
+            )
+            texts = parse_packed_initiatives(extract_content(completion) or "")
+        except Exception as e:
+            logger.warning(f"Packed initiative request failed, falling back to single requests: {str(e)}")
+
+        results = []
+        missing = []
+        for i, (crop, buyer) in enumerate(pairs):
+            if texts.get(i):
+                results.append({"crop": crop, "buyer": buyer, "status": "success", "initiative": texts[i]})
+            else:
+                missing.append((crop, buyer))
+        if missing:
+            inc("initiative_pack_fallbacks_total", len(missing))
+            results.extend(await asyncio.gather(*(self._generate_one(crop, buyer, current_date) for crop, buyer in missing)))
+        return results
+
+    @staticmethod
+    def _candidate_pairs(
+        user_crops: List[str],
+        region: Optional[str],
+        quantity_kg: Optional[float],
+        top_k: int,
+        buyers_file_path: str,
+        crop_prices_file_path: str,
+        candidates: Dict[str, List[Dict[str, Any]]]
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """(crop, buyer) pairs for the top ``top_k`` buyers of each crop, ranking only crops without enough candidates."""
+        from buyer_ranking import get_buyer_ranker
+        from market_data import get_market_data
+
+        ranker = None
+        pairs = []
+        for crop in dict.fromkeys(user_crops):
+            buyers = candidates.get(crop) or []
+            if len(buyers) >= top_k:
+                buyers = [dict(buyer) for buyer in buyers[:top_k]]
+            else:
+                if ranker is None:
+                    ranker = get_buyer_ranker(get_market_data(buyers_file_path, crop_prices_file_path))
+                buyers = ranker.rank([crop], region=region, quantity_kg=quantity_kg, top_k=top_k)
+            for buyer in buyers:
+                buyer.pop("score_breakdown", None)
+                pairs.append((crop, buyer))
+        return pairs
+
+    async def stream_selling_initiatives(
+        self,
+        user_crops: List[str],
+        region: Optional[str] = None,
+        quantity_kg: Optional[float] = None,
+        top_k: int = 3,
+        pack_size: int = 1,
+        buyers_file_path: str = "fictional_buyers_dataset.csv",
+        crop_prices_file_path: str = "philippines_crop_prices_mock_data.csv",
+        candidates: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yields one initiative per (crop, top-k buyer) pair as each completes.
+
+        All completions are started at once; the gateway's concurrency limit is
+        the rate limit, so a multi-crop batch takes about as long as its
+        slowest completion instead of the sum. With ``pack_size`` > 1, up to
+        that many pairs share one completion. ``candidates`` holds buyers
+        already ranked per crop; only the other crops are ranked here.
+        """
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        # Loading market data and ranking are CPU-bound; keep them off the event loop
+        pairs = await asyncio.get_running_loop().run_in_executor(
+            None, self._candidate_pairs, user_crops, region, quantity_kg, top_k,
+            buyers_file_path, crop_prices_file_path, candidates or {}
+        )
+        if not pairs:
+            logger.warning(f"No suitable buyers with price info found for {user_crops}.")
+            return
+
+        if not self.llm.api_key:
+            logger.error("API key not configured. Skipping API calls.")
+            for crop, buyer in pairs:
+                yield {"crop": crop, "buyer": buyer, "status": "error", "error": "API key missing"}
+            return
+
+        pack_size = max(1, pack_size)
+        if pack_size == 1:
+            tasks = [asyncio.ensure_future(self._generate_one(crop, buyer, current_date)) for crop, buyer in pairs]
+        else:
+            tasks = [
+                asyncio.ensure_future(self._generate_packed(pairs[start:start + pack_size], current_date))
+                for start in range(0, len(pairs), pack_size)
+            ]
+        logger.info(f"Generating {len(pairs)} initiatives in {len(tasks)} requests")
+
+        try:
+            for finished in asyncio.as_completed(tasks):
+                results = await finished
+                for result in results if isinstance(results, list) else [results]:
+                    if result["status"] == "success":
+                        self._store_initiative(result["initiative"], result["crop"], result["buyer"])
+                    yield result
+        finally:
+            # A client that stops reading cancels whatever is still in flight
+            for task in tasks:
+                task.cancel()
+
+    @timed("selling_initiative_batch")
+    async def generate_selling_initiative_batch(self, user_crops: List[str], **options) -> List[Dict[str, Any]]:
+        """All results of ``stream_selling_initiatives``, in completion order."""
+        return [result async for result in self.stream_selling_initiatives(user_crops, **options)]
+
+
+def parse_packed_initiatives(reply: str) -> Dict[int, str]:
+    """Item id -> initiative from a packed reply; empty if the reply holds no usable JSON."""
+    text = reply
+    if "\\boxed{" in text:
+        text = text.split("\\boxed{", 1)[1].rsplit("}", 1)[0]
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        parsed = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    entries = parsed.get("initiatives") if isinstance(parsed, dict) else None
+    texts = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if isinstance(entry, dict) and isinstance(entry.get("initiative"), str):
+            try:
+                texts[int(entry.get("id"))] = entry["initiative"].strip()
+            except (TypeError, ValueError):
+                continue
+    return texts
 
-    
 
 # For direct script testing
 async def main_test():
@@ -178,7 +364,6 @@ async def main_test():
 
 if __name__ == "__main__":
     # For direct script execution testing
-    import asyncio
     # asyncio.run(main_test())  # Uncomment to run the test
     print("FarmTaskManager class defined. To test, uncomment the asyncio.run(main_test()) line.")
     print("The script is intended to be used as a module. The main_test function is for demonstration.")
@@ -0,0 +1,272 @@
+"""Training pipeline for the crop price model.
+
+    python training.py sweep --folds 3 --workers 4      # parallel CV sweep, saves the best model
+    python training.py train --promote                  # train with the default parameters
+    python training.py retrain --promote                # warm-start on rows appended since the served model
+
+Versions are written to the ModelStore (MODEL_DIR, default ./models). A running
+API picks up a promoted version through POST /model/reload, or on its own when
+MODEL_WATCH_SECONDS is set.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostRegressor, Pool
+
+from columnar import open_table
+from features import CATEGORICAL_FEATURES, training_frame
+from model_store import ModelStore
+
+logger = logging.getLogger(__name__)
+
+DATA_FILE = "philippines_crop_prices_mock_data.csv"
+DEFAULT_PARAMS = {
+    "iterations": 1000,
+    "learning_rate": 0.05,
+    "depth": 6,
+    "l2_leaf_reg": 3
+}
+PARAM_GRID = {
+    "learning_rate": [0.03, 0.05, 0.1],
+    "depth": [4, 6, 8],
+    "l2_leaf_reg": [1, 3, 9]
+}
+# A warm-started model is only promoted if its holdout RMSE is at most this much worse
+RETRAIN_TOLERANCE = 0.02
+# Fewer appended rows than this are left for a later retrain
+RETRAIN_MIN_ROWS = 100
+# Share of the appended rows, newest first, held out to compare the two models
+RETRAIN_HOLDOUT = 0.2
+# Share of the training rows (after the test holdout) that early stopping watches
+VALIDATION_SHARE = 0.1
+
+
+def load_training_data(path: str = DATA_FILE) -> pd.DataFrame:
+    """The price history from its memory-mapped columnar snapshot; Region and Crop come back as Categoricals."""
+    return open_table(path).to_frame()
+
+
+def _regressor(params: Dict[str, Any], **overrides) -> CatBoostRegressor:
+    return CatBoostRegressor(**dict(
+        DEFAULT_PARAMS, **params, eval_metric="RMSE", random_seed=42, verbose=0, early_stopping_rounds=50,
+        allow_writing_files=False, **overrides
+    ))
+
+
+def _split(n_rows: int, holdout: float, seed: int = 42):
+    order = np.random.default_rng(seed).permutation(n_rows)
+    n_test = max(1, int(n_rows * holdout))
+    return order[n_test:], order[:n_test]
+
+
+def evaluate(model: CatBoostRegressor, features: pd.DataFrame, target: np.ndarray) -> Dict[str, float]:
+    predictions = model.predict(Pool(features, cat_features=CATEGORICAL_FEATURES))
+    errors = predictions - target
+    return {
+        "rmse": round(float(np.sqrt(np.mean(errors ** 2))), 4),
+        "mae": round(float(np.mean(np.abs(errors))), 4)
+    }
+
+
+# Each sweep worker process receives the training frame once, not once per task
+_worker_data = {}
+
+
+def _init_worker(features: pd.DataFrame, target: np.ndarray):
+    _worker_data["features"] = features
+    _worker_data["target"] = target
+
+
+def _cross_validate(params: Dict[str, Any], folds: int) -> Dict[str, Any]:
+    features, target = _worker_data["features"], _worker_data["target"]
+    order = np.random.default_rng(42).permutation(len(target))
+    scores = []
+    best_iterations = []
+    for fold in np.array_split(order, folds):
+        train_rows = np.setdiff1d(order, fold, assume_unique=True)
+        # One thread per fit; the sweep parallelizes across processes instead
+        model = _regressor(params, thread_count=1)
+        model.fit(
+            Pool(features.iloc[train_rows], target[train_rows], cat_features=CATEGORICAL_FEATURES),
+            eval_set=Pool(features.iloc[fold], target[fold], cat_features=CATEGORICAL_FEATURES)
+        )
+        scores.append(evaluate(model, features.iloc[fold], target[fold])["rmse"])
+        best_iteration = model.get_best_iteration()
+        best_iterations.append(model.tree_count_ if best_iteration is None else best_iteration + 1)
+    return {
+        "params": params,
+        "rmse": round(float(np.mean(scores)), 4),
+        "rmse_std": round(float(np.std(scores)), 4),
+        "best_iteration": int(np.median(best_iterations))
+    }
+
+
+def sweep(
+    data: pd.DataFrame,
+    grid: Dict[str, List[Any]] = PARAM_GRID,
+    folds: int = 3,
+    workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Cross-validates every parameter combination in ``grid`` across CPU cores; best first."""
+    features, target = training_frame(data)
+    candidates = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Sweeping {len(candidates)} parameter sets x {folds} folds on {workers} workers")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(features, target)) as pool:
+        results = list(pool.map(_cross_validate, candidates, [folds] * len(candidates)))
+    return sorted(results, key=lambda result: result["rmse"])
+
+
+def train(
+    data: pd.DataFrame,
+    params: Optional[Dict[str, Any]] = None,
+    holdout: float = 0.2,
+    init_model: Optional[CatBoostRegressor] = None
+):
+    """Fits on ``data``; returns (model, metadata).
+
+    A ``holdout`` share of the rows is set aside as the test set, and early
+    stopping watches a separate validation slice of the remaining rows, so
+    the recorded metrics come from rows that influenced neither the trees
+    nor when fitting stopped. With ``holdout=0`` every row is fit for the
+    full number of iterations and no metrics are recorded.
+    """
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    features, target = training_frame(data)
+    if holdout:
+        train_rows, test_rows = _split(len(target), holdout)
+        fit_part, validation_part = _split(len(train_rows), VALIDATION_SHARE, seed=7)
+        train_rows, validation_rows = train_rows[fit_part], train_rows[validation_part]
+        eval_set = Pool(features.iloc[validation_rows], target[validation_rows], cat_features=CATEGORICAL_FEATURES)
+    else:
+        train_rows, test_rows, eval_set = np.arange(len(target)), None, None
+
+    started = time.perf_counter()
+    model = _regressor(params)
+    model.fit(
+        Pool(features.iloc[train_rows], target[train_rows], cat_features=CATEGORICAL_FEATURES),
+        eval_set=eval_set,
+        init_model=init_model
+    )
+    metadata = {
+        "params": params,
+        "metrics": evaluate(model, features.iloc[test_rows], target[test_rows]) if holdout else None,
+        "rows": len(data),
+        "trees": model.tree_count_,
+        "training_seconds": round(time.perf_counter() - started, 2)
+    }
+    return model, metadata
+
+
+def retrain(
+    store: ModelStore,
+    data: pd.DataFrame,
+    iterations: int = 200,
+    promote: bool = False,
+    tolerance: float = RETRAIN_TOLERANCE,
+    min_rows: int = RETRAIN_MIN_ROWS
+) -> Dict[str, Any]:
+    """Warm-starts the served model on price rows appended since it was trained.
+
+    The newest ``RETRAIN_HOLDOUT`` of the appended rows is held out, the new
+    trees are fit on the rest, and both models are scored on the held-out
+    rows, which neither was trained on. The new version is promoted only if
+    asked to and not meaningfully worse. Its row count stops before the
+    held-out rows, so the next retrain fits them.
+
+    A served model that records no row count (the bundled one) may have been
+    trained on the held-out rows, so its comparison proves nothing and the
+    new version is saved but never promoted automatically.
+    """
+    base_version = store.current_version()
+    base_metadata = store.metadata(base_version)
+    # Without a row count every row counts as new, and the holdout may be in the base model's training data
+    comparable = "rows" in base_metadata
+    seen_rows = base_metadata.get("rows", 0)
+    new_rows = data.iloc[seen_rows:]
+    if len(new_rows) < min_rows:
+        return {
+            "status": "skipped",
+            "message": f"{len(new_rows)} new price rows since the served model; at least {min_rows} are needed.",
+            "version": base_version
+        }
+
+    base_model = CatBoostRegressor()
+    base_model.load_model(store.model_path(base_version))
+
+    n_holdout = max(1, int(len(new_rows) * RETRAIN_HOLDOUT))
+    fit_rows, holdout_rows = new_rows.iloc[:-n_holdout], new_rows.iloc[-n_holdout:]
+    params = dict(base_metadata.get("params", DEFAULT_PARAMS), iterations=iterations)
+    # A small batch is fit whole; the held-out rows are kept for the comparison below
+    model, metadata = train(fit_rows, params, holdout=0, init_model=base_model)
+
+    holdout = training_frame(holdout_rows)
+    metadata.update(
+        rows=seen_rows + len(fit_rows),
+        base_version=base_version,
+        warm_start_rows=len(fit_rows),
+        holdout_rows=n_holdout,
+        metrics=evaluate(model, *holdout),
+        base_metrics=evaluate(base_model, *holdout)
+    )
+    version = store.save(model, metadata)
+
+    accepted = comparable and metadata["metrics"]["rmse"] <= metadata["base_metrics"]["rmse"] * (1 + tolerance)
+    if promote and accepted:
+        store.promote(version)
+    result = {"status": "success", "version": version, "promoted": promote and accepted, "accepted": accepted, **metadata}
+    if not comparable:
+        result["message"] = (
+            f"Model {base_version or 'bundled'} records no training rows, so the holdout may be in-sample for it; "
+            "review the metrics and promote the new version by hand."
+        )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train, sweep and warm-start the crop price model.")
+    parser.add_argument("command", choices=["sweep", "train", "retrain"])
+    parser.add_argument("--data", default=DATA_FILE)
+    parser.add_argument("--model-dir", default=None, help="defaults to MODEL_DIR or ./models")
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--iterations", type=int, default=200, help="new trees for retrain")
+    parser.add_argument("--min-rows", type=int, default=RETRAIN_MIN_ROWS, help="fewest appended rows retrain will fit")
+    parser.add_argument("--promote", action="store_true", help="serve the new version")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = ModelStore(args.model_dir) if args.model_dir else ModelStore()
+    data = load_training_data(args.data)
+
+    if args.command == "retrain":
+        result = retrain(store, data, iterations=args.iterations, promote=args.promote, min_rows=args.min_rows)
+    else:
+        params = None
+        results = None
+        if args.command == "sweep":
+            results = sweep(data, folds=args.folds, workers=args.workers)
+            # Fit as many trees as cross-validation found useful for the best parameters
+            params = dict(results[0]["params"], iterations=results[0]["best_iteration"])
+        model, metadata = train(data, params)
+        if results:
+            metadata["sweep"] = results
+        version = store.save(model, metadata)
+        if args.promote:
+            store.promote(version)
+        result = {"status": "success", "version": version, "promoted": args.promote, **metadata}
+
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,341 @@
-import openmeteo_requests 
-import requests_cache
-from retry_requests import retry 
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
-def get_weather_forecast():
-    # Setup the Open-Meteo API client with cache and retry on error
-    cache_session = requests_cache.CachedSession('.cache', expire_after = 3600)
-    retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
-    openmeteo = openmeteo_requests.Client(session = retry_session)
-
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": 13.4088,
-	    "longitude": 122.5615,
-        "hourly": ["temperature_2m", "precipitation", "wind_speed_10m"],
-        "daily": ["precipitation_sum", "precipitation_probability_max"],
-        "current": ["temperature_2m", "precipitation", "wind_speed_10m"],
-        "timezone": "Asia/Manila",
-        "forecast_days": 7
-    }
-    
-    try:
-        responses = openmeteo.weather_api(url, params=params)
-        response = responses[0]
-        
-        # Process current weather data
-        current = response.Current()
-        current_weather = {
-            "temperature": current.Variables(0).Value(),
-            "precipitation": current.Variables(1).Value(),
-            "wind_speed": current.Variables(2).Value()
-        }
+from admission import acquire_upstream_blocking
+from metrics import inc, span
+from weather_risk import assess
 
-        # Process hourly data for the next 24 hours
-        hourly = response.Hourly()
-        hourly_data = {
-            "temperature": hourly.Variables(0).ValuesAsNumpy()[:24].tolist(),
-            "precipitation": hourly.Variables(1).ValuesAsNumpy()[:24].tolist(),
-            "wind_speed": hourly.Variables(2).ValuesAsNumpy()[:24].tolist()
-        }
+logger = logging.getLogger(__name__)
 
-        # Process daily data
-        daily = response.Daily()
-        daily_data = {
-            "precipitation_sum": daily.Variables(0).ValuesAsNumpy().tolist(),
-            "precipitation_probability": daily.Variables(1).ValuesAsNumpy().tolist()
-        }
+FORECAST_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+DEFAULT_LATITUDE = 13.4088
+DEFAULT_LONGITUDE = 122.5615
+HOURLY_VARIABLES = ("temperature_2m", "precipitation", "wind_speed_10m")
+DAILY_VARIABLES = ("precipitation_sum", "precipitation_probability_max", "temperature_2m_mean")
+CURRENT_VARIABLES = ("temperature_2m", "precipitation", "wind_speed_10m")
+
+
+class _Flight:
+    """One running fetch: callers of the same key wait on ``done`` and all get its ``result``."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class WeatherService:
+    """Long-lived Open-Meteo client that serves forecasts from an in-memory snapshot.
+
+    Snapshots are keyed by location and variable set. Concurrent callers for the
+    same key share one in-flight fetch, and a background timer refreshes each
+    snapshot shortly before it expires so the request path never waits on the
+    upstream API once the snapshot is warm. If a refresh fails, the last good
+    snapshot keeps being served, marked ``"stale": True``, while the refresh
+    is retried with exponential backoff; only a key that has never loaded
+    waits on (and can fail with) the upstream.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds=900,
+        refresh_margin_seconds=120,
+        cache_name='.cache',
+        max_locations_per_request=100,
+        pool_size=4,
+        retry_seconds=5,
+        max_retry_seconds=300
+    ):
+        # Imported here so the HTTP stack only loads when weather is first needed
+        import openmeteo_requests
+        import requests_cache
+
+        # Setup the Open-Meteo API client with cache. There are no HTTP-level retries: every request to
+        # the upstream must take an admission token, so failed fetches are retried by the service's own
+        # backoff below, never silently inside the session.
+        # Cached responses expire by the time the background refresh runs, so a refresh always reaches Open-Meteo
+        cache_session = requests_cache.CachedSession(
+            cache_name, expire_after = max(ttl_seconds - refresh_margin_seconds, 1)
+        )
+        self.client = openmeteo_requests.Client(session = cache_session)
+
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.max_locations_per_request = max_locations_per_request
+        self._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="open-meteo")
+        self._snapshots = {}  # key -> (fetched_at, forecast)
+        self._inflight = {}  # key -> _Flight for the running fetch
+        self._timers = {}  # key -> background refresh timer
+        self._failures = {}  # key -> background refreshes failed in a row
+        self._listeners = []  # callbacks run on every new snapshot
+        self._lock = threading.Lock()
+        self.default_key = self._make_key(
+            DEFAULT_LATITUDE, DEFAULT_LONGITUDE, HOURLY_VARIABLES, DAILY_VARIABLES, CURRENT_VARIABLES
+        )
+
+    def add_listener(self, callback):
+        """Registers ``callback(key, forecast)`` to run in the background after each new snapshot."""
+        self._listeners.append(callback)
+
+    def _notify(self, key, forecast):
+        for callback in list(self._listeners):
+            try:
+                callback(key, forecast)
+            except Exception as e:
+                logger.error(f"Weather snapshot listener failed: {str(e)}", exc_info=True)
+
+    def _make_key(self, latitude, longitude, hourly, daily, current):
+        if isinstance(latitude, (list, tuple)):
+            latitude = tuple(round(value, 4) for value in latitude)
+            longitude = tuple(round(value, 4) for value in longitude)
+        else:
+            latitude, longitude = round(latitude, 4), round(longitude, 4)
+        return (latitude, longitude, tuple(hourly), tuple(daily), tuple(current))
+
+    def get_forecast(
+        self,
+        latitude=DEFAULT_LATITUDE,
+        longitude=DEFAULT_LONGITUDE,
+        hourly=HOURLY_VARIABLES,
+        daily=DAILY_VARIABLES,
+        current=CURRENT_VARIABLES
+    ):
+        """Returns the forecast snapshot for a location, fetching it only when missing or expired."""
+        return self._get_snapshot(self._make_key(latitude, longitude, hourly, daily, current))
+
+    def get_forecasts(
+        self,
+        locations,
+        hourly=HOURLY_VARIABLES,
+        daily=DAILY_VARIABLES,
+        current=CURRENT_VARIABLES
+    ):
+        """Returns one snapshot covering many (latitude, longitude) pairs.
+
+        The result has a "locations" list in the same order as ``locations``.
+        All coordinates are fetched together, in as few bulk requests as the
+        per-request location limit allows, so the cost per refresh does not
+        grow with the number of callers.
+        """
+        latitudes, longitudes = zip(*locations)
+        return self._get_snapshot(self.locations_key(latitudes, longitudes, hourly, daily, current))
+
+    def locations_key(self, latitudes, longitudes, hourly=HOURLY_VARIABLES, daily=DAILY_VARIABLES, current=CURRENT_VARIABLES):
+        return self._make_key(tuple(latitudes), tuple(longitudes), hourly, daily, current)
+
+    def _get_snapshot(self, key):
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot:
+                age = time.monotonic() - snapshot[0]
+                if age < self.ttl_seconds:
+                    inc("cache_requests_total", cache="weather", result="hit")
+                    return snapshot[1]
+                # Expired because refreshes are failing: serve it while they keep retrying
+                inc("cache_requests_total", cache="weather", result="stale")
+                refreshing = key in self._inflight or (key in self._timers and self._timers[key].is_alive())
+                if not refreshing:
+                    self._schedule_refresh(key, delay=0)
+                return dict(snapshot[1], stale=True, age_seconds=round(age))
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                inflight = _Flight()
+                self._inflight[key] = inflight
+                owner = True
+            else:
+                owner = False
+
+        if owner:
+            # Only a key that has never loaded gets here
+            inc("cache_requests_total", cache="weather", result="miss")
+            return self._fetch_and_store(key, inflight)
+
+        # Another caller is already fetching this key; wait for its result. A failed fetch is
+        # shared too, so callers that piled up behind it do not each send a request of their own
+        inflight.done.wait()
+        return inflight.result
+
+    def _fetch_and_store(self, key, inflight):
+        forecast = {"status": "error", "message": "Weather fetch was interrupted"}
+        try:
+            forecast = self._fetch(key)
+            if forecast["status"] == "success":
+                with self._lock:
+                    self._snapshots[key] = (time.monotonic(), forecast)
+                    self._schedule_refresh(key)
+                if self._listeners:
+                    threading.Thread(target=self._notify, args=(key, forecast), daemon=True).start()
+            return forecast
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.result = forecast
+            inflight.done.set()
+
+    def _schedule_refresh(self, key, delay=None):
+        """Starts the background refresh of ``key`` after ``delay`` seconds (by default, shortly before it expires).
 
-        return {
-            "status": "success",
-            "current": current_weather,
-            "hourly": hourly_data,
-            "daily": daily_data
+        Must be called with the lock held.
+        """
+        if delay is None:
+            delay = max(self.ttl_seconds - self.refresh_margin_seconds, 1)
+        timer = threading.Timer(delay, self._refresh, args=(key,))
+        timer.daemon = True
+        previous = self._timers.get(key)
+        self._timers[key] = timer
+        if previous:
+            previous.cancel()
+        timer.start()
+
+    def _refresh(self, key):
+        """Refreshes a snapshot in the background, keeping the old one and retrying with backoff if the fetch fails."""
+        with self._lock:
+            if key in self._inflight:
+                return
+            inflight = _Flight()
+            self._inflight[key] = inflight
+
+        forecast = self._fetch_and_store(key, inflight)
+        with self._lock:
+            if forecast["status"] == "success":
+                self._failures.pop(key, None)
+                return
+            failures = self._failures.get(key, 0) + 1
+            self._failures[key] = failures
+            delay = min(self.retry_seconds * 2 ** (failures - 1), self.max_retry_seconds)
+            self._schedule_refresh(key, delay)
+        logger.warning(f"Background weather refresh failed ({failures} in a row), retrying in {delay:g}s: {forecast['message']}")
+
+    def _request(self, latitude, longitude, hourly, daily, current):
+        params = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "hourly": list(hourly),
+            "daily": list(daily),
+            "current": list(current),
+            "timezone": "Asia/Manila",
+            "forecast_days": 7
         }
+        acquire_upstream_blocking("open_meteo")
+        with span("open_meteo_request"):
+            return self.client.weather_api(FORECAST_URL, params=params)
+
+    def _fetch(self, key):
+        latitude, longitude, hourly, daily, current = key
+
+        try:
+            if not isinstance(latitude, tuple):
+                responses = self._request(latitude, longitude, hourly, daily, current)
+                return parse_forecast_responses(responses[:1])[0]
+
+            # Open-Meteo accepts coordinate lists; split very long lists and fetch the chunks concurrently
+            size = self.max_locations_per_request
+            chunks = [
+                (list(latitude[i:i + size]), list(longitude[i:i + size]))
+                for i in range(0, len(latitude), size)
+            ]
+            results = self._pool.map(lambda chunk: self._request(chunk[0], chunk[1], hourly, daily, current), chunks)
+            return {
+                "status": "success",
+                "locations": parse_forecast_responses([response for responses in results for response in responses])
+            }
+
+        except Exception as e:
+            inc("upstream_errors_total", upstream="open_meteo", error=type(e).__name__)
+            return {
+                "status": "error",
+                "message": str(e)
+            }
+
+    def warm(self):
+        """Fetches the default snapshot so the first request is served from memory."""
+        return self.get_forecast()
+
+    def close(self):
+        with self._lock:
+            timers = list(self._timers.values())
+            self._timers.clear()
+        for timer in timers:
+            timer.cancel()
+        self._pool.shutdown(wait=False)
+
+
+def parse_forecast_response(response):
+    # Process current weather data
+    current = response.Current()
+    current_weather = {
+        "temperature": current.Variables(0).Value(),
+        "precipitation": current.Variables(1).Value(),
+        "wind_speed": current.Variables(2).Value()
+    }
+
+    # Process hourly data for the next 24 hours
+    hourly = response.Hourly()
+    hourly_data = {
+        "temperature": hourly.Variables(0).ValuesAsNumpy()[:24].tolist(),
+        "precipitation": hourly.Variables(1).ValuesAsNumpy()[:24].tolist(),
+        "wind_speed": hourly.Variables(2).ValuesAsNumpy()[:24].tolist()
+    }
 
-    except Exception as e:
-        return {
-            "status": "error",
-            "message": str(e)
-        }
\ No newline at end of file
+    # Process daily data
+    daily = response.Daily()
+    days = daily.Variables(0).ValuesAsNumpy().size
+    start = datetime.fromtimestamp(daily.Time() + response.UtcOffsetSeconds(), timezone.utc).date()
+    daily_data = {
+        "date": [(start + timedelta(seconds=daily.Interval() * day)).isoformat() for day in range(days)],
+        "precipitation_sum": daily.Variables(0).ValuesAsNumpy().tolist(),
+        "precipitation_probability": daily.Variables(1).ValuesAsNumpy().tolist(),
+        "temperature_mean": daily.Variables(2).ValuesAsNumpy().tolist()
+    }
+
+    return {
+        "status": "success",
+        "current": current_weather,
+        "hourly": hourly_data,
+        "daily": daily_data
+    }
+
+
+def parse_forecast_responses(responses):
+    """Parses responses and scores the weather risk of all their locations in one pass over the full horizon.
+
+    The parsed forecasts keep only the next 24 hours, but the risk indicators
+    are computed from every hourly and daily value Open-Meteo returned.
+    """
+    forecasts = [parse_forecast_response(response) for response in responses]
+    with span("weather_risk"):
+        hourly = [response.Hourly() for response in responses]
+        daily = [response.Daily() for response in responses]
+        table = assess(
+            [series.Variables(1).ValuesAsNumpy() for series in hourly],
+            [series.Variables(2).ValuesAsNumpy() for series in hourly],
+            [series.Variables(0).ValuesAsNumpy() for series in daily],
+            [series.Variables(1).ValuesAsNumpy() for series in daily]
+        )
+    for forecast, risk in zip(forecasts, table.records()):
+        forecast["risk"] = risk
+    return forecasts
+
+
+_weather_service = None
+_weather_service_lock = threading.Lock()
+
+
+def get_weather_service():
+    """Returns the process-wide WeatherService, creating it on first use."""
+    global _weather_service
+    if _weather_service is None:
+        with _weather_service_lock:
+            if _weather_service is None:
+                _weather_service = WeatherService()
+    return _weather_service
+
+
+def get_weather_forecast():
+    return get_weather_service().get_forecast()
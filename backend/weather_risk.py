@@ -0,0 +1,166 @@
+"""Numeric weather risk for many locations in one NumPy pass.
+
+Forecast series are stacked into (locations x hours) and (locations x days)
+arrays, padded with NaN. Every indicator is computed with array operations
+over all locations at once: rolling precipitation windows, hours of strong
+wind over the next 24 hours and rain probability. The indicators are combined into rain and wind
+scores, where 1.0 means severe. Those give a risk level, the label used in
+replies and the price multiplier, so the price adjustment and the alerts read
+the same numbers: normal weather leaves the price alone, moderate raises it by
+at most 5% and severe by 15%.
+"""
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+# A score of 1.0 is reached at each of these
+RAIN_MEAN_SEVERE_MM_H = 10.0  # mean hourly rain over the next 24 hours
+RAIN_6H_SEVERE_MM = 60.0
+RAIN_3DAY_SEVERE_MM = 200.0
+WIND_CALM_KMH = 15.0  # wind score is 0 up to this speed...
+WIND_SEVERE_KMH = 30.0  # ...and 1 from this one
+STORM_WIND_KMH = 62.0  # PAGASA tropical storm force
+STORM_HOURS_SEVERE = 6.0
+HOURS_AHEAD = 24
+PROBABILITY_DAYS = 3
+
+LEVELS = ["normal", "moderate", "severe"]
+MODERATE_SCORE = 0.5
+# Score range of each level, and the price multiplier at its bottom and top
+LEVEL_SCORES = np.array([[0.0, MODERATE_SCORE], [MODERATE_SCORE, 1.0], [1.0, 1.0]])
+LEVEL_MULTIPLIERS = np.array([[1.0, 1.0], [1.02, 1.05], [1.15, 1.15]])
+
+SEVERE_LABEL = "Severe weather conditions detected - possible typhoon threat"
+RAIN_LABEL = "Moderate rain expected - minor market impact"
+WIND_LABEL = "Strong winds expected - minor market impact"
+NORMAL_LABEL = "Normal weather conditions"
+
+
+def stack(series: Sequence[Sequence[float]]) -> np.ndarray:
+    """Series of different lengths as one float array, padded with NaN."""
+    width = max((len(values) for values in series), default=0)
+    stacked = np.full((len(series), width), np.nan)
+    for row, values in enumerate(series):
+        stacked[row, :len(values)] = values
+    return stacked
+
+
+def _rolling_max_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Largest total over any ``window`` consecutive columns, per row; shorter rows are summed whole."""
+    cumulative = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(np.nan_to_num(values), axis=1, out=cumulative[:, 1:])
+    if values.shape[1] <= window:
+        return cumulative[:, -1]
+    return (cumulative[:, window:] - cumulative[:, :-window]).max(axis=1)
+
+
+def _nan_reduce(reduce, values: np.ndarray, empty: float = 0.0) -> np.ndarray:
+    """Row-wise nanmax/nanmean that returns ``empty`` for rows without any value instead of warning."""
+    present = ~np.isnan(values)
+    result = np.full(values.shape[0], empty)
+    rows = present.any(axis=1)
+    if rows.any():
+        result[rows] = reduce(values[rows], axis=1)
+    return result
+
+
+def _level_multiplier(level: np.ndarray, score: np.ndarray) -> np.ndarray:
+    """Price multiplier interpolated over the score within each location's level band."""
+    low, high = LEVEL_SCORES[level].T
+    bottom, top = LEVEL_MULTIPLIERS[level].T
+    width = high - low
+    fraction = np.divide(score - low, width, out=np.zeros_like(score), where=width > 0).clip(0.0, 1.0)
+    return bottom + (top - bottom) * fraction
+
+
+class RiskTable:
+    """Indicators, scores and levels for a batch of locations, as arrays indexed by location."""
+
+    INDICATORS = [
+        "precipitation_mean_mm_h", "rain_3h_max_mm", "rain_6h_max_mm", "rain_24h_max_mm", "rain_3day_max_mm",
+        "rain_probability_max", "wind_max_kmh", "strong_wind_hours", "storm_wind_hours"
+    ]
+
+    def __init__(
+        self,
+        hourly_precipitation: np.ndarray,
+        hourly_wind: np.ndarray,
+        daily_precipitation: np.ndarray,
+        daily_probability: np.ndarray
+    ):
+        ahead = slice(0, HOURS_AHEAD)
+        self.precipitation_mean_mm_h = _nan_reduce(np.nanmean, hourly_precipitation[:, ahead])
+        self.rain_3h_max_mm = _rolling_max_sum(hourly_precipitation, 3)
+        self.rain_6h_max_mm = _rolling_max_sum(hourly_precipitation, 6)
+        self.rain_24h_max_mm = _rolling_max_sum(hourly_precipitation, 24)
+        self.rain_3day_max_mm = _rolling_max_sum(daily_precipitation, 3)
+        # Unknown probability counts as certain rain rather than hiding a heavy forecast
+        self.rain_probability_max = _nan_reduce(np.nanmax, daily_probability[:, :PROBABILITY_DAYS], empty=100.0)
+        self.wind_max_kmh = _nan_reduce(np.nanmax, hourly_wind[:, ahead])
+        self.strong_wind_hours = (hourly_wind[:, ahead] > WIND_SEVERE_KMH).sum(axis=1)
+        self.storm_wind_hours = (hourly_wind[:, ahead] >= STORM_WIND_KMH).sum(axis=1)
+
+        self.rain_score = np.maximum.reduce([
+            self.precipitation_mean_mm_h / RAIN_MEAN_SEVERE_MM_H,
+            self.rain_6h_max_mm / RAIN_6H_SEVERE_MM,
+            self.rain_3day_max_mm / RAIN_3DAY_SEVERE_MM * self.rain_probability_max / 100.0
+        ])
+        self.wind_score = np.maximum(
+            (self.wind_max_kmh - WIND_CALM_KMH) / (WIND_SEVERE_KMH - WIND_CALM_KMH),
+            self.storm_wind_hours / STORM_HOURS_SEVERE
+        ).clip(min=0.0)
+        worst = np.maximum(self.rain_score, self.wind_score)
+        self.score = worst.clip(max=1.0)
+        self.level = (worst >= MODERATE_SCORE).astype(np.int8) + (worst >= 1.0)
+        self.multiplier = _level_multiplier(self.level, self.score)
+
+    def __len__(self) -> int:
+        return len(self.score)
+
+    def label(self, index: int) -> str:
+        level = self.level[index]
+        if level == 2:
+            return SEVERE_LABEL
+        if level == 1:
+            return RAIN_LABEL if self.rain_score[index] >= self.wind_score[index] else WIND_LABEL
+        return NORMAL_LABEL
+
+    def records(self) -> List[Dict[str, Any]]:
+        """One JSON-ready dict per location."""
+        indicators = {name: np.round(getattr(self, name).astype(np.float64), 2).tolist() for name in self.INDICATORS}
+        scores = {
+            "score": np.round(self.score, 3).tolist(),
+            "rain_score": np.round(self.rain_score, 3).tolist(),
+            "wind_score": np.round(self.wind_score, 3).tolist(),
+            "multiplier": np.round(self.multiplier, 4).tolist()
+        }
+        return [
+            {
+                "level": LEVELS[self.level[i]],
+                "label": self.label(i),
+                **{name: values[i] for name, values in scores.items()},
+                "indicators": {name: values[i] for name, values in indicators.items()}
+            }
+            for i in range(len(self))
+        ]
+
+
+def assess(
+    hourly_precipitation: Sequence[Sequence[float]],
+    hourly_wind: Sequence[Sequence[float]],
+    daily_precipitation: Sequence[Sequence[float]],
+    daily_probability: Sequence[Sequence[float]]
+) -> RiskTable:
+    """Scores every location; each argument holds one series per location (mm, km/h, mm and %)."""
+    return RiskTable(stack(hourly_precipitation), stack(hourly_wind), stack(daily_precipitation), stack(daily_probability))
+
+
+def assess_forecasts(forecasts: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Risk records for parsed forecasts (see weather.parse_forecast_response)."""
+    table = assess(
+        [forecast["hourly"]["precipitation"] for forecast in forecasts],
+        [forecast["hourly"]["wind_speed"] for forecast in forecasts],
+        [forecast["daily"]["precipitation_sum"] for forecast in forecasts],
+        [forecast["daily"].get("precipitation_probability", []) for forecast in forecasts]
+    )
+    return table.records()
@@ -9,17 +9,77 @@ import { Textarea } from "@/components/ui/textarea"
 import { Card } from "@/components/ui/card"
 import axios from "axios"
 
+export interface StreamEvent {
+  type: "price" | "token" | "done"
+  message?: string
+  content?: string
+  follow_up?: string
+  session_id?: string
+}
+
 interface ChatInputProps {
   onSendMessage: (message: string) => void
   onApiResponse?: (data: any) => void
+  onStreamEvent?: (event: StreamEvent) => void
 }
 
-export function ChatInput({ onSendMessage, onApiResponse }: ChatInputProps) {
+export function ChatInput({ onSendMessage, onApiResponse, onStreamEvent }: ChatInputProps) {
   const [message, setMessage] = useState("");
   const [lastCrop, setLastCrop] = useState("");
   const [lastRegion, setLastRegion] = useState("");
+  // Lets the server reuse the previous turn's prediction and buyers
+  const [sessionId, setSessionId] = useState("");
   const textareaRef = useRef<HTMLTextAreaElement>(null)
 
+  // Reads the NDJSON stream so the price shows up before the summary is done
+  const streamLiveModel = async (crop: string, splitRegion: string) => {
+    const session = sessionId ? `&session_id=${sessionId}` : "";
+    if (!onStreamEvent) {
+      const response = await axios.post(
+        `http://localhost:8000/live-model-test?crop=${crop}&region=${splitRegion}${session}`
+      );
+
+      if (response.data?.session_id) {
+        setSessionId(response.data.session_id);
+      }
+      if (onApiResponse && response.data) {
+        onApiResponse(response.data);
+      }
+      return;
+    }
+
+    const response = await fetch(
+      `http://localhost:8000/live-model-test/stream?crop=${crop}&region=${splitRegion}${session}`,
+      { method: "POST" }
+    );
+    if (!response.ok || !response.body) {
+      throw new Error(`Stream request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split("\n");
+      buffer = lines.pop() ?? "";
+
+      for (const line of lines) {
+        if (line.trim()) {
+          const event: StreamEvent = JSON.parse(line);
+          if (event.session_id) {
+            setSessionId(event.session_id);
+          }
+          onStreamEvent(event);
+        }
+      }
+    }
+  }
+
   const handleSend = async () => {
     if (message.trim()) {
       onSendMessage(message.trim())
@@ -34,7 +94,7 @@ export function ChatInput({ onSendMessage, onApiResponse }: ChatInputProps) {
       if (trimmedMessage === "OO" || trimmedMessage === "HINDI") {
         try {
           const response = await axios.post(
-            `http://localhost:8000/confirm-sell?response=${trimmedMessage}&crop=${lastCrop}&region=${lastRegion}`
+            `http://localhost:8000/confirm-sell?response=${trimmedMessage}&crop=${lastCrop}&region=${lastRegion}${sessionId ? `&session_id=${sessionId}` : ""}`
           );
           
           if (onApiResponse && response.data) {
@@ -65,13 +125,7 @@ export function ChatInput({ onSendMessage, onApiResponse }: ChatInputProps) {
         let splitRegion = region.split(" ").join("%20");
         
         try {
-          const response = await axios.post(
-            `http://localhost:8000/live-model-test?crop=${crop}&region=${splitRegion}`
-          );
-          
-          if (onApiResponse && response.data) {
-            onApiResponse(response.data);
-          }
+          await streamLiveModel(crop, splitRegion);
         } catch (error) {
           console.error("API call failed:", error);
           if (onApiResponse) {
@@ -90,13 +144,7 @@ export function ChatInput({ onSendMessage, onApiResponse }: ChatInputProps) {
           if (splitRegion) {
             setLastCrop(crop);
             
-            const response = await axios.post(
-              `http://localhost:8000/live-model-test?crop=${crop}&region=${splitRegion}`
-            );
-            
-            if (onApiResponse && response.data) {
-              onApiResponse(response.data);
-            }
+            await streamLiveModel(crop, splitRegion);
           } else {
             if (onApiResponse) {
               onApiResponse({
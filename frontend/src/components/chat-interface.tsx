@@ -3,7 +3,7 @@
 import { useState, useRef, useEffect } from "react"
 import { ScrollArea } from "@/components/ui/scroll-area"
 import { ChatBubble } from "@/components/chat-bubble"
-import { ChatInput } from "./chat-input"
+import { ChatInput, type StreamEvent } from "./chat-input"
 
 interface Message {
   id: number
@@ -54,6 +54,8 @@ export function ChatInterface() {
   const [messages, setMessages] = useState<Message[]>(initialMessages)
   const [isTyping, setIsTyping] = useState(false)
   const scrollAreaRef = useRef<HTMLDivElement>(null)
+  // Id of the bot message the current stream's price event created; summary tokens go only there
+  const streamMessageId = useRef<number | null>(null)
 
   const scrollToBottom = () => {
     if (scrollAreaRef.current) {
@@ -76,7 +78,11 @@ export function ChatInterface() {
       timestamp: new Date(),
     }
 
-    setMessages((prev) => [...prev, userMessage])
+    setMessages((prev) => {
+      // Updaters run in order at render time, so tokens of the previous stream still find their message
+      streamMessageId.current = null
+      return [...prev, userMessage]
+    })
     setIsTyping(true)
   }
 
@@ -109,6 +115,33 @@ export function ChatInterface() {
     }
   }
 
+  const handleStreamEvent = (event: StreamEvent) => {
+    if (event.type === "price" && event.message) {
+      setIsTyping(false)
+      setMessages((prev) => {
+        const id = prev.length + 1
+        streamMessageId.current = id
+        return [...prev, { id, content: event.message ?? "", sender: "bot", timestamp: new Date() }]
+      })
+    } else if (event.type === "token" && event.content) {
+      // Append summary tokens to the price message as they arrive; without one there is nothing to extend.
+      // The id is read inside the updater, after the price event's updater has recorded it
+      setMessages((prev) => {
+        const id = streamMessageId.current
+        if (id === null) return prev
+        return prev.map((message) => (message.id === id ? { ...message, content: message.content + event.content } : message))
+      })
+    } else if (event.type === "done") {
+      setIsTyping(false)
+      if (event.follow_up) {
+        setMessages((prev) => [
+          ...prev,
+          { id: prev.length + 1, content: event.follow_up ?? "", sender: "bot", timestamp: new Date() },
+        ])
+      }
+    }
+  }
+
   return (
     <div className="flex flex-col h-full">
       <ScrollArea ref={scrollAreaRef} className="flex-1 p-4">
@@ -135,6 +168,7 @@ export function ChatInterface() {
           <ChatInput 
             onSendMessage={handleSendMessage}
             onApiResponse={handleApiResponse}
+            onStreamEvent={handleStreamEvent}
           />
         </div>
       </div>